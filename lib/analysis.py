@@ -0,0 +1,305 @@
+"""Batch analysis of PGN files: every position of every game is searched by the engine, and the games are written back
+out as PGN with an evaluation comment after each move and blunders, mistakes and dubious moves marked with NAGs.
+
+Games are read a batch at a time and the positions of a batch are shared out between a pool of processes. Scores are
+cached by position, so positions that come up again, such as common openings, are only searched once, and the cache
+is kept in a file next to the output so later runs can reuse it. After each batch a checkpoint records how many games
+have been written, and a run that is stopped part way carries on from the last checkpoint when it is started again.
+
+Run from the project folder, e.g.
+    python -m lib.analysis games.pgn annotated.pgn
+    python -m lib.analysis games.pgn annotated.pgn --depth 4 --workers 8 --syzygy lib/syzygy
+    python -m lib.analysis games.pgn annotated.pgn --restart
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from lib.game import *
+from lib.engine import Engine
+from lib.tablebase import open_tablebase
+
+ANALYSIS_CACHE_SUFFIX = ".cache"
+ANALYSIS_CHECKPOINT_SUFFIX = ".checkpoint.json"
+
+analysis_engine = None  # The Engine of a worker process, made by start_analysis_worker
+
+
+def start_analysis_worker(hash_mb=ENGINE_DEFAULT_HASH_MB, tablebase_location=None):
+    """Makes the engine that analyse_position searches with. Run once in each worker process"""
+    global analysis_engine
+    tablebase = open_tablebase(tablebase_location) if tablebase_location is not None else None
+    analysis_engine = Engine(hash_mb, tablebase=tablebase)
+
+
+def analyse_position(fen, depth):
+    """Searches a position to a fixed depth. Returns its score from the point of view of the side to move and the best
+    move packed by encode_move (None if there are no legal moves). Module level so it can run in a worker process"""
+    if analysis_engine is None:
+        start_analysis_worker()
+    board = Board()
+    board.load_fen(fen)
+    result = analysis_engine.search(board, depth=depth)
+    return result.score, encode_move(result.bestMove) if result.bestMove is not None else None
+
+
+def position_key(fen):
+    """The part of a FEN that the analysis of a position depends on: everything but the move clocks. The fifty-move
+    rule can change a score too, so from ANALYSIS_CLOCK_KEY_FROM half moves on, the half-move clock is kept as well.
+    Below that, the rule can only come into a search more than 100 - ANALYSIS_CLOCK_KEY_FROM plies deep, which is
+    much deeper than analysis goes"""
+    fields = fen.split(" ")
+    if int(fields[4]) >= ANALYSIS_CLOCK_KEY_FROM:
+        return " ".join(fields[:5])
+    return " ".join(fields[:4])
+
+
+class AnalysisCache:
+    """The score and best move of each position analysed, by position_key. If a location is given, earlier entries are
+    read from that file and new ones are appended to it, one line of tab separated key, depth, score and best move (-1
+    for none) per position. An entry is only used for searches to the depth it was made with or less"""
+    def __init__(self, location=None):
+        self.entries = {}
+        self.file = None
+        if location is None:
+            return
+        if os.path.exists(location):
+            with open(location, "rb") as cache:
+                data = cache.read()
+            # A run that was stopped part way may have left half a line at the end, which is dropped
+            complete = data.rfind(b"\n") + 1
+            if complete < len(data):
+                os.truncate(location, complete)
+            for line in data[:complete].decode("ascii").splitlines():
+                key, depth, score, move = line.split("\t")
+                self.add(key, int(depth), int(score), int(move) if move != "-1" else None, save=False)
+        self.file = open(location, "at")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, depth):
+        """Returns the (score, best move) of a position searched to at least depth, or None"""
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < depth:
+            return None
+        return entry[1:]
+
+    def add(self, key, depth, score, move, save=True):
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] >= depth:
+            return
+        self.entries[key] = (depth, score, move)
+        if save and self.file is not None:
+            self.file.write("%s\t%d\t%d\t%d\n" % (key, depth, score, move if move is not None else -1))
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def capped_score(score):
+    return max(-ANALYSIS_SCORE_CAP, min(score, ANALYSIS_SCORE_CAP))
+
+
+def eval_text(score):
+    """Formats a score from White's point of view for an [%eval] comment, in pawns, or as e.g. #3 / #-2 for a forced
+    mate in that many moves"""
+    if abs(score) >= ENGINE_MATE_SCORE - ENGINE_MAX_PLY:
+        moves_to_mate = (ENGINE_MATE_SCORE - abs(score) + 1) // 2
+        return "#" + ("" if score > 0 else "-") + str(moves_to_mate)
+    return "%.2f" % (score / 100)
+
+
+def move_nag(score_lost):
+    """The NAG for a move that lost the side that played it score_lost centipawns, or None"""
+    for threshold, nag in ANALYSIS_NAG_THRESHOLDS:
+        if score_lost >= threshold:
+            return nag
+    return None
+
+
+def annotate_game(game, fens, analyses):
+    """Sets the NAGs and comment of each of a game's moves from the (score, best move) of every position of the game,
+    one more than there are moves. Each move gets the evaluation of the position it leads to, and a move that lost
+    enough of its side's score, and wasn't the engine's choice, gets a NAG and a comment naming the move it preferred"""
+    for ply, record in enumerate(game.moveRecords):
+        score_before, best_move = analyses[ply]
+        score_after = analyses[ply + 1][0]
+        record.nags = []
+        record.comment = None
+        if abs(score_after) != ENGINE_MATE_SCORE:  # Not the end of the game
+            white_score = -score_after if record.colour == WHITE else score_after
+            record.comment = "[%eval " + eval_text(white_score) + "]"
+        if best_move is None or decode_move(best_move) == (record.start, record.end, record.promotion):
+            continue
+        nag = move_nag(capped_score(score_before) + capped_score(score_after))
+        if nag is not None:
+            record.nags.append(nag)
+            best_san = lan_to_san(fens[ply], *decode_move(best_move))
+            record.comment = (record.comment + " " if record.comment else "") + best_san + " was best"
+
+
+class AnalysisProgress:
+    """Counts the games and positions analysed and prints the rate every ANALYSIS_REPORT_INTERVAL seconds"""
+    def __init__(self, report=print):
+        self.report = report
+        self.startTime = time.perf_counter()
+        self.lastReport = self.startTime
+        self.games = 0
+        self.failed = 0
+        self.searched = 0  # Positions searched by the engine
+        self.cached = 0  # Positions whose analysis was already in the cache
+
+    @property
+    def positions(self):
+        return self.searched + self.cached
+
+    def positions_per_second(self):
+        elapsed = time.perf_counter() - self.startTime
+        return self.positions / elapsed if elapsed > 0 else 0
+
+    def update(self, force=False):
+        now = time.perf_counter()
+        if self.report is not None and (force or now - self.lastReport >= ANALYSIS_REPORT_INTERVAL):
+            self.lastReport = now
+            self.report("Games: %d, positions: %d (%d searched, %d from cache), %d positions/s" % (
+                self.games, self.positions, self.searched, self.cached, self.positions_per_second()))
+
+
+def analyse_batch(games, first_game, depth, cache, analyse, progress):
+    """Analyses every position of a batch of games, numbered from first_game, and annotates them. Positions not in the
+    cache are searched once each by analyse, which maps analyse_position over a list of FENs. Returns the games that
+    could be replayed"""
+    game_fens = []
+    for game_number, game in enumerate(games, first_game):
+        try:
+            game_fens.append((game, list(game.previousBoardStates)))
+        except (InvalidMoveError, AmbiguousSAN):
+            progress.failed += 1
+            print("Skipping game %d: its moves couldn't be read" % game_number, file=sys.stderr)
+    # Each position is searched the first time it comes up, and every other time is a cache hit
+    new_positions = {}
+    for game, fens in game_fens:
+        for fen in fens:
+            key = position_key(fen)
+            if key in new_positions or cache.get(key, depth) is not None:
+                progress.cached += 1
+            else:
+                new_positions[key] = fen
+    for key, (score, move) in zip(new_positions, analyse(list(new_positions.values()), depth)):
+        cache.add(key, depth, score, move)
+        progress.searched += 1
+        progress.update()
+    for game, fens in game_fens:
+        annotate_game(game, fens, [cache.get(position_key(fen), depth) for fen in fens])
+    return [game for game, fens in game_fens]
+
+
+def load_checkpoint(location):
+    if not os.path.exists(location):
+        return None
+    with open(location, "rt") as checkpoint:
+        return json.load(checkpoint)
+
+
+def save_checkpoint(location, checkpoint):
+    with open(location + ".tmp", "wt") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(location + ".tmp", location)
+
+
+def analyse_pgn(pgn_location, output_location, depth=ANALYSIS_DEFAULT_DEPTH, workers=1, hash_mb=ENGINE_DEFAULT_HASH_MB,
+                tablebase_location=None, cache_location=None, restart=False, report=print):
+    """Analyses every game in a PGN file and writes them, annotated, to another PGN file. Searches are shared between
+    workers processes. The cache is kept at cache_location (by default the output location with
+    ANALYSIS_CACHE_SUFFIX), and the checkpoint next to the output, which is removed once every game is written. Unless
+    restart is True, a run with a checkpoint for the same PGN file and depth carries on from it. Returns an
+    AnalysisProgress with the totals"""
+    checkpoint_location = output_location + ANALYSIS_CHECKPOINT_SUFFIX
+    checkpoint = {"pgn": os.path.abspath(pgn_location), "depth": depth, "games": 0, "outputBytes": 0}
+    saved = load_checkpoint(checkpoint_location) if not restart else None
+    if saved is not None:
+        if (saved["pgn"], saved["depth"]) != (checkpoint["pgn"], checkpoint["depth"]):
+            raise ValueError(checkpoint_location + " is for a different PGN file or depth; restart to overwrite it")
+        checkpoint = saved
+        if os.path.exists(output_location):
+            os.truncate(output_location, checkpoint["outputBytes"])
+    progress = AnalysisProgress(report)
+    if checkpoint["games"] and report is not None:
+        report("Resuming after game %d" % checkpoint["games"])
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=start_analysis_worker,
+                                       initargs=(hash_mb, tablebase_location))
+
+        def analyse(fens, search_depth):
+            return executor.map(analyse_position, fens, [search_depth] * len(fens),
+                                chunksize=max(1, len(fens) // (workers * 4)))
+    else:
+        start_analysis_worker(hash_mb, tablebase_location)
+
+        def analyse(fens, search_depth):
+            return (analyse_position(fen, search_depth) for fen in fens)
+    try:
+        with AnalysisCache(cache_location or output_location + ANALYSIS_CACHE_SUFFIX) as cache, \
+                open(output_location, "at" if checkpoint["games"] else "wt") as output:
+            games = itertools.islice(read_pgn_file(pgn_location), checkpoint["games"], None)
+            while True:
+                batch = list(itertools.islice(games, ANALYSIS_GAMES_PER_CHECKPOINT))
+                if not batch:
+                    break
+                for game in analyse_batch(batch, checkpoint["games"] + 1, depth, cache, analyse, progress):
+                    if output.tell():
+                        output.write("\n")
+                    game.write_pgn(output)
+                    progress.games += 1
+                cache.flush()
+                output.flush()
+                checkpoint["games"] += len(batch)
+                checkpoint["outputBytes"] = os.fstat(output.fileno()).st_size
+                save_checkpoint(checkpoint_location, checkpoint)
+                progress.update()
+        os.remove(checkpoint_location)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    progress.update(force=True)
+    return progress
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Analyses every position of every game in a PGN file and writes the "
+                                                 "games out annotated with evaluations and marked mistakes.")
+    parser.add_argument("pgn", help="PGN file to read")
+    parser.add_argument("output", help="PGN file to write the annotated games to")
+    parser.add_argument("--depth", type=int, default=ANALYSIS_DEFAULT_DEPTH, help="plies to search each position to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="number of processes to search with (default: one per CPU)")
+    parser.add_argument("--hash", type=int, default=ENGINE_DEFAULT_HASH_MB,
+                        help="transposition table size of each process in megabytes")
+    parser.add_argument("--syzygy", default=None, help="directory of Syzygy tablebases to score endgames with")
+    parser.add_argument("--cache", default=None, help="position cache file (default: next to the output)")
+    parser.add_argument("--restart", action="store_true", help="start again instead of resuming from a checkpoint")
+    args = parser.parse_args(args)
+    progress = analyse_pgn(args.pgn, args.output, args.depth, args.workers, args.hash, args.syzygy, args.cache,
+                           args.restart)
+    return 1 if progress.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""A compact binary store for large numbers of games, with random access to any game without reading the others.
+
+Each move is a 16 bit integer: the start square (a1 = 0 ... h8 = 63) in bits 0-5, the end square in bits 6-11 and a
+code in bits 12-14 for a pawn promotion or castling. Tag names and values, and comments, are stored once each in a
+string table and referred to by number. A table of offsets at the end of the file lets game N be read straight out of a
+memory map.
+
+The NAGs and comments of the main line are kept. Variations, and NAGs and comments before the first move, are not:
+packing warns about each game that loses some.
+
+Layout (all integers little-endian):
+    header      magic, game count, string count, offset of the string offsets, offset of the game offsets
+    games       per game: tag count, result code, move count, annotated move count, (name id, value id) per tag, one
+                uint16 per move, then per annotated move: move index, NAG count, comment id, one uint16 per NAG
+    strings     per string: byte length, UTF-8 bytes
+    string offsets, game offsets    one uint64 per string / game
+
+Run from the project folder, e.g.
+    python -m lib.archive pack games.pgn games.chs --workers 8
+    python -m lib.archive unpack games.chs games.pgn
+"""
+import argparse
+import mmap
+import struct
+import sys
+from lib.pgn_import import *
+
+ARCHIVE_MAGIC = b"PYCHESS\x02"
+ARCHIVE_HEADER = struct.Struct("<8sIIQQ")
+ARCHIVE_GAME_HEADER = struct.Struct("<HBII")
+ARCHIVE_ANNOTATION = struct.Struct("<IHI")
+ARCHIVE_NO_COMMENT = 0xFFFFFFFF
+ARCHIVE_TAG = struct.Struct("<II")
+ARCHIVE_OFFSET = struct.Struct("<Q")
+ARCHIVE_STRING_LENGTH = struct.Struct("<I")
+ARCHIVE_MOVE_FORMAT = "<%dH"
+ARCHIVE_NAG_FORMAT = "<%dH"
+
+# Codes for the result of a game. Moves are packed with encode_move from lib.board.
+ARCHIVE_RESULT_CODES = {None: 0, WHITE_WIN: 1, BLACK_WIN: 2, DRAW: 3, IN_PROGRESS: 4}
+ARCHIVE_RESULTS = rev_dict(ARCHIVE_RESULT_CODES)
+
+
+class ArchiveWriter:
+    """Writes games to a new archive file one at a time. Use as a context manager, or call close when done, which is
+    when the string table and offsets are written"""
+    def __init__(self, location):
+        self.file = open(location, "wb")
+        self.file.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, 0, 0, 0, 0))
+        self.strings = {}
+        self.gameOffsets = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def string_id(self, string):
+        if string not in self.strings:
+            self.strings[string] = len(self.strings)
+        return self.strings[string]
+
+    def add_game(self, game):
+        """Adds a Game to the archive. Reading its moves replays it if it was loaded from PGN and hasn't been yet"""
+        annotations = [(index, record.nags, record.comment) for index, record in enumerate(game.moveRecords)
+                       if record.nags or record.comment]
+        self.add_moves(game.pgnTags, game.movesRaw, game.terminationMarker, annotations)
+
+    def add_moves(self, tags, moves, result=None, annotations=()):
+        """Adds a game from its tags, a list of (start, end, pawn_promotion) moves, the termination marker that
+        followed them, if there was one, and (move index, NAGs, comment or None) for each annotated move"""
+        tags = [(name, value) for name, value in tags.items() if value is not None]
+        self.gameOffsets.append(self.file.tell())
+        self.file.write(ARCHIVE_GAME_HEADER.pack(len(tags), ARCHIVE_RESULT_CODES[result], len(moves),
+                                                 len(annotations)))
+        for name, value in tags:
+            self.file.write(ARCHIVE_TAG.pack(self.string_id(name), self.string_id(value)))
+        self.file.write(struct.pack(ARCHIVE_MOVE_FORMAT % len(moves), *[encode_move(move) for move in moves]))
+        for index, nags, comment in annotations:
+            comment_id = self.string_id(comment) if comment else ARCHIVE_NO_COMMENT
+            self.file.write(ARCHIVE_ANNOTATION.pack(index, len(nags), comment_id))
+            self.file.write(struct.pack(ARCHIVE_NAG_FORMAT % len(nags), *nags))
+
+    def close(self):
+        if self.file.closed:
+            return
+        string_offsets = []
+        for string in self.strings:
+            string_offsets.append(self.file.tell())
+            data = string.encode("utf-8")
+            self.file.write(ARCHIVE_STRING_LENGTH.pack(len(data)) + data)
+        string_offsets_start = self.file.tell()
+        for offset in string_offsets:
+            self.file.write(ARCHIVE_OFFSET.pack(offset))
+        game_offsets_start = self.file.tell()
+        for offset in self.gameOffsets:
+            self.file.write(ARCHIVE_OFFSET.pack(offset))
+        self.file.seek(0)
+        self.file.write(ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, len(self.gameOffsets), len(self.strings),
+                                            string_offsets_start, game_offsets_start))
+        self.file.close()
+
+
+class GameArchive:
+    """Read access to an archive file through a memory map. Indexing gives a Game, numbered from 0 in the order they
+    were added; its moves are only made on a Board when they are first used, and their SAN only worked out when that is
+    first used, while read_tags gives just the tags"""
+    def __init__(self, location):
+        self.file = open(location, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.gameCount, self.stringCount, self.stringOffsetsStart, self.gameOffsetsStart = \
+            ARCHIVE_HEADER.unpack_from(self.map, 0)
+        if magic != ARCHIVE_MAGIC:
+            self.close()
+            raise ValueError(location + " is not a game archive")
+        self.stringCache = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.gameCount
+
+    def __iter__(self):
+        for index in range(self.gameCount):
+            yield self[index]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.gameCount
+        tags, moves, result, annotations = self.read_record(index)
+        movetext = []
+        annotations = iter(annotations)
+        annotation = next(annotations, None)
+        for move_index, move in enumerate(moves):
+            movetext.append(move)
+            if annotation is not None and annotation[0] == move_index:
+                movetext.extend(PGN_NAG + str(nag) for nag in annotation[1])
+                if annotation[2] is not None:
+                    movetext.append(PGN_OPEN_COMMENT + annotation[2] + PGN_CLOSE_COMMENT)
+                annotation = next(annotations, None)
+        if result is not None:
+            movetext.append(result)
+        game = Game()
+        game.load_pgn_record(tags, movetext)
+        return game
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def get_string(self, string_id):
+        if string_id not in self.stringCache:
+            offset = ARCHIVE_OFFSET.unpack_from(self.map, self.stringOffsetsStart + string_id * ARCHIVE_OFFSET.size)[0]
+            length = ARCHIVE_STRING_LENGTH.unpack_from(self.map, offset)[0]
+            start = offset + ARCHIVE_STRING_LENGTH.size
+            self.stringCache[string_id] = self.map[start:start + length].decode("utf-8")
+        return self.stringCache[string_id]
+
+    def game_offset(self, index):
+        if not 0 <= index < self.gameCount:
+            raise IndexError("game archive index out of range")
+        return ARCHIVE_OFFSET.unpack_from(self.map, self.gameOffsetsStart + index * ARCHIVE_OFFSET.size)[0]
+
+    def read_tags(self, index):
+        """Returns the tags of game index as a dict, without reading its moves"""
+        offset = self.game_offset(index)
+        tag_count = ARCHIVE_GAME_HEADER.unpack_from(self.map, offset)[0]
+        offset += ARCHIVE_GAME_HEADER.size
+        tags = {}
+        for tag_number in range(tag_count):
+            name_id, value_id = ARCHIVE_TAG.unpack_from(self.map, offset + tag_number * ARCHIVE_TAG.size)
+            tags[self.get_string(name_id)] = self.get_string(value_id)
+        return tags
+
+    def read_record(self, index):
+        """Returns the tags, (start, end, pawn_promotion) moves, termination marker (or None) and (move index, NAGs,
+        comment or None) for each annotated move of game index"""
+        offset = self.game_offset(index)
+        tag_count, result_code, move_count, annotation_count = ARCHIVE_GAME_HEADER.unpack_from(self.map, offset)
+        tags = self.read_tags(index)
+        offset += ARCHIVE_GAME_HEADER.size + tag_count * ARCHIVE_TAG.size
+        codes = struct.unpack_from(ARCHIVE_MOVE_FORMAT % move_count, self.map, offset)
+        offset += move_count * struct.calcsize(ARCHIVE_MOVE_FORMAT % 1)
+        annotations = []
+        for annotation_number in range(annotation_count):
+            move_index, nag_count, comment_id = ARCHIVE_ANNOTATION.unpack_from(self.map, offset)
+            offset += ARCHIVE_ANNOTATION.size
+            nags = list(struct.unpack_from(ARCHIVE_NAG_FORMAT % nag_count, self.map, offset))
+            offset += nag_count * struct.calcsize(ARCHIVE_NAG_FORMAT % 1)
+            comment = self.get_string(comment_id) if comment_id != ARCHIVE_NO_COMMENT else None
+            annotations.append((move_index, nags, comment))
+        return tags, [decode_move(code) for code in codes], ARCHIVE_RESULTS[result_code], annotations
+
+
+def pgn_to_archive(pgn_location, archive_location, workers=1, chunk_size=PGN_IMPORT_CHUNK_SIZE):
+    """Converts a PGN file to an archive, replaying the games in worker processes as import_pgn does. Games that can't
+    be replayed are left out. Returns a list of (game number, error) for them, and a list of (game number, count) for
+    the games that had variations or annotations before their first move, which the archive doesn't keep"""
+    errors = []
+    skipped = []
+    with ArchiveWriter(archive_location) as writer:
+        for game_number, game, error in import_pgn(pgn_location, workers, chunk_size):
+            if error is not None:
+                errors.append((game_number, error))
+            else:
+                writer.add_game(game)
+                if game.skippedAnnotations:
+                    skipped.append((game_number, game.skippedAnnotations))
+    return errors, skipped
+
+
+def archive_to_pgn(archive_location, pgn_location):
+    """Writes every game in an archive out to a PGN file"""
+    with GameArchive(archive_location) as archive, open(pgn_location, "wt") as pgn:
+        write_games(archive, pgn)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Converts between PGN files and game archives.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    pack = subparsers.add_parser("pack", help="convert a PGN file to an archive")
+    pack.add_argument("pgn")
+    pack.add_argument("archive")
+    pack.add_argument("--workers", type=int, default=None, help="number of processes (default: one per CPU)")
+    pack.add_argument("--chunk-size", type=int, default=PGN_IMPORT_CHUNK_SIZE,
+                      help="number of games handed to a process at a time")
+    unpack = subparsers.add_parser("unpack", help="convert an archive to a PGN file")
+    unpack.add_argument("archive")
+    unpack.add_argument("pgn")
+    args = parser.parse_args(args)
+    if args.command == "pack":
+        errors, skipped = pgn_to_archive(args.pgn, args.archive, args.workers, args.chunk_size)
+        for game_number, count in skipped:
+            print("Game " + str(game_number) + ": " + str(count) + " variations or annotations before the first move "
+                  "not kept", file=sys.stderr)
+        for game_number, error in errors:
+            print("Game " + str(game_number) + " left out: " + type(error).__name__ + " " + str(error),
+                  file=sys.stderr)
+        return 1 if errors else 0
+    archive_to_pgn(args.archive, args.pgn)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Evaluates many positions at once with NumPy. Positions are encoded into an array of piece planes, one 8x8 boolean
+plane per colour and piece type, and the material, piece-square and mobility scores of the whole batch are worked out
+with array operations. The scores are the same as lib.evaluation gives for one Board at a time.
+
+Run from the project folder, e.g.
+    python -m lib.batch_evaluation games.pgn
+    python -m lib.batch_evaluation games.pgn --check
+"""
+import argparse
+import itertools
+import sys
+import time
+import numpy
+from lib.evaluation import *
+from lib.game import read_pgn_file
+
+BATCH_COLOURS = (WHITE, BLACK)
+BATCH_PIECE_TYPES = (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING)
+# The plane of each FEN piece letter, as a lookup table by character code (-1 for anything else)
+BATCH_FEN_PLANES = numpy.full(256, -1, dtype=numpy.int32)
+for type_index, piece_type in enumerate(BATCH_PIECE_TYPES):
+    BATCH_FEN_PLANES[ord(SAN_PIECE_ALIASES[piece_type] or "P")] = type_index
+    BATCH_FEN_PLANES[ord((SAN_PIECE_ALIASES[piece_type] or "P").lower())] = len(BATCH_PIECE_TYPES) + type_index
+# Expands a FEN's piece placement into 64 characters, one per square from a8 to h1, with "." for an empty square
+BATCH_FEN_EXPANSION = str.maketrans(dict([(str(count), "." * count) for count in range(1, 9)] + [("/", "")]))
+
+BATCH_MATERIAL = numpy.array([PIECE_VALUES[piece_type] for piece_type in BATCH_PIECE_TYPES], dtype=numpy.int32)
+# Piece-square values without the material, for each colour, piece type and square (a1 = 0), negated for Black
+BATCH_PIECE_SQUARES = numpy.array([[[sign * (PIECE_SQUARE_VALUES[colour][piece_type][index] - PIECE_VALUES[piece_type])
+                                     for index in range(64)] for piece_type in BATCH_PIECE_TYPES]
+                                   for colour, sign in ((WHITE, 1), (BLACK, -1))], dtype=numpy.int32).reshape(-1)
+
+
+def encode_positions(positions):
+    """Encodes a sequence of FENs and/or Boards. Returns a (positions, 2, 6, 8, 8) boolean array of piece planes,
+    indexed by colour (BATCH_COLOURS), piece type (BATCH_PIECE_TYPES), rank and file, and a boolean array that is True
+    where White is to move"""
+    planes = numpy.zeros((len(positions), 2 * len(BATCH_PIECE_TYPES) * 64), dtype=bool)
+    white_to_move = numpy.zeros(len(positions), dtype=bool)
+    rows = []
+    columns = []
+    fen_rows = []
+    fen_squares = []
+    for row, position in enumerate(positions):
+        if isinstance(position, str):
+            fields = position.split(" ", 2)
+            fen_rows.append(row)
+            fen_squares.append(fields[0].translate(BATCH_FEN_EXPANSION))
+            white_to_move[row] = FEN_COLOUR_ALIASES[fields[1].upper()] == WHITE
+        else:
+            for colour_index, colour in enumerate(BATCH_COLOURS):
+                for type_index, piece_type in enumerate(BATCH_PIECE_TYPES):
+                    for piece in position.pieceLists[colour][piece_type]:
+                        rows.append(row)
+                        columns.append((colour_index * len(BATCH_PIECE_TYPES) + type_index) * 64 +
+                                       SQUARE_INDICES[piece.pos])
+            white_to_move[row] = position.activeColour == WHITE
+    planes[rows, columns] = True
+    if fen_rows:
+        # All the FENs' squares are looked up at once, after flipping them from a8 first to a1 first
+        characters = numpy.frombuffer("".join(fen_squares).encode("ascii"), dtype=numpy.uint8)
+        plane_indices = BATCH_FEN_PLANES[characters.reshape(-1, 8, 8)[:, ::-1].reshape(-1, 64)]
+        fen_indices, squares = numpy.nonzero(plane_indices >= 0)
+        planes[numpy.array(fen_rows)[fen_indices], plane_indices[fen_indices, squares] * 64 + squares] = True
+    return planes.reshape(len(positions), 2, len(BATCH_PIECE_TYPES), 8, 8), white_to_move
+
+
+# For each number of files a step moves right (positive) or left, the squares it can land on without wrapping round
+BATCH_FILE_MASKS = dict((file_step, numpy.uint64(sum(1 << (rank * 8 + file) for rank in range(8) for file in range(8)
+                                                     if 0 <= file - file_step < 8)))
+                        for file_step in range(-2, 3))
+
+
+def planes_to_bitboards(planes):
+    """Packs each 8x8 plane of a batch into a 64 bit integer with bit n set for square n (a1 = 0)"""
+    packed = numpy.packbits(planes.reshape(planes.shape[:-2] + (64,)), axis=-1, bitorder="little")
+    return packed.view("<u8")[..., 0]
+
+
+# The number of set bits in each byte value, for counting bits where numpy.bitwise_count (NumPy 2.0) isn't available
+BATCH_BYTE_BIT_COUNTS = numpy.array([bin(value).count("1") for value in range(256)], dtype=numpy.int32)
+
+
+def count_bits(bitboards):
+    """Returns the number of squares set in each of an array of bitboards"""
+    if hasattr(numpy, "bitwise_count"):
+        return numpy.bitwise_count(bitboards)
+    bytes_view = numpy.ascontiguousarray(bitboards).view(numpy.uint8).reshape(bitboards.shape + (8,))
+    return BATCH_BYTE_BIT_COUNTS[bytes_view].sum(axis=-1)
+
+
+def shift_bitboards(bitboards, file_step, rank_step):
+    """Moves every bitboard's squares file_step files and rank_step ranks along, dropping any that go off the board"""
+    shift = rank_step * 8 + file_step
+    if shift > 0:
+        shifted = bitboards << numpy.uint64(shift)
+    else:
+        shifted = bitboards >> numpy.uint64(-shift)
+    return shifted & BATCH_FILE_MASKS[file_step]
+
+
+def mobility_scores(planes):
+    """The mobility term for a batch of piece planes, from White's point of view. Each piece's rays are followed a
+    step at a time for the whole batch at once, with each plane packed into a 64 bit integer. As a step moves each
+    piece's ray to a different square, counting the squares reached at every step counts them per piece, as
+    mobility_score does"""
+    bitboards = planes_to_bitboards(planes)
+    own = numpy.bitwise_or.reduce(bitboards, axis=2)
+    not_own = ~own
+    empty = ~(own[:, 0] | own[:, 1])[:, numpy.newaxis]
+    scores = numpy.zeros(len(planes), dtype=numpy.int32)
+    for piece_type, (directions, slides) in MOBILITY_DIRECTIONS.items():
+        pieces = bitboards[:, :, BATCH_PIECE_TYPES.index(piece_type)]
+        if not pieces.any():
+            continue
+        counts = numpy.zeros((len(planes), 2), dtype=numpy.int32)
+        for file_step, rank_step in directions:
+            ray = shift_bitboards(pieces, file_step, rank_step)
+            counts += count_bits(ray & not_own)
+            while slides:
+                ray = shift_bitboards(ray & empty, file_step, rank_step)
+                if not ray.any():
+                    break
+                counts += count_bits(ray & not_own)
+        scores += MOBILITY_WEIGHTS[piece_type] * (counts[:, 0] - counts[:, 1])
+    return scores
+
+
+def score_planes(planes):
+    """Returns the material, piece-square and mobility scores of a batch of piece planes, each an array of centipawns
+    from White's point of view"""
+    counts = planes.sum(axis=(3, 4), dtype=numpy.int32)
+    material = counts[:, 0] @ BATCH_MATERIAL - counts[:, 1] @ BATCH_MATERIAL
+    piece_square = planes.reshape(len(planes), -1).astype(numpy.int32) @ BATCH_PIECE_SQUARES
+    return material, piece_square, mobility_scores(planes)
+
+
+def evaluate_batch(positions, mobility=True, batch_size=BATCH_EVALUATION_SIZE):
+    """Returns an array with the static score of each of an iterable of FENs and/or Boards, from the point of view of
+    the side to move. These equal evaluate_with_mobility, or evaluate if mobility is False. Positions are encoded
+    batch_size at a time, so that memory use stays bounded however many there are"""
+    positions = iter(positions)
+    scores = []
+    while True:
+        batch = list(itertools.islice(positions, batch_size))
+        if not batch:
+            break
+        planes, white_to_move = encode_positions(batch)
+        material, piece_square, mobility_term = score_planes(planes)
+        total = material + piece_square + (mobility_term if mobility else 0)
+        scores.append(numpy.where(white_to_move, total, -total))
+    return numpy.concatenate(scores) if scores else numpy.zeros(0, dtype=numpy.int32)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Evaluates every position of every game in a PGN file.")
+    parser.add_argument("pgn", help="PGN file to read")
+    parser.add_argument("--check", action="store_true",
+                        help="also evaluate each position one at a time and check the scores are the same")
+    args = parser.parse_args(args)
+    fens = []
+    for game_number, game in enumerate(read_pgn_file(args.pgn), 1):
+        try:
+            fens.extend(game.previousBoardStates)
+        except (InvalidMoveError, AmbiguousSAN):
+            print("Skipping game %d: its moves couldn't be read" % game_number)
+    start_time = time.perf_counter()
+    scores = evaluate_batch(fens)
+    elapsed = time.perf_counter() - start_time
+    print("Evaluated %d positions in %.3fs (%d positions/s)" % (len(fens), elapsed,
+                                                                 len(fens) / elapsed if elapsed > 0 else 0))
+    if args.check:
+        board = Board()
+        mismatches = 0
+        start_time = time.perf_counter()
+        for fen, score in zip(fens, scores):
+            board.load_fen(fen)
+            if evaluate_with_mobility(board) != score:
+                mismatches += 1
+                print("Mismatch: " + fen)
+        elapsed = time.perf_counter() - start_time
+        print("One at a time: %.3fs (%d positions/s), %d mismatches" % (elapsed, len(fens) / elapsed if elapsed > 0
+                                                                         else 0, mismatches))
+        return 1 if mismatches else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
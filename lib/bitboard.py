@@ -0,0 +1,422 @@
+from lib.constants import *
+
+# Squares are numbered a1 = 0, b1 = 1, ..., h8 = 63, the same order as Board.squares, and bit n of a bitboard is set
+# if square n is in the set. Python ints are unbounded, so anything that can overflow is masked with FULL_BOARD.
+FULL_BOARD = 0xFFFFFFFFFFFFFFFF
+A_FILE = 0x0101010101010101
+B_FILE = 0x0202020202020202
+H_FILE = 0x8080808080808080
+RANK_1 = 0x00000000000000FF
+RANK_8 = 0xFF00000000000000
+C2_H7_DIAGONAL = 0x0080402010080400  # Used to rotate the a-file onto the 8th rank for kindergarten file attacks
+
+BITBOARD_SQUARE_NAMES = [ALPHABET[index % BOARD_WIDTH] + str(index // BOARD_WIDTH + 1)
+                         for index in range(BOARD_WIDTH * BOARD_HEIGHT)]
+BITBOARD_SQUARE_INDICES = dict((pos, index) for index, pos in enumerate(BITBOARD_SQUARE_NAMES))
+
+PIECE_TYPES = (KING, QUEEN, ROOK, BISHOP, KNIGHT, PAWN)
+CASTLING_BITS = {WHITE: {KINGSIDE: 1, QUEENSIDE: 2}, BLACK: {KINGSIDE: 4, QUEENSIDE: 8}}
+KNIGHT_DIFFS = ((2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2), (1, 2))
+KING_DIFFS = ((1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1))
+
+
+def iter_bits(bitboard):
+    """Yields the index of each set bit in a bitboard, lowest first"""
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+
+def offset_targets(index, diffs):
+    """Returns a bitboard of the squares reached by adding each (x, y) difference to a square, ignoring those that
+    fall off the board"""
+    x, y = index % BOARD_WIDTH, index // BOARD_WIDTH
+    output = 0
+    for dx, dy in diffs:
+        if 0 <= x + dx < BOARD_WIDTH and 0 <= y + dy < BOARD_HEIGHT:
+            output |= 1 << ((y + dy) * BOARD_WIDTH + x + dx)
+    return output
+
+
+def ray_attacks(index, occupied, directions):
+    """Slow reference slider attacks: walks each direction until it leaves the board or hits a piece. Only used to
+    build the lookup tables below."""
+    x, y = index % BOARD_WIDTH, index // BOARD_WIDTH
+    output = 0
+    for dx, dy in directions:
+        new_x, new_y = x + dx, y + dy
+        while 0 <= new_x < BOARD_WIDTH and 0 <= new_y < BOARD_HEIGHT:
+            bit = 1 << (new_y * BOARD_WIDTH + new_x)
+            output |= bit
+            if occupied & bit:
+                break
+            new_x, new_y = new_x + dx, new_y + dy
+    return output
+
+
+def line_mask(index, dx, dy):
+    """Returns the full line through a square in one direction (both ways), including the square itself"""
+    return ray_attacks(index, 0, ((dx, dy), (-dx, -dy))) | (1 << index)
+
+
+KNIGHT_ATTACKS = [offset_targets(index, KNIGHT_DIFFS) for index in range(64)]
+KING_ATTACKS = [offset_targets(index, KING_DIFFS) for index in range(64)]
+PAWN_ATTACKS = {WHITE: [offset_targets(index, ((1, 1), (-1, 1))) for index in range(64)],
+                BLACK: [offset_targets(index, ((1, -1), (-1, -1))) for index in range(64)]}
+DIAGONAL_MASKS = [line_mask(index, 1, 1) for index in range(64)]
+ANTI_DIAGONAL_MASKS = [line_mask(index, 1, -1) for index in range(64)]
+
+# Kindergarten bitboards: the six inner squares of any line are gathered into a 6-bit index, which looks up the
+# attacks for that line. FIRST_RANK_ATTACKS[file][inner] is the set of attacked files on a single rank.
+FIRST_RANK_ATTACKS = [[ray_attacks(file, inner << 1, ((1, 0), (-1, 0))) for inner in range(64)]
+                      for file in range(BOARD_WIDTH)]
+FILL_UP_ATTACKS = [[attacks * A_FILE for attacks in FIRST_RANK_ATTACKS[file]] for file in range(BOARD_WIDTH)]
+A_FILE_ATTACKS = [[0] * 64 for rank in range(BOARD_HEIGHT)]
+for _rank in range(BOARD_HEIGHT):
+    for _inner in range(64):
+        _occupied = sum(1 << ((bit + 1) * BOARD_WIDTH) for bit in range(6) if _inner >> bit & 1)
+        A_FILE_ATTACKS[_rank][((_occupied * C2_H7_DIAGONAL) & FULL_BOARD) >> 58] = ray_attacks(
+            _rank * BOARD_WIDTH, _occupied, ((0, 1), (0, -1)))
+
+
+def rank_attacks(index, occupied):
+    shift = index & ~7
+    return FIRST_RANK_ATTACKS[index & 7][(occupied >> (shift + 1)) & 63] << shift
+
+
+def file_attacks(index, occupied):
+    file = index & 7
+    occupied = A_FILE & (occupied >> file)
+    return A_FILE_ATTACKS[index >> 3][((occupied * C2_H7_DIAGONAL) & FULL_BOARD) >> 58] << file
+
+
+def diagonal_attacks(index, occupied):
+    mask = DIAGONAL_MASKS[index]
+    return mask & FILL_UP_ATTACKS[index & 7][(((mask & occupied) * B_FILE) & FULL_BOARD) >> 58] & ~(1 << index)
+
+
+def anti_diagonal_attacks(index, occupied):
+    mask = ANTI_DIAGONAL_MASKS[index]
+    return mask & FILL_UP_ATTACKS[index & 7][(((mask & occupied) * B_FILE) & FULL_BOARD) >> 58] & ~(1 << index)
+
+
+def rook_attacks(index, occupied):
+    return rank_attacks(index, occupied) | file_attacks(index, occupied)
+
+
+def bishop_attacks(index, occupied):
+    return diagonal_attacks(index, occupied) | anti_diagonal_attacks(index, occupied)
+
+
+def queen_attacks(index, occupied):
+    return rook_attacks(index, occupied) | bishop_attacks(index, occupied)
+
+
+class BitboardPosition:
+    """A chess position stored as one bitboard per colour and piece type. Follows the same rules as Board (and loads the
+    same FEN) but generates moves with precomputed attack tables, so it is much faster for bulk work like validating
+    or counting positions. Positions are treated as immutable: make_move returns a new position."""
+
+    def __init__(self):
+        self.pieces = {WHITE: dict((piece_type, 0) for piece_type in PIECE_TYPES),
+                       BLACK: dict((piece_type, 0) for piece_type in PIECE_TYPES)}
+        self.occupied = {WHITE: 0, BLACK: 0}
+        self.activeColour = WHITE
+        self.castling = 0  # A combination of CASTLING_BITS
+        self.enPassantTarget = None  # The square index behind a pawn that just moved two spaces, if any
+        self.halfMoveClock = 0
+        self.moveClock = 0
+
+    @classmethod
+    def from_fen(cls, fen):
+        """Creates a position from a FEN string"""
+        position = cls()
+        fen = fen.split(" ")
+        rank_pointer = BOARD_HEIGHT - 1
+        for rank in fen[0].split("/"):
+            file_pointer = 0
+            for char in rank:
+                if char.isdigit():
+                    file_pointer += int(char)
+                else:
+                    colour = BLACK if char.islower() else WHITE
+                    position.add_piece(colour, FEN_PIECE_ALIASES[char.upper()], rank_pointer * 8 + file_pointer)
+                    file_pointer += 1
+            rank_pointer -= 1
+        position.activeColour = FEN_COLOUR_ALIASES[fen[1].upper()]
+        if fen[2] != FEN_EMPTY:
+            for char in fen[2]:
+                colour = BLACK if char.islower() else WHITE
+                position.castling |= CASTLING_BITS[colour][FEN_CASTLING_ALIASES[char.upper()]]
+        position.enPassantTarget = BITBOARD_SQUARE_INDICES.get(fen[3])
+        position.halfMoveClock = int(fen[4])
+        position.moveClock = int(fen[5])
+        return position
+
+    @classmethod
+    def from_board(cls, board):
+        """Creates a position from the current state of a Board"""
+        position = cls()
+        for index, piece in enumerate(board.squares):
+            if piece is not None:
+                position.add_piece(piece.colour, piece.type, index)
+        position.activeColour = board.activeColour
+        for colour in (WHITE, BLACK):
+            for direction in (KINGSIDE, QUEENSIDE):
+                if board.canCastle[colour][direction]:
+                    position.castling |= CASTLING_BITS[colour][direction]
+        position.enPassantTarget = BITBOARD_SQUARE_INDICES.get(board.enPassantTarget)
+        position.halfMoveClock = board.halfMoveClock
+        position.moveClock = board.moveClock
+        return position
+
+    def export_fen(self):
+        """Exports the position in the same FEN format as Board.export_fen"""
+        ranks = []
+        for rank_pointer in range(BOARD_HEIGHT - 1, -1, -1):
+            rank = ""
+            gap_counter = 0
+            for file_pointer in range(BOARD_WIDTH):
+                piece = self.piece_at(rank_pointer * 8 + file_pointer)
+                if piece is None:
+                    gap_counter += 1
+                    continue
+                if gap_counter != 0:
+                    rank += str(gap_counter)
+                    gap_counter = 0
+                char = SAN_PIECE_ALIASES[piece[1]] or "P"
+                rank += char if piece[0] == WHITE else char.lower()
+            if gap_counter != 0:
+                rank += str(gap_counter)
+            ranks.append(rank)
+        castle_availability = ""
+        for colour in (WHITE, BLACK):
+            for direction in (KINGSIDE, QUEENSIDE):
+                if self.castling & CASTLING_BITS[colour][direction]:
+                    castle_availability += direction if colour == WHITE else direction.lower()
+        en_passant = FEN_EMPTY if self.enPassantTarget is None else BITBOARD_SQUARE_NAMES[self.enPassantTarget]
+        return " ".join(("/".join(ranks), "w" if self.activeColour == WHITE else "b",
+                         castle_availability or FEN_EMPTY, en_passant, str(self.halfMoveClock), str(self.moveClock)))
+
+    def copy(self):
+        position = BitboardPosition.__new__(BitboardPosition)
+        position.pieces = {WHITE: self.pieces[WHITE].copy(), BLACK: self.pieces[BLACK].copy()}
+        position.occupied = self.occupied.copy()
+        position.activeColour = self.activeColour
+        position.castling = self.castling
+        position.enPassantTarget = self.enPassantTarget
+        position.halfMoveClock = self.halfMoveClock
+        position.moveClock = self.moveClock
+        return position
+
+    def add_piece(self, colour, piece_type, index):
+        self.pieces[colour][piece_type] |= 1 << index
+        self.occupied[colour] |= 1 << index
+
+    def remove_piece(self, colour, piece_type, index):
+        self.pieces[colour][piece_type] &= ~(1 << index)
+        self.occupied[colour] &= ~(1 << index)
+
+    def piece_at(self, index):
+        """Returns a (colour, type) tuple for the piece on a square index, or None if it is empty"""
+        for colour in (WHITE, BLACK):
+            piece_type = self.piece_type_at(index, colour)
+            if piece_type is not None:
+                return colour, piece_type
+        return None
+
+    def piece_type_at(self, index, colour):
+        """Returns the type of colour's piece on a square index, or None if colour has no piece there"""
+        bit = 1 << index
+        if not self.occupied[colour] & bit:
+            return None
+        pieces = self.pieces[colour]
+        for piece_type in PIECE_TYPES:
+            if pieces[piece_type] & bit:
+                return piece_type
+
+    def attacks_from(self, index, colour, piece_type):
+        """Returns the bitboard of squares a piece of the given type and colour attacks from a square. For pawns these
+        are just the diagonal capture squares."""
+        occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        if piece_type == KNIGHT:
+            return KNIGHT_ATTACKS[index]
+        elif piece_type == KING:
+            return KING_ATTACKS[index]
+        elif piece_type == PAWN:
+            return PAWN_ATTACKS[colour][index]
+        elif piece_type == BISHOP:
+            return bishop_attacks(index, occupied)
+        elif piece_type == ROOK:
+            return rook_attacks(index, occupied)
+        return queen_attacks(index, occupied)
+
+    def is_square_attacked(self, index, by_colour, occupied=None, captured=0):
+        """Returns True if any piece of by_colour attacks the square index. occupied and captured (a bitboard of
+        by_colour's pieces to leave out) let this be asked of the position after a move without making it"""
+        pieces = self.pieces[by_colour]
+        remaining = ~captured
+        if KNIGHT_ATTACKS[index] & pieces[KNIGHT] & remaining or KING_ATTACKS[index] & pieces[KING]:
+            return True
+        other_colour = BLACK if by_colour == WHITE else WHITE
+        if PAWN_ATTACKS[other_colour][index] & pieces[PAWN] & remaining:
+            return True
+        if occupied is None:
+            occupied = self.occupied[WHITE] | self.occupied[BLACK]
+        if rook_attacks(index, occupied) & (pieces[ROOK] | pieces[QUEEN]) & remaining:
+            return True
+        return bool(bishop_attacks(index, occupied) & (pieces[BISHOP] | pieces[QUEEN]) & remaining)
+
+    def in_check(self, colour=None):
+        """Returns True if the given colour (by default the side to move) has its king attacked"""
+        colour = self.activeColour if colour is None else colour
+        kings = self.pieces[colour][KING]
+        if not kings:
+            return False
+        return self.is_square_attacked(kings.bit_length() - 1, BLACK if colour == WHITE else WHITE)
+
+    def pseudo_targets(self, index, colour, piece_type):
+        """Returns the bitboard of squares a piece can move to by the piece movement rules, ignoring checks and
+        castling. Matches Board.gen_pseudo_valid_moves."""
+        own = self.occupied[colour]
+        if piece_type != PAWN:
+            return self.attacks_from(index, colour, piece_type) & ~own
+        enemy = self.occupied[BLACK if colour == WHITE else WHITE]
+        empty = ~(own | enemy)
+        targets = PAWN_ATTACKS[colour][index] & enemy
+        if self.enPassantTarget is not None:
+            targets |= PAWN_ATTACKS[colour][index] & (1 << self.enPassantTarget)
+        if colour == WHITE:
+            one_ahead = (1 << (index + 8)) & empty
+            if one_ahead:
+                targets |= one_ahead
+                if index >> 3 == 1:
+                    targets |= (1 << (index + 16)) & empty
+        else:
+            one_ahead = (1 << (index - 8)) & empty if index >= 8 else 0
+            if one_ahead:
+                targets |= one_ahead
+                if index >> 3 == 6:
+                    targets |= (1 << (index - 16)) & empty
+        return targets & FULL_BOARD
+
+    def pseudo_valid_moves(self, pos):
+        """Takes in a position in algebraic notation and returns the pseudo-valid end positions for the piece there, in
+        the same format as Board.gen_pseudo_valid_moves"""
+        index = BITBOARD_SQUARE_INDICES.get(pos)
+        if index is None:
+            return []
+        piece = self.piece_at(index)
+        if piece is None:
+            return []
+        return [BITBOARD_SQUARE_NAMES[end] for end in iter_bits(self.pseudo_targets(index, piece[0], piece[1]))]
+
+    def can_castle(self, direction):
+        """Checks that the side to move has the castling right, that the squares between king and rook are empty, and
+        that the king does not start in, pass through or land in check"""
+        colour = self.activeColour
+        if not self.castling & CASTLING_BITS[colour][direction]:
+            return False
+        home = 0 if colour == WHITE else 56
+        king_bit = 1 << (home + 4)
+        rook_bit = 1 << (home + (7 if direction == KINGSIDE else 0))
+        if not (self.pieces[colour][KING] & king_bit and self.pieces[colour][ROOK] & rook_bit):
+            return False
+        between = (0x60 if direction == KINGSIDE else 0x0E) << home
+        if (self.occupied[WHITE] | self.occupied[BLACK]) & between:
+            return False
+        other_colour = BLACK if colour == WHITE else WHITE
+        passing = (5, 6) if direction == KINGSIDE else (3, 2)
+        for index in (home + 4, home + passing[0], home + passing[1]):
+            if self.is_square_attacked(index, other_colour):
+                return False
+        return True
+
+    def pseudo_legal_moves(self):
+        """Generates (start, end, promotion) tuples for every pseudo-valid move of the side to move, in square indices.
+        Castling moves are included as (SAN_CASTLE_KINGSIDE, None, None) etc. and are already fully checked."""
+        colour = self.activeColour
+        last_rank = RANK_8 if colour == WHITE else RANK_1
+        for piece_type in PIECE_TYPES:
+            for start in iter_bits(self.pieces[colour][piece_type]):
+                targets = self.pseudo_targets(start, colour, piece_type)
+                if piece_type == PAWN and targets & last_rank:
+                    for end in iter_bits(targets):
+                        for promotion in VALID_PAWN_PROMOTIONS:
+                            yield start, end, promotion
+                else:
+                    for end in iter_bits(targets):
+                        yield start, end, None
+        for direction, san in ((KINGSIDE, SAN_CASTLE_KINGSIDE), (QUEENSIDE, SAN_CASTLE_QUEENSIDE)):
+            if self.can_castle(direction):
+                yield san, None, None
+
+    def make_move(self, move):
+        """Takes a (start, end, promotion) tuple in square indices, as produced by pseudo_legal_moves, and returns the
+        position after it has been played. No validity checks are made."""
+        start, end, promotion = move
+        position = self.copy()
+        colour = self.activeColour
+        other_colour = BLACK if colour == WHITE else WHITE
+        home = 0 if colour == WHITE else 56
+        position.enPassantTarget = None
+        position.activeColour = other_colour
+        if colour == BLACK:
+            position.moveClock += 1
+        if start in (SAN_CASTLE_KINGSIDE, SAN_CASTLE_QUEENSIDE):
+            rook_start, rook_end, king_end = (7, 5, 6) if start == SAN_CASTLE_KINGSIDE else (0, 3, 2)
+            position.remove_piece(colour, KING, home + 4)
+            position.add_piece(colour, KING, home + king_end)
+            position.remove_piece(colour, ROOK, home + rook_start)
+            position.add_piece(colour, ROOK, home + rook_end)
+            position.castling &= ~(CASTLING_BITS[colour][KINGSIDE] | CASTLING_BITS[colour][QUEENSIDE])
+            position.halfMoveClock += 1
+            return position
+        piece_type = self.piece_type_at(start, colour)
+        captured = self.piece_type_at(end, other_colour)
+        position.halfMoveClock = 0 if piece_type == PAWN or captured is not None else position.halfMoveClock + 1
+        if captured is not None:
+            position.remove_piece(other_colour, captured, end)
+            if captured == ROOK:
+                other_home = 56 if colour == WHITE else 0
+                if end == other_home + 7:
+                    position.castling &= ~CASTLING_BITS[other_colour][KINGSIDE]
+                elif end == other_home:
+                    position.castling &= ~CASTLING_BITS[other_colour][QUEENSIDE]
+        position.remove_piece(colour, piece_type, start)
+        position.add_piece(colour, promotion if piece_type == PAWN and promotion is not None else piece_type, end)
+        if piece_type == PAWN:
+            if end == self.enPassantTarget:
+                position.remove_piece(other_colour, PAWN, end - 8 if colour == WHITE else end + 8)
+            elif abs(end - start) == 16:
+                position.enPassantTarget = (start + end) // 2
+        elif piece_type == KING:
+            position.castling &= ~(CASTLING_BITS[colour][KINGSIDE] | CASTLING_BITS[colour][QUEENSIDE])
+        elif piece_type == ROOK:
+            if start == home + 7:
+                position.castling &= ~CASTLING_BITS[colour][KINGSIDE]
+            elif start == home:
+                position.castling &= ~CASTLING_BITS[colour][QUEENSIDE]
+        return position
+
+    def leaves_king_safe(self, move):
+        """Returns True if a pseudo-legal move that isn't castling doesn't leave the mover's king attacked. Works out
+        the squares occupied and captured after the move instead of making it"""
+        start, end = move[0], move[1]
+        colour = self.activeColour
+        other_colour = BLACK if colour == WHITE else WHITE
+        start_bit = 1 << start
+        captured = 1 << end
+        if self.pieces[colour][PAWN] & start_bit and end == self.enPassantTarget:
+            captured = 1 << (end - 8 if colour == WHITE else end + 8)
+        occupied = ((self.occupied[WHITE] | self.occupied[BLACK]) & ~start_bit & ~captured) | (1 << end)
+        kings = self.pieces[colour][KING]
+        if not kings:
+            return True
+        king = end if kings & start_bit else kings.bit_length() - 1
+        return not self.is_square_attacked(king, other_colour, occupied, captured)
+
+    def legal_moves(self):
+        """Returns a list of every legal (start, end, promotion) move for the side to move, in square indices"""
+        return [move for move in self.pseudo_legal_moves() if move[1] is None or self.leaves_king_safe(move)]
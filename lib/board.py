@@ -1,6 +1,7 @@
 from lib.constants import *
 from lib.exceptions import *
-import copy
+from lib.bitboard import BitboardPosition, BITBOARD_SQUARE_NAMES
+from lib.zobrist import *
 
 
 def algebraic_to_xy(pos):
@@ -13,6 +14,25 @@ def xy_to_algebraic(x, y):
     return ALPHABET[x - 1] + str(y)
 
 
+def pos_to_index(pos):
+    """Converts an algebraic position to its index in Board.squares (a1 = 0, b1 = 1, ..., h8 = 63). Is an error if
+    the position is off the board"""
+    try:
+        return SQUARE_INDICES[pos]
+    except KeyError:
+        raise PieceNotFound
+
+
+def index_to_pos(index):
+    """Converts an index in Board.squares back to its algebraic position"""
+    return SQUARE_NAMES[index]
+
+
+def new_piece_lists():
+    """Returns an empty set of piece lists, indexed by colour and then piece type"""
+    return {colour: {piece_type: [] for piece_type in FEN_PIECE_ALIASES.values()} for colour in (WHITE, BLACK)}
+
+
 def rev_dict(dictionary):
     """Reverses the values and keys in a dictionary"""
     return dict((v, k) for k, v in dictionary.items())
@@ -26,6 +46,85 @@ def check_valid_pos(pos):
     return False
 
 
+# Every square on the board in index order, and the reverse lookup. Off-board positions are simply not in the dict.
+SQUARE_NAMES = [xy_to_algebraic(index % BOARD_WIDTH + 1, index // BOARD_WIDTH + 1)
+                for index in range(BOARD_WIDTH * BOARD_HEIGHT)]
+SQUARE_INDICES = dict((pos, index) for index, pos in enumerate(SQUARE_NAMES))
+
+ROOK_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+KNIGHT_DIFFS = ((2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2), (1, 2))
+KING_DIFFS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+
+def offset_indices(index, diffs):
+    """Returns the square indices reached from a square index by each (x, y) difference, skipping any off the board"""
+    x, y = index % BOARD_WIDTH + 1, index // BOARD_WIDTH + 1
+    return [pos_to_index(xy_to_algebraic(x + dx, y + dy)) for dx, dy in diffs
+            if 0 < x + dx <= BOARD_WIDTH and 0 < y + dy <= BOARD_HEIGHT]
+
+
+def ray_indices(index, directions):
+    """Returns a list of rays from a square index, one per direction, each listing the square indices in order going
+    outwards until the edge of the board"""
+    rays = []
+    for dx, dy in directions:
+        ray = []
+        x, y = index % BOARD_WIDTH + 1 + dx, index // BOARD_WIDTH + 1 + dy
+        while 0 < x <= BOARD_WIDTH and 0 < y <= BOARD_HEIGHT:
+            ray.append(pos_to_index(xy_to_algebraic(x, y)))
+            x, y = x + dx, y + dy
+        rays.append(ray)
+    return rays
+
+
+# Lookup tables for attack detection, indexed by square index
+KNIGHT_NEIGHBOURS = [offset_indices(index, KNIGHT_DIFFS) for index in range(BOARD_WIDTH * BOARD_HEIGHT)]
+KING_NEIGHBOURS = [offset_indices(index, KING_DIFFS) for index in range(BOARD_WIDTH * BOARD_HEIGHT)]
+ROOK_RAYS = [ray_indices(index, ROOK_DIRECTIONS) for index in range(BOARD_WIDTH * BOARD_HEIGHT)]
+BISHOP_RAYS = [ray_indices(index, BISHOP_DIRECTIONS) for index in range(BOARD_WIDTH * BOARD_HEIGHT)]
+# The squares a pawn of the given colour captures on from each square, and the squares a pawn of the given colour
+# would have to stand on to attack each square
+PAWN_CAPTURES = {WHITE: [offset_indices(index, ((1, 1), (-1, 1))) for index in range(BOARD_WIDTH * BOARD_HEIGHT)],
+                 BLACK: [offset_indices(index, ((1, -1), (-1, -1))) for index in range(BOARD_WIDTH * BOARD_HEIGHT)]}
+PAWN_ATTACKERS = {WHITE: PAWN_CAPTURES[BLACK], BLACK: PAWN_CAPTURES[WHITE]}
+
+# Moves packed into 16 bit ints: the start square in bits 0-5, the end square in bits 6-11 and a code for a pawn
+# promotion or castling in bits 12-14. No real move packs to 0.
+MOVE_PROMOTION_CODES = {None: 0, QUEEN: 1, ROOK: 2, BISHOP: 3, KNIGHT: 4}
+MOVE_CASTLING_CODES = {SAN_CASTLE_KINGSIDE: 5, SAN_CASTLE_QUEENSIDE: 6}
+MOVE_PROMOTIONS = rev_dict(MOVE_PROMOTION_CODES)
+MOVE_CASTLES = rev_dict(MOVE_CASTLING_CODES)
+
+
+def encode_move(move):
+    """Packs a (start, end, pawn_promotion) move into an int"""
+    start, end, promotion = move
+    if start in (SAN_CASTLE_KINGSIDE, PGN_CASTLE_KINGSIDE):
+        return MOVE_CASTLING_CODES[SAN_CASTLE_KINGSIDE] << 12
+    if start in (SAN_CASTLE_QUEENSIDE, PGN_CASTLE_QUEENSIDE):
+        return MOVE_CASTLING_CODES[SAN_CASTLE_QUEENSIDE] << 12
+    return SQUARE_INDICES[start] | SQUARE_INDICES[end] << 6 | MOVE_PROMOTION_CODES[promotion] << 12
+
+
+def move_to_text(move):
+    """Formats a (start, end, pawn_promotion) move from either move generator as e.g. e2e4, e7e8q or O-O"""
+    start, end, promotion = move
+    if end is None:
+        return start
+    if not isinstance(start, str):
+        start, end = BITBOARD_SQUARE_NAMES[start], BITBOARD_SQUARE_NAMES[end]
+    return start + end + (SAN_PIECE_ALIASES[promotion].lower() if promotion is not None else "")
+
+
+def decode_move(code):
+    """Unpacks an int made by encode_move back into a (start, end, pawn_promotion) move"""
+    kind = code >> 12
+    if kind in MOVE_CASTLES:
+        return MOVE_CASTLES[kind], None, None
+    return SQUARE_NAMES[code & 63], SQUARE_NAMES[code >> 6 & 63], MOVE_PROMOTIONS[kind]
+
+
 class Piece:
     """A class holding a single piece on the board. Tracks its own type, colour and position"""
 
@@ -37,23 +136,113 @@ class Piece:
 
 
 class Board:
-    """A class representing the chess board. Keeps track of all the pieces in a list, and piece movement is handled
-    at this level. Main export format for this class is FEN (Forsyth-Edwards Notation)"""
+    """A class representing the chess board. Keeps track of the pieces in a 64-square array (see pos_to_index), as well
+    as in lists indexed by colour and type so that e.g. the king can be found without a search. Piece movement is
+    handled at this level. Main export format for this class is FEN (Forsyth-Edwards Notation). Pseudo-valid moves
+    come either from the square-by-square generator below or from a BitboardPosition, depending on moveGenerator."""
 
-    def __init__(self):
-        self.activePieces = []
+    def __init__(self, move_generator=DEFAULT_MOVE_GENERATOR):
+        self.moveGenerator = move_generator
+        self.bitboardCache = None  # BitboardPosition of the current position, rebuilt when the pieces change
+        self.legalMovesCache = None  # Result of legal_moves for the current position, cleared whenever a move is made
+        self.zobristKey = 0  # 64 bit hash of the position, kept up to date as pieces move (see zobrist_state_key)
+        self.squares = [None] * (BOARD_WIDTH * BOARD_HEIGHT)
+        self.pieceLists = new_piece_lists()
         self.capturedPieces = []
+        self.moveStack = []  # Undo information for each move made, most recent last
         self.activeColour = WHITE  # i.e. this colour is about to move
-        self.inCheck = None
+        self.inCheck = None  # Whether the side to move is in check. Kept up to date by load_fen, make_move and castle
         self.canCastle = {WHITE: {KINGSIDE: False, QUEENSIDE: False}, BLACK: {KINGSIDE: False, QUEENSIDE: False}}
         self.enPassantTarget = ""  # If a pawn has just moved two spaces, this will be set to the square "behind" it
         self.halfMoveClock = 0  # Tracks the number of half-moves since the last pawn movement or piece capture
         self.moveClock = 0
         self.result = IN_PROGRESS
 
+    @property
+    def activePieces(self):
+        """A list of all the pieces currently on the board"""
+        return [piece for colour in (WHITE, BLACK) for pieces in self.pieceLists[colour].values() for piece in pieces]
+
+    def get_pieces(self, colour, piece_type):
+        """Returns the list of pieces of the given colour and type that are on the board. Don't modify it directly,
+        use place_piece/remove_piece/relocate_piece instead"""
+        return self.pieceLists[colour][piece_type]
+
+    def get_king(self, colour):
+        """Returns the king of the given colour, or None if there isn't one on the board"""
+        kings = self.pieceLists[colour][KING]
+        return kings[0] if kings else None
+
+    def place_piece(self, piece):
+        """Puts a piece onto the board at its own position"""
+        self.bitboardCache = None
+        index = pos_to_index(piece.pos)
+        self.squares[index] = piece
+        self.pieceLists[piece.colour][piece.type].append(piece)
+        self.zobristKey ^= ZOBRIST_PIECE_KEYS[piece.colour][piece.type][index]
+
+    def remove_piece(self, piece):
+        """Takes a piece off the board"""
+        self.bitboardCache = None
+        index = pos_to_index(piece.pos)
+        self.squares[index] = None
+        self.pieceLists[piece.colour][piece.type].remove(piece)
+        self.zobristKey ^= ZOBRIST_PIECE_KEYS[piece.colour][piece.type][index]
+
+    def relocate_piece(self, piece, pos):
+        """Moves a piece to a new (empty) position, keeping its coordinates up to date"""
+        self.bitboardCache = None
+        start, end = pos_to_index(piece.pos), pos_to_index(pos)
+        self.squares[start] = None
+        piece.pos = pos
+        piece.x, piece.y = algebraic_to_xy(pos)
+        self.squares[end] = piece
+        piece_keys = ZOBRIST_PIECE_KEYS[piece.colour][piece.type]
+        self.zobristKey ^= piece_keys[start] ^ piece_keys[end]
+
+    def change_piece_type(self, piece, piece_type):
+        """Changes the type of a piece on the board (i.e. for pawn promotion)"""
+        self.bitboardCache = None
+        index = pos_to_index(piece.pos)
+        self.zobristKey ^= ZOBRIST_PIECE_KEYS[piece.colour][piece.type][index]
+        self.pieceLists[piece.colour][piece.type].remove(piece)
+        piece.type = piece_type
+        self.pieceLists[piece.colour][piece.type].append(piece)
+        self.zobristKey ^= ZOBRIST_PIECE_KEYS[piece.colour][piece.type][index]
+
+    def zobrist_state_key(self):
+        """Returns the part of zobristKey that doesn't come from the pieces: the castling rights, the side to move and
+        the en-passant file. As in Polyglot, the en-passant file only counts if a pawn of the side to move is in place
+        to capture there, so positions that only differ by an unusable en-passant target get the same key"""
+        key = ZOBRIST_WHITE_TO_MOVE_KEY if self.activeColour == WHITE else 0
+        for colour in (WHITE, BLACK):
+            for direction in (KINGSIDE, QUEENSIDE):
+                if self.canCastle[colour][direction]:
+                    key ^= ZOBRIST_CASTLING_KEYS[colour][direction]
+        en_passant_index = SQUARE_INDICES.get(self.enPassantTarget)
+        if en_passant_index is not None:
+            for index in PAWN_ATTACKERS[self.activeColour][en_passant_index]:
+                piece = self.squares[index]
+                if piece is not None and piece.type == PAWN and piece.colour == self.activeColour:
+                    key ^= ZOBRIST_EN_PASSANT_KEYS[en_passant_index % BOARD_WIDTH]
+                    break
+        return key
+
+    def get_bitboards(self):
+        """Returns a BitboardPosition for the current position. It is cached until the pieces next move, so don't
+        change enPassantTarget/canCastle by hand while using the bitboard move generator"""
+        if self.bitboardCache is None:
+            self.bitboardCache = BitboardPosition.from_board(self)
+        return self.bitboardCache
+
     def load_fen(self, fen):
         """Loads a chess board in Forsyth-Edwards notation."""
-        self.activePieces = []
+        self.bitboardCache = None
+        self.squares = [None] * (BOARD_WIDTH * BOARD_HEIGHT)
+        self.pieceLists = new_piece_lists()
+        self.moveStack = []
+        self.legalMovesCache = None
+        self.zobristKey = 0
         fen = fen.split(" ")  # Splits the FEN into its 6 fields.
         ranks = fen[0].split("/")
         rank_pointer = 8
@@ -66,7 +255,7 @@ class Board:
                     colour = WHITE
                     if char.islower():
                         colour = BLACK
-                    self.activePieces.append(
+                    self.place_piece(
                         Piece(FEN_PIECE_ALIASES[char.upper()], xy_to_algebraic(file_pointer, rank_pointer), colour))
                     file_pointer += 1
             rank_pointer -= 1
@@ -83,6 +272,8 @@ class Board:
         self.enPassantTarget = fen[3]
         self.halfMoveClock = int(fen[4])
         self.moveClock = int(fen[5])
+        self.inCheck = self.check_check(self.activeColour)
+        self.zobristKey ^= self.zobrist_state_key()
 
     def export_fen(self):
         """Exports the board's attributes in the FEN format"""
@@ -91,10 +282,8 @@ class Board:
             rank = ""
             gap_counter = 0
             for file_pointer in range(1, BOARD_WIDTH + 1):
-                pos = xy_to_algebraic(file_pointer, rank_pointer)
-                try:
-                    new = self.get_piece(pos)
-                except PieceNotFound:
+                new = self.squares[(rank_pointer - 1) * BOARD_WIDTH + file_pointer - 1]
+                if new is None:
                     gap_counter += 1
                 else:
                     if gap_counter != 0:
@@ -127,57 +316,199 @@ class Board:
 
     def get_piece(self, pos):
         """Takes in a position in algebraic position and returns the piece there. Is an error if no such piece exists"""
-        for piece in self.activePieces:
-            if piece.pos == pos:
-                return piece
-        raise PieceNotFound
+        piece = self.squares[pos_to_index(pos)]
+        if piece is None:
+            raise PieceNotFound
+        return piece
 
     def is_empty(self, pos):
         """Takes in a position in algebraic notation and returns True if it is empty and False if it isn't"""
-        try:
-            self.get_piece(pos)
-        except PieceNotFound:
-            return True
-        else:
-            return False
+        index = SQUARE_INDICES.get(pos)
+        return index is None or self.squares[index] is None
 
     def get_all_valid_from_pos(self, pos):
+        """Takes in a position in algebraic notation and returns the end positions of all the legal moves of the piece
+        there (not including castling). Is empty if the piece doesn't belong to the side to move"""
+        output = []
+        for start, end, promotion in self.legal_moves():
+            if start == pos and end not in output:
+                output.append(end)
+        return output
+
+    def legal_moves(self):
+        """Returns a list of every legal move for the side to move as (start, end, pawn_promotion) tuples, which can
+        be passed straight to make_move. Castling is included as (SAN_CASTLE_KINGSIDE, None, None) and
+        (SAN_CASTLE_QUEENSIDE, None, None), and a pawn promotion gives one tuple per VALID_PAWN_PROMOTIONS piece. The
+        list is generated in one pass by working out which pieces give check and which are pinned, and is cached
+        until the next move is made, so don't modify it."""
+        if self.legalMovesCache is None:
+            if self.moveGenerator == MOVE_GENERATOR_BITBOARD:
+                self.legalMovesCache = [(SQUARE_NAMES[start] if end is not None else start,
+                                         SQUARE_NAMES[end] if end is not None else None, promotion)
+                                        for start, end, promotion in self.get_bitboards().legal_moves()]
+            else:
+                self.legalMovesCache = self.gen_legal_moves()
+        return self.legalMovesCache
+
+    def gen_legal_moves(self):
+        """Generates the list returned by legal_moves using the square-by-square board"""
+        colour = self.activeColour
+        other_colour = BLACK if colour == WHITE else WHITE
+        squares = self.squares
+        king = self.get_king(colour)
+        if king is None:
+            return list(self.gen_all_pseudo_moves(colour))
+        king_index = pos_to_index(king.pos)
+        # Step 1: Find the pieces giving check, and the squares a non-king move can go to to deal with them.
+        # Also find our pieces that are pinned to the king, and the ray they must stay on.
+        checkers = 0
+        check_mask = None
+        pins = {}
+        for neighbours, piece_type in ((KNIGHT_NEIGHBOURS[king_index], KNIGHT),
+                                       (PAWN_ATTACKERS[other_colour][king_index], PAWN)):
+            for neighbour in neighbours:
+                piece = squares[neighbour]
+                if piece is not None and piece.type == piece_type and piece.colour == other_colour:
+                    checkers += 1
+                    check_mask = {neighbour}
+        for rays, piece_type in ((ROOK_RAYS[king_index], ROOK), (BISHOP_RAYS[king_index], BISHOP)):
+            for ray in rays:
+                blocker = None
+                for distance, ray_index in enumerate(ray):
+                    piece = squares[ray_index]
+                    if piece is None:
+                        continue
+                    if piece.colour == colour:
+                        if blocker is not None:
+                            break
+                        blocker = ray_index
+                        continue
+                    if piece.type in (piece_type, QUEEN):
+                        if blocker is None:
+                            checkers += 1
+                            check_mask = set(ray[:distance + 1])
+                        else:
+                            pins[blocker] = set(ray[:distance + 1])
+                    break
         output = []
-        pseudo = self.gen_pseudo_valid_moves(pos)
-        for move in pseudo:
-            if self.check_valid_move(pos, move, check_pseudo=False):
-                output.append(move)
-        return(output)
+        # Step 2: King moves. The king is lifted off the board while testing so it can't block attacks on itself.
+        squares[king_index] = None
+        for end_index in KING_NEIGHBOURS[king_index]:
+            piece = squares[end_index]
+            if (piece is None or piece.colour != colour) and not self.is_index_attacked(end_index, other_colour):
+                output.append((king.pos, SQUARE_NAMES[end_index], None))
+        if checkers == 0:
+            home_rank = 1 if colour == WHITE else 8
+            for direction, san, rook_file, passing_files in ((KINGSIDE, SAN_CASTLE_KINGSIDE, 8, (6, 7)),
+                                                             (QUEENSIDE, SAN_CASTLE_QUEENSIDE, 1, (4, 3))):
+                if not self.canCastle[colour][direction] or king.x != 5 or king.y != home_rank:
+                    continue
+                rook = squares[pos_to_index(xy_to_algebraic(rook_file, home_rank))]
+                if rook is None or rook.type != ROOK or rook.colour != colour:
+                    continue
+                if any(squares[pos_to_index(xy_to_algebraic(x, home_rank))] is not None
+                       for x in range(min(5, rook_file) + 1, max(5, rook_file))):
+                    continue
+                if not any(self.is_index_attacked(pos_to_index(xy_to_algebraic(x, home_rank)), other_colour)
+                           for x in passing_files):
+                    output.append((san, None, None))
+        squares[king_index] = king
+        if checkers > 1:
+            return output  # Double check, only the king can move
+        # Step 3: Everything else, restricted to the check mask and pin rays. En passant can uncover a check along
+        # the rank through both pawns, so it is just tried out on the board.
+        for start, end, promotion in self.gen_all_pseudo_moves(colour):
+            if start == king.pos:
+                continue
+            start_index, end_index = pos_to_index(start), pos_to_index(end)
+            if start_index in pins and end_index not in pins[start_index]:
+                continue
+            if end == self.enPassantTarget and squares[start_index].type == PAWN:
+                self.push(start, end)
+                in_check = self.check_check(colour)
+                self.pop()
+                if not in_check:
+                    output.append((start, end, promotion))
+                continue
+            if check_mask is not None and end_index not in check_mask:
+                continue
+            output.append((start, end, promotion))
+        return output
+
+    def gen_all_pseudo_moves(self, colour):
+        """Yields (start, end, pawn_promotion) for every pseudo-valid non-castling move of the given colour, using the
+        precomputed square tables"""
+        squares = self.squares
+        for piece_type, pieces in self.pieceLists[colour].items():
+            for piece in pieces:
+                start = pos_to_index(piece.pos)
+                if piece_type == PAWN:
+                    direction = BOARD_WIDTH if colour == WHITE else -BOARD_WIDTH
+                    promotes = piece.y == (BOARD_HEIGHT - 1 if colour == WHITE else 2)
+                    ends = [end for end in PAWN_CAPTURES[colour][start]
+                            if squares[end] is not None and squares[end].colour != colour
+                            or SQUARE_NAMES[end] == self.enPassantTarget]
+                    one_ahead = start + direction
+                    if 0 <= one_ahead < BOARD_WIDTH * BOARD_HEIGHT and squares[one_ahead] is None:
+                        ends.append(one_ahead)
+                        if piece.y == (2 if colour == WHITE else 7) and squares[one_ahead + direction] is None:
+                            ends.append(one_ahead + direction)
+                    for end in ends:
+                        if promotes:
+                            for promotion in VALID_PAWN_PROMOTIONS:
+                                yield piece.pos, SQUARE_NAMES[end], promotion
+                        else:
+                            yield piece.pos, SQUARE_NAMES[end], None
+                    continue
+                if piece_type == KNIGHT:
+                    ends = KNIGHT_NEIGHBOURS[start]
+                elif piece_type == KING:
+                    ends = KING_NEIGHBOURS[start]
+                else:
+                    ends = []
+                    rays = []
+                    if piece_type in (ROOK, QUEEN):
+                        rays += ROOK_RAYS[start]
+                    if piece_type in (BISHOP, QUEEN):
+                        rays += BISHOP_RAYS[start]
+                    for ray in rays:
+                        for end in ray:
+                            ends.append(end)
+                            if squares[end] is not None:
+                                break
+                for end in ends:
+                    if squares[end] is None or squares[end].colour != colour:
+                        yield piece.pos, SQUARE_NAMES[end], None
 
     def check_valid_move(self, start, end, check_colour=True, pawn_promotion=None, check_pseudo=True):
         """Takes in a start and end position in algebraic notation and returns True if that is a valid move,
         or False if it isn't. This function detects potential checks caused by the move and adjusts the output
         accordingly, as well as making sure promotions are valid."""
         if start in (SAN_CASTLE_KINGSIDE, SAN_CASTLE_QUEENSIDE, PGN_CASTLE_KINGSIDE, PGN_CASTLE_QUEENSIDE):
-            test_board = copy.deepcopy(self)
             direction = KINGSIDE if start in (SAN_CASTLE_KINGSIDE, PGN_CASTLE_KINGSIDE) else QUEENSIDE
-            try:
-                test_board.castle(self.activeColour, direction)
-            except InvalidMoveError:
-                return False
-            else:
-                return True
+            return self.is_valid_castle(self.activeColour, direction)
         if start == end:
             return False
-        if check_pseudo and end not in self.gen_pseudo_valid_moves(start):
+        try:
+            target = self.get_piece(start)
+        except PieceNotFound:
             return False
-        target = self.get_piece(start)
-        if target.colour != self.activeColour and check_colour:
+        if target.colour == self.activeColour:
+            return any(move[0] == start and move[1] == end for move in self.legal_moves())
+        if check_colour:
             return False
-        test_board = copy.deepcopy(self)
-        test_board.make_move(start, end, check_valid=False, pawn_promotion=pawn_promotion)
-        if test_board.check_check(target.colour):
+        if check_pseudo and end not in self.gen_pseudo_valid_moves(start):
             return False
-        return True
+        self.push(start, end, pawn_promotion=pawn_promotion)
+        in_check = self.check_check(target.colour)
+        self.pop()
+        return not in_check
 
     def gen_pseudo_valid_moves(self, start):
         """Generates pseudo-valid moves from a given position, i.e. those set out by the piece movement rules
         but ignoring potential checks caused. Must be validated by check_valid_move later."""
+        if self.moveGenerator == MOVE_GENERATOR_BITBOARD:
+            return self.get_bitboards().pseudo_valid_moves(start)
         try:
             target = self.get_piece(start)
         except PieceNotFound:
@@ -246,25 +577,46 @@ class Board:
                 output_checked.append(i)
         return output_checked
 
+    def is_square_attacked(self, square, by_colour):
+        """Takes in a position in algebraic notation and a colour, and returns True if any piece of that colour attacks
+        the square. Works backwards from the square, along the rays and knight/king/pawn offsets, instead of
+        generating the attacking side's moves"""
+        if self.moveGenerator == MOVE_GENERATOR_BITBOARD:
+            return self.get_bitboards().is_square_attacked(pos_to_index(square), by_colour)
+        return self.is_index_attacked(pos_to_index(square), by_colour)
+
+    def is_index_attacked(self, index, by_colour):
+        """The same as is_square_attacked, but takes a square index and always reads the squares array directly"""
+        squares = self.squares
+        for neighbours, piece_type in ((KNIGHT_NEIGHBOURS[index], KNIGHT), (PAWN_ATTACKERS[by_colour][index], PAWN),
+                                       (KING_NEIGHBOURS[index], KING)):
+            for neighbour in neighbours:
+                piece = squares[neighbour]
+                if piece is not None and piece.type == piece_type and piece.colour == by_colour:
+                    return True
+        for rays, piece_type in ((ROOK_RAYS[index], ROOK), (BISHOP_RAYS[index], BISHOP)):
+            for ray in rays:
+                for ray_index in ray:
+                    piece = squares[ray_index]
+                    if piece is not None:
+                        if piece.colour == by_colour and piece.type in (piece_type, QUEEN):
+                            return True
+                        break
+        return False
+
     def check_check(self, colour):
-        """Takes in either BLACK or WHITE and returns True if that colour is in check, else False"""
-        target_king = None
-        for piece in self.activePieces:
-            if piece.type == KING and piece.colour == colour:
-                target_king = piece
+        """Takes in either BLACK or WHITE and returns True if that colour is in check, else False. For the side to move
+        this is already known as inCheck"""
+        target_king = self.get_king(colour)
         if target_king is None:
             return False
-        for attacker in self.activePieces:
-            if attacker.colour != colour:
-                if target_king.pos in self.gen_pseudo_valid_moves(attacker.pos):
-                    return True
-        return False
+        return self.is_square_attacked(target_king.pos, BLACK if colour == WHITE else WHITE)
 
     def make_move(self, start, end, check_valid=True, pawn_promotion=None):
         """Takes a start and end position and actually makes the move. If check_valid is true, appropriate checks
         are made before the move is carried out, though setting it to False can save CPU time. If a pawn promotion
         occurs, this is handled here. Board information such as the move clock and en-passant status is updated as
-        well"""
+        well. Everything needed to undo the move is recorded on moveStack (see pop)"""
         if start in (SAN_CASTLE_KINGSIDE, PGN_CASTLE_KINGSIDE):
             self.castle(self.activeColour, KINGSIDE, check_valid=check_valid)
         elif start in (SAN_CASTLE_QUEENSIDE, PGN_CASTLE_QUEENSIDE):
@@ -276,56 +628,60 @@ class Board:
                 if check_valid:
                     raise InvalidMoveError
                 return
+            direction = 1 if target.colour == WHITE else -1
+            end_x, end_y = algebraic_to_xy(end)
+            promotion = target.type == PAWN and end_y == (8 if target.colour == WHITE else 1)
             if check_valid:
                 if not self.check_valid_move(start, end, pawn_promotion=pawn_promotion):
                     raise InvalidMoveError
-            try:
-                end_piece = self.get_piece(end)
-            except PieceNotFound:
+                if promotion and pawn_promotion not in VALID_PAWN_PROMOTIONS:
+                    raise InvalidMoveError
+            end_piece = self.squares[pos_to_index(end)]
+            if end_piece is None and end == self.enPassantTarget and target.type == PAWN:
+                end_piece = self.squares[pos_to_index(xy_to_algebraic(end_x, end_y - direction))]
+                if end_piece is None and check_valid:
+                    raise InvalidMoveError
+            self.record_undo([(target, start)], end_piece)
+            self.zobristKey ^= self.zobrist_state_key()
+            if end_piece is None:
                 if target.type != PAWN:
                     self.halfMoveClock += 1
                 else:
                     self.halfMoveClock = 0
             else:
                 self.capturedPieces.append(end_piece)
-                self.activePieces.remove(end_piece)
+                self.remove_piece(end_piece)
                 self.halfMoveClock = 0
-            target.pos = end
-            target.x, target.y = algebraic_to_xy(end)
-            if end == self.enPassantTarget and target.type == PAWN:
-                direction = 1 if target.colour == WHITE else -1
-                ep_capture_pos = xy_to_algebraic(target.x, target.y - direction)
-                try:
-                    ep_capture_piece = self.get_piece(ep_capture_pos)
-                except PieceNotFound:
-                    if check_valid:
-                        raise InvalidMoveError
-                else:
-                    self.capturedPieces.append(ep_capture_piece)
-                    self.activePieces.remove(ep_capture_piece)
+                if end_piece.type == ROOK and end_piece.y == (1 if end_piece.colour == WHITE else 8):
+                    # Capturing a rook on its starting square takes away that side's castling right
+                    if end_piece.x == 8:
+                        self.canCastle[end_piece.colour][KINGSIDE] = False
+                    elif end_piece.x == 1:
+                        self.canCastle[end_piece.colour][QUEENSIDE] = False
+            self.relocate_piece(target, end)
             self.enPassantTarget = FEN_EMPTY
             if target.type == PAWN:
-                if (target.y == 8 and target.colour == WHITE) or (target.y == 1 and target.colour == BLACK):
+                if promotion:
                     if pawn_promotion in VALID_PAWN_PROMOTIONS:
-                        target.type = pawn_promotion
-                    else:
-                        if check_valid:
-                            raise InvalidMoveError
+                        self.change_piece_type(target, pawn_promotion)
                 else:
-                    direction = 1 if target.colour == WHITE else -1
                     starty = algebraic_to_xy(start)[1]
                     if target.y - starty == direction * 2:
                         self.enPassantTarget = xy_to_algebraic(target.x, target.y - direction)
             elif target.type == KING:
                 self.canCastle[target.colour] = {KINGSIDE: False, QUEENSIDE: False}
             elif target.type == ROOK:
-                if target.x == 8:
-                    self.canCastle[target.colour][KINGSIDE] = False
-                elif target.x == 1:
-                    self.canCastle[target.colour][QUEENSIDE] = False
+                start_x, start_y = algebraic_to_xy(start)  # target.x has already been updated to the end square
+                if start_y == (1 if target.colour == WHITE else 8):
+                    if start_x == 8:
+                        self.canCastle[target.colour][KINGSIDE] = False
+                    elif start_x == 1:
+                        self.canCastle[target.colour][QUEENSIDE] = False
             if target.colour == BLACK:
                 self.moveClock += 1
             self.activeColour = BLACK if target.colour == WHITE else WHITE
+            self.inCheck = self.check_check(self.activeColour)
+            self.zobristKey ^= self.zobrist_state_key()
 
     def castle(self, colour, direction, check_valid=True):
         """Takes in a colour (BLACK or WHITE) and a direction (KINGSIDE or QUEENSIDE) and castles that colour in
@@ -361,58 +717,121 @@ class Board:
             if not self.is_empty(xy_to_algebraic(x, home_rank)):
                 if check_valid:
                     raise InvalidMoveError
-        test_board = copy.deepcopy(self)
-        current_king_pos = target_king.pos
-        for i in range(2):
-            new_king_pos = xy_to_algebraic(algebraic_to_xy(current_king_pos)[0] + direction_multiplier, home_rank)
-            test_board.make_move(current_king_pos, new_king_pos, check_valid=False)
-            if test_board.check_check(colour) and check_valid:
+        if check_valid:
+            # Walk the king across one square at a time to make sure it doesn't pass through or land in check, then
+            # put it back where it started.
+            king_start_pos = target_king.pos
+            passes_through_check = False
+            for i in range(2):
+                self.relocate_piece(target_king, xy_to_algebraic(target_king.x + direction_multiplier, home_rank))
+                if self.check_check(colour):
+                    passes_through_check = True
+                    break
+            self.relocate_piece(target_king, king_start_pos)
+            if passes_through_check:
                 raise InvalidMoveError
-            current_king_pos = new_king_pos
-        else:
-            if direction == KINGSIDE:
-                target_king.pos = xy_to_algebraic(7, home_rank)
-                target_rook.pos = xy_to_algebraic(6, home_rank)
-            elif direction == QUEENSIDE:
-                target_king.pos = xy_to_algebraic(3, home_rank)
-                target_rook.pos = xy_to_algebraic(4, home_rank)
-        target_king.x, target_king.y = algebraic_to_xy(target_king.pos)
-        target_rook.x, target_rook.y = algebraic_to_xy(target_rook.pos)
+        self.record_undo([(target_king, target_king.pos), (target_rook, target_rook.pos)], None)
+        self.zobristKey ^= self.zobrist_state_key()
+        if direction == KINGSIDE:
+            self.relocate_piece(target_king, xy_to_algebraic(7, home_rank))
+            self.relocate_piece(target_rook, xy_to_algebraic(6, home_rank))
+        elif direction == QUEENSIDE:
+            self.relocate_piece(target_king, xy_to_algebraic(3, home_rank))
+            self.relocate_piece(target_rook, xy_to_algebraic(4, home_rank))
         self.canCastle[colour] = {KINGSIDE: False, QUEENSIDE: False}
         self.enPassantTarget = FEN_EMPTY
         if self.activeColour == BLACK:
             self.moveClock += 1
         self.halfMoveClock += 1
         self.activeColour = BLACK if self.activeColour == WHITE else WHITE
+        self.inCheck = self.check_check(self.activeColour)
+        self.zobristKey ^= self.zobrist_state_key()
 
     def is_valid_castle(self, colour, direction):
-        test_board = copy.deepcopy(self)
+        if colour == self.activeColour:
+            return (SAN_CASTLE_KINGSIDE if direction == KINGSIDE else SAN_CASTLE_QUEENSIDE, None, None) in \
+                self.legal_moves()
         try:
-            test_board.castle(colour, direction)
+            self.castle(colour, direction)
         except InvalidMoveError:
             return False
         else:
+            self.pop()
             return True
 
+    def record_undo(self, moved, captured):
+        """Saves everything needed to undo the move that is about to be made onto moveStack. moved is a list of
+        (piece, start position) tuples for the pieces that will move (the first being the one that may promote), and
+        captured is the piece that will be taken, if any"""
+        self.moveStack.append((moved, moved[0][0].type, captured, self.canCastle[WHITE].copy(),
+                               self.canCastle[BLACK].copy(), self.enPassantTarget, self.halfMoveClock, self.moveClock,
+                               self.activeColour, self.inCheck, self.legalMovesCache, self.zobristKey))
+        self.legalMovesCache = None
+
+    def push(self, start, end, pawn_promotion=None):
+        """Makes a move without any validity checks so that it can be tried out in place and then undone with pop.
+        Takes the same arguments as make_move. Is an error if there was no move to make"""
+        stack_size = len(self.moveStack)
+        self.make_move(start, end, check_valid=False, pawn_promotion=pawn_promotion)
+        if len(self.moveStack) == stack_size:
+            raise InvalidMoveError
+
+    def pop(self):
+        """Undoes the last move made on this board (by push, make_move or castle), restoring the pieces, castling
+        rights, en-passant target, clocks and side to move. Is an error if there are no moves to undo"""
+        moved, moved_type, captured, white_castling, black_castling, en_passant, half_moves, moves, colour, \
+            in_check, legal_moves, zobrist_key = self.moveStack.pop()
+        for piece, pos in reversed(moved):
+            self.relocate_piece(piece, pos)
+        if moved[0][0].type != moved_type:
+            self.change_piece_type(moved[0][0], moved_type)
+        if captured is not None:
+            self.capturedPieces.pop()
+            self.place_piece(captured)
+        self.canCastle = {WHITE: white_castling, BLACK: black_castling}
+        self.enPassantTarget = en_passant
+        self.halfMoveClock = half_moves
+        self.moveClock = moves
+        self.activeColour = colour
+        self.inCheck = in_check
+        self.legalMovesCache = legal_moves
+        self.zobristKey = zobrist_key
+
+    def repetition_keys(self):
+        """Returns the Zobrist keys of the positions before this one since the last capture or pawn move, as far back
+        as the move stack goes, oldest first. These are the positions that could be repeated"""
+        if not self.halfMoveClock:
+            return []
+        return [entry[-1] for entry in self.moveStack[-self.halfMoveClock:]]
+
+    def copy(self):
+        """Returns an independent copy of the board. This is much cheaper than copy.deepcopy, though the copy starts
+        with an empty move stack, so moves made before copying can't be undone on it (see repetition_keys for keeping
+        what is needed to spot repetitions)"""
+        board = Board(self.moveGenerator)
+        for piece in self.activePieces:
+            board.place_piece(Piece(piece.type, piece.pos, piece.colour))
+        board.capturedPieces = [Piece(piece.type, piece.pos, piece.colour) for piece in self.capturedPieces]
+        board.activeColour = self.activeColour
+        board.inCheck = self.inCheck
+        board.canCastle = {WHITE: self.canCastle[WHITE].copy(), BLACK: self.canCastle[BLACK].copy()}
+        board.enPassantTarget = self.enPassantTarget
+        board.halfMoveClock = self.halfMoveClock
+        board.moveClock = self.moveClock
+        board.result = self.result
+        board.legalMovesCache = self.legalMovesCache
+        board.zobristKey = self.zobristKey
+        return board
+
     def check_game_outcome(self):
         """Decides the outcome of the game based on the pieces. First checks for draw by 50 moves without pawn advance
-        or capture, then checks for checkmate and stalemate. This is a very time-consuming function, use sparingly"""
+        or capture, then checks for checkmate and stalemate using the (cached) legal move list"""
         if self.result != IN_PROGRESS:
             return self.result
         if self.halfMoveClock >= 100:  # 100 half moves
             return DRAW  # Draw by 50-move rule
-        colour_valid_moves = []
-        for piece in self.activePieces:
-            if piece.colour == self.activeColour:
-                piece_pseudo_valid_moves = self.gen_pseudo_valid_moves(piece.pos)
-                piece_valid_moves = []
-                for move in piece_pseudo_valid_moves:
-                    if self.check_valid_move(piece.pos, move, check_colour=False):
-                        piece_valid_moves.append(move)
-                if piece_valid_moves:
-                    colour_valid_moves.append(piece_valid_moves)
-        if len(colour_valid_moves) == 0:
-            if self.check_check(self.activeColour):
+        if not self.legal_moves():
+            if self.inCheck:
                 if self.activeColour == WHITE:
                     return BLACK_WIN
                 else:
@@ -1,7 +1,3 @@
-from requests import get
-import time
-import pygame
-
 WHITE = "white"
 BLACK = "black"
 
@@ -24,7 +20,9 @@ SAN_CHECKMATE = "#"
 SAN_PROMOTION = "="
 SAN_CAPTURE = "x"
 SAN_ANNOTATIONS = ["!!", "!", "!?", "?!", "?", "??", "", "+/-", "+/=", "=", "=/+", "-/+"]
+SAN_ANNOTATION_CHARACTERS = ["!", "?"]
 SAN_EN_PASSANT = "e.p."
+SAN_CACHE_SIZE = 65536  # Positions and moves remembered by the SAN decoder
 SAN_CASTLE_QUEENSIDE = "O-O-O"
 SAN_CASTLE_KINGSIDE = "O-O"
 
@@ -35,6 +33,11 @@ QUEENSIDE = "Q"
 
 VALID_PAWN_PROMOTIONS = (KNIGHT, BISHOP, ROOK, QUEEN)
 
+# Move generators that can sit behind Board.gen_pseudo_valid_moves
+MOVE_GENERATOR_MAILBOX = "mailbox"
+MOVE_GENERATOR_BITBOARD = "bitboard"
+DEFAULT_MOVE_GENERATOR = MOVE_GENERATOR_MAILBOX
+
 # FEN Parsing:
 FEN_PIECE_ALIASES = {"K": KING, "Q": QUEEN, "R": ROOK, "B": BISHOP, "N": KNIGHT, "P": PAWN}
 FEN_COLOUR_ALIASES = {"W": WHITE, "B": BLACK}
@@ -47,35 +50,6 @@ BLACK_WIN = "0-1"
 DRAW = "1/2-1/2"
 IN_PROGRESS = "*"
 
-# GUI constants and colours
-pygame.init()
-GUI_CAPTION = "Chess"
-GUI_FONT_NAME = "lib/font/libel-suit-rg.ttf"
-GUI_SCREEN_INFO = pygame.display.Info()
-GUI_WIDTH = GUI_SCREEN_INFO.current_w
-GUI_HEIGHT = GUI_SCREEN_INFO.current_h
-GUI_SQUARE_SIZE = 100 * GUI_HEIGHT // 1080
-GUI_BOARD_START_POS = (GUI_SQUARE_SIZE, GUI_SQUARE_SIZE)
-GUI_FPS = 60
-GUI_BG_COLOUR = (49, 46, 43)
-GUI_MOVE_TEXT_BOX_COLOUR = (40, 40, 40)
-GUI_LIGHT_COLOUR = (238, 238, 210)
-GUI_DARK_COLOUR = (118, 150, 86)
-GUI_TEXT_COLOUR = (255, 255, 255)
-GUI_HIGHLIGHT_COLOUR_1 = (186, 203, 68)
-GUI_HIGHLIGHT_COLOUR_2 = (247, 247, 131)
-GUI_BUTTON_COLOUR = GUI_DARK_COLOUR
-GUI_BUTTON_CLICKED_COLOUR = (123, 183, 55)
-HUMAN = 1
-COMPUTER = 2
-# Info for finding the piece images in the filesystem.
-FILENAME_COLOUR = {WHITE: "white", BLACK: "black"}
-FILENAME_PIECETYPES = {KING: "king", QUEEN: "queen", ROOK: "rook", BISHOP: "bishop", KNIGHT: "knight", PAWN: "pawn"}
-
-# Display modes
-GUI = 1
-TEXT = 2
-
 # PGN Parsing
 PGN_OPEN_COMMENT = "{"
 PGN_CLOSE_COMMENT = "}"
@@ -83,6 +57,10 @@ PGN_OPEN_VARIATION = "("
 PGN_CLOSE_VARIATION = ")"
 PGN_OPEN_TAG = "["
 PGN_CLOSE_TAG = "]"
+PGN_LINE_COMMENT = ";"
+PGN_ESCAPE = "%"
+PGN_NAG = "$"
+PGN_SUFFIX_NAGS = {"!": 1, "?": 2, "!!": 3, "??": 4, "!?": 5, "?!": 6}  # Move suffixes and the NAGs they stand for
 PGN_DEFAULT_EVENT = "Casual Game"
 PGN_EVENT = "Event"
 PGN_SITE = "Site"
@@ -95,10 +73,54 @@ PGN_FEN = "FEN"
 PGN_CASTLE_KINGSIDE = "0-0"
 PGN_CASTLE_QUEENSIDE = "0-0-0"
 PGN_MAX_LINE_LENGTH = 80
+PGN_TERMINATION_MARKERS = (WHITE_WIN, BLACK_WIN, DRAW, IN_PROGRESS)
+POSITION_HISTORY_CHECKPOINT_INTERVAL = 32  # Plies between saved positions in a game's position history
+PGN_IMPORT_CHUNK_SIZE = 64  # Games handed to a worker process at a time
+PGN_IMPORT_CHUNKS_IN_FLIGHT = 4  # Chunks queued per worker process
+POSITION_INDEX_SEGMENT_POSTINGS = 1 << 22  # Positions collected in memory before a position index segment is written
+
+PGN_UNKNOWN = "?"
+PGN_DATE_FORMAT = "%Y.%m.%d"
+
+# Player types
+HUMAN = 1
+COMPUTER = 2
+
+# Engine search
+ENGINE_DEFAULT_DEPTH = 4  # Plies searched when neither a depth nor a time limit is given
+ENGINE_DEFAULT_TIME = 3.0  # Seconds the COMPUTER player thinks for
+ENGINE_MAX_PLY = 64
+ENGINE_MATE_SCORE = 100000
+ENGINE_INFINITY = 1000000
+ENGINE_TIME_CHECK_NODES = 1024  # Nodes searched between checks of the clock
+ENGINE_CAPTURE_ORDER = 200000  # Move ordering scores, above any history heuristic score
+ENGINE_KILLER_ORDER = 100000
+ENGINE_QUIESCENCE_CHECK_PLIES = 2  # Quiescence plies in which every check evasion is searched, rather than standing pat
+ENGINE_DELTA_MARGIN = 200  # Centipawns a capture can gain beyond the piece taken, for delta pruning
+
+# Transposition table
+ENGINE_DEFAULT_HASH_MB = 16  # Size of the transposition table, in megabytes
+
+# Batch evaluation
+BATCH_EVALUATION_SIZE = 4096  # Positions encoded and scored together by lib.batch_evaluation
+
+# Opening book
+OPENING_BOOK_LOCATION = "lib/book/book.bin"  # Polyglot book used by the computer player, if there is one
+OPENING_BOOK_MAX_PLY = 30  # How far into each game a book built from PGN goes
+
+# Syzygy tablebases
+TABLEBASE_LOCATION = "lib/syzygy"  # Directory of Syzygy tables used by the computer player, if there is one
+ENGINE_TABLEBASE_WIN = ENGINE_MATE_SCORE - 2 * ENGINE_MAX_PLY  # Score of a tablebase win, below any mate score
+
+# Batch analysis
+ANALYSIS_DEFAULT_DEPTH = 3  # Plies each position is searched to by lib.analysis
+ANALYSIS_GAMES_PER_CHECKPOINT = 32  # Games analysed and written out between checkpoints
+ANALYSIS_REPORT_INTERVAL = 5.0  # Seconds between progress reports
+ANALYSIS_CLOCK_KEY_FROM = 80  # Half-move clock from which it is part of a position's cache key (see position_key)
+ANALYSIS_SCORE_CAP = 1000  # Scores are capped at this many centipawns when judging how much a move lost
+# Centipawns a move has to lose to be marked as a blunder ($4, "??"), a mistake ($2, "?") or dubious ($6, "?!")
+ANALYSIS_NAG_THRESHOLDS = ((300, 4), (150, 2), (60, 6))
 
-# Live location and date generation for new games.
-freegeoip = "http://freegeoip.net/json"
-geo_r = get(freegeoip)
-geo_json = geo_r.json()
-CURRENT_LOCATION = geo_json["city"] + ", " + geo_json["region_name"] + " " + geo_json["country_code"]
-CURRENT_DATE = time.strftime("%Y.%m.%d")
+# Live location lookup for the Site tag of new games. Only done when a game is started without a site.
+GEOLOCATION_URL = "http://freegeoip.net/json"
+GEOLOCATION_TIMEOUT = 2  # seconds
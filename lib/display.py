@@ -1,8 +1,15 @@
 import pygame
 import os
+import sys
+import time
 from tkinter import *
 from tkinter import filedialog
 from lib.game import *
+from lib.gui_constants import *
+from lib.worker import *
+from lib.opening_book import *
+from lib.tablebase import *
+from lib.player import *
 
 
 def print_board(fen):
@@ -61,6 +68,8 @@ class ChessGUI:
         self.buttons = []
         self.add_menu_buttons()
         self.text = []
+        self.book = open_book()
+        self.computer = ComputerPlayer(self.book, open_tablebase())
         self.draw(START_BOARD, [])
 
     def new_button(self, x, y, width, height, name, image=None, text=None):
@@ -117,7 +126,7 @@ class ChessGUI:
                 self.pieceImages[colour][piece] = pygame.transform.scale(pygame.image.load(img_path),
                                                                          [GUI_SQUARE_SIZE, GUI_SQUARE_SIZE])
 
-    def draw(self, fen, highlighted_squares=None, pressed_buttons=None, move_text=""):
+    def draw(self, fen, highlighted_squares=None, pressed_buttons=None, move_lines=()):
         # Step 1: Draw background and board
         pygame.Surface.fill(self.screen, GUI_BG_COLOUR)
         for y in range(BOARD_HEIGHT):
@@ -170,25 +179,28 @@ class ChessGUI:
             pygame.draw.rect(self.screen, colour, [button[1], button[2], button[4] + GUI_SQUARE_SIZE // 10, button[5] + GUI_SQUARE_SIZE // 10])
             self.screen.blit(button[0], (button[1] + GUI_SQUARE_SIZE // 20, button[2] + GUI_SQUARE_SIZE // 20))
         textbox = ScrollingTextBox(self.screen, GUI_SQUARE_SIZE * 10, GUI_SQUARE_SIZE * 15, GUI_SQUARE_SIZE, GUI_SQUARE_SIZE * 9)
-        move_text = move_text.split(" ")
-        for part in move_text:
-            if len(part) >= 2:
-                if part[0].isdigit() and part[-1] == ".":
-                    text_to_add = part
-                    try:
-                        counter = move_text.index(part) + 1
-                        while not (move_text[counter][0].isdigit() and move_text[counter][-1] == "."):
-                            text_to_add += " " + move_text[counter]
-                            counter += 1
-                    except IndexError:
-                        pass
-                    textbox.add(text_to_add)
+        for line in move_lines:
+            textbox.add(line)
         textbox.draw()
         for part in self.text:
             to_blit = self.labelFont.render(part[0], True, GUI_TEXT_COLOUR)
             self.screen.blit(to_blit, part[1])
         pygame.display.flip()
 
+    def book_hint(self, fen):
+        """Returns a line of text listing the opening book's most played moves for a position, or an empty string if
+        there's no book or the position isn't in it"""
+        if self.book is None:
+            return ""
+        board = Board()
+        board.load_fen(fen)
+        entries = self.book.find_entries(board)
+        if not entries:
+            return ""
+        total = sum(entry.weight for entry in entries) or 1
+        return "Book: " + ", ".join(lan_to_san(fen, *entry.move) + " " + str(100 * entry.weight // total) + "%"
+                                    for entry in entries[:GUI_BOOK_HINT_MOVES])
+
     def run_game(self, game):
         """Runs a game of chess using a Game class (either generated with the new game dialog or from a pgn). """
         self.delete_all_buttons()
@@ -201,6 +213,7 @@ class ChessGUI:
         game_info_text = "In game: " + game.pgnTags[PGN_WHITE] + " vs. " + game.pgnTags[PGN_BLACK]
         info_text_width = self.labelFont.size(game_info_text)[0]
         self.text.append((game_info_text, [GUI_SQUARE_SIZE * 10 + (GUI_SQUARE_SIZE * 5 - info_text_width) // 2, GUI_SQUARE_SIZE // 2]))
+        self.text.append(["", [GUI_SQUARE_SIZE * 6, GUI_SQUARE_SIZE * 9.75]])  # Computer's last search
         whose_turn_text = "White to move" if game.board.activeColour == WHITE else "Black to move"
         self.text.append([whose_turn_text, [GUI_SQUARE_SIZE * 6, GUI_SQUARE_SIZE * 9.25]])
         self.draw(game.board.export_fen())
@@ -209,37 +222,91 @@ class ChessGUI:
         game_running = True
         if game.board.result != IN_PROGRESS:
             game_running = False
+        # The computer's search and the check for the end of the game after each move run in the background, so the
+        # board keeps being drawn while they're worked out. Only one runs at a time.
+        search_task = None
+        outcome_task = None
         while game_running:
-            self.clock.tick(60)
-            self.draw(game.board.export_fen(), highlighted_squares=highlight, move_text=game.moves)
+            self.clock.tick(GUI_FPS)
+            self.draw(game.board.export_fen(), highlighted_squares=highlight, move_lines=game.move_lines())
+            if outcome_task is not None:
+                finished, outcome = outcome_task.poll()
+                if finished:
+                    outcome_task = None
+                    game.board.result = outcome
+                    if game.board.result != IN_PROGRESS:
+                        game.terminationMarker = game.board.result
+                        game_running = False
+                        continue
+            elif search_task is not None:
+                finished, result = search_task.poll()
+                if finished:
+                    search_task = None
+                    if result.bestMove is not None:
+                        start, end, promotion = result.bestMove
+                        game.play_move(start, end, pawn_promotion=promotion)
+                        if result.fromBook:
+                            self.text[-2][0] = "Computer played " + game.moveRecords[-1].san + " (book)"
+                        elif result.fromTablebase:
+                            self.text[-2][0] = "Computer played " + game.moveRecords[-1].san + " (" + \
+                                result.score_text() + ")"
+                        else:
+                            self.text[-2][0] = "Computer played " + game.moveRecords[-1].san + " (" + \
+                                result.score_text() + ", depth " + str(result.depth) + ", " + \
+                                str(result.nodes_per_second()) + " nodes/s)"
+                        self.text[-1][0] = "White to move" if game.board.activeColour == WHITE else "Black to move"
+                    outcome_task = BackgroundTask(self.computer.check_outcome, (game.board.copy(), game.players))
+            elif game.is_computer_turn():
+                self.text[-2][0] = "Computer is thinking..."
+                search_task = BackgroundTask(self.computer.find_move,
+                                             (game.board.copy(), game.board.repetition_keys()),
+                                             on_cancel=self.computer.stop)
             for event in pygame.event.get():
                 if selected_pos is None:
                     highlight = None
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     if self.is_click_on_button("new", event.pos):
                         self.draw(game.board.export_fen(), highlighted_squares=highlight,
-                                  pressed_buttons=["new"], move_text=game.moves)
+                                  pressed_buttons=["new"], move_lines=game.move_lines())
                         time.sleep(0.1)
-                        self.draw(game.board.export_fen(), highlighted_squares=highlight, move_text=game.moves)
+                        self.draw(game.board.export_fen(), highlighted_squares=highlight, move_lines=game.move_lines())
+                        if search_task is not None:
+                            search_task.cancel()
+                            search_task = None
+                        if outcome_task is not None:
+                            outcome_task.cancel()
+                            outcome_task = None
                         setup = NewGameInfoGUI()
                         data = setup.get_game_setup_params()
                         if data[2]:
                             continue
-                        game.new_game(white=data[0], black=data[1])
+                        game.new_game(white=data[0], black=data[1], white_player=data[3], black_player=data[4])
                         self.run_game(game)
                         return
                     if self.is_click_on_button("quit", event.pos):
                         self.draw(game.board.export_fen(), highlighted_squares=highlight,
-                                  pressed_buttons=["quit"], move_text=game.moves)
+                                  pressed_buttons=["quit"], move_lines=game.move_lines())
                         time.sleep(0.1)
-                        self.draw(game.board.export_fen(), highlighted_squares=highlight, move_text=game.moves)
+                        self.draw(game.board.export_fen(), highlighted_squares=highlight, move_lines=game.move_lines())
+                        if search_task is not None:
+                            search_task.cancel()
+                            search_task = None
+                        if outcome_task is not None:
+                            outcome_task.cancel()
+                            outcome_task = None
                         pygame.quit()
                         sys.exit()
                     if self.is_click_on_button("open", event.pos):
                         self.draw(game.board.export_fen(), highlighted_squares=highlight,
-                                  pressed_buttons=["open"], move_text=game.moves)
+                                  pressed_buttons=["open"], move_lines=game.move_lines())
                         time.sleep(0.1)
-                        self.draw(game.board.export_fen(), highlighted_squares=highlight, move_text=game.moves)
+                        self.draw(game.board.export_fen(), highlighted_squares=highlight, move_lines=game.move_lines())
+                        if search_task is not None:
+                            search_task.cancel()
+                            search_task = None
+                        if outcome_task is not None:
+                            outcome_task.cancel()
+                            outcome_task = None
                         root = Tk()
                         root.withdraw()
                         root.overrideredirect(True)
@@ -259,24 +326,37 @@ class ChessGUI:
                                 continue
                     if self.is_click_on_button("resign", event.pos):
                         self.draw(game.board.export_fen(), highlighted_squares=highlight,
-                                  pressed_buttons=["resign"], move_text=game.moves)
+                                  pressed_buttons=["resign"], move_lines=game.move_lines())
                         time.sleep(0.1)
-                        self.draw(game.board.export_fen(), highlighted_squares=highlight, move_text=game.moves)
-                        if game.board.activeColour == BLACK:
+                        self.draw(game.board.export_fen(), highlighted_squares=highlight, move_lines=game.move_lines())
+                        if search_task is not None:
+                            search_task.cancel()
+                            search_task = None
+                        if outcome_task is not None:
+                            outcome_task.cancel()
+                            outcome_task = None
+                        # The player resigning is the one to move, unless it's the computer's move
+                        resigning_colour = game.board.activeColour
+                        if game.players[resigning_colour] == COMPUTER:
+                            resigning_colour = WHITE if resigning_colour == BLACK else BLACK
+                        if resigning_colour == BLACK:
                             game.board.result = WHITE_WIN
                             game.pgnTags[PGN_RESULT] = WHITE_WIN
-                            game.moves += WHITE_WIN
+                            game.terminationMarker = WHITE_WIN
                         else:
                             game.board.result = BLACK_WIN
                             game.pgnTags[PGN_RESULT] = BLACK_WIN
-                            game.moves += BLACK_WIN
+                            game.terminationMarker = BLACK_WIN
                         game_running = False
                         break
                     if self.is_click_on_button("draw", event.pos):
                         self.draw(game.board.export_fen(), highlighted_squares=highlight,
-                                  pressed_buttons=["draw"], move_text=game.moves)
+                                  pressed_buttons=["draw"], move_lines=game.move_lines())
                         time.sleep(0.1)
-                        self.draw(game.board.export_fen(), highlighted_squares=highlight, move_text=game.moves)
+                        self.draw(game.board.export_fen(), highlighted_squares=highlight, move_lines=game.move_lines())
+                        if search_task is not None:
+                            search_task.cancel()
+                            search_task = None
                         choice = None
                         while choice is None:
                             name = "White" if game.board.activeColour == BLACK else "Black"
@@ -288,16 +368,16 @@ class ChessGUI:
                         if choice:
                             game.pgnTags[PGN_RESULT] = DRAW
                             game.board.result = DRAW
-                            game.moves += DRAW
+                            game.terminationMarker = DRAW
                             game_running = False
                             break
                         else:
                             continue
                     if self.is_click_on_button("save", event.pos):
                         self.draw(game.board.export_fen(), highlighted_squares=highlight,
-                                  pressed_buttons=["save"], move_text=game.moves)
+                                  pressed_buttons=["save"], move_lines=game.move_lines())
                         time.sleep(0.1)
-                        self.draw(game.board.export_fen(), highlighted_squares=highlight, move_text=game.moves)
+                        self.draw(game.board.export_fen(), highlighted_squares=highlight, move_lines=game.move_lines())
                         root = Tk()
                         root.withdraw()
                         root.overrideredirect(True)
@@ -309,6 +389,8 @@ class ChessGUI:
                             continue
                         else:
                             game.export_pgn(filename)
+                    if game.is_computer_turn() or outcome_task is not None:
+                        continue
                     if screen_pos_to_chess_pos(event.pos) == selected_pos:
                         selected_pos = None
                     else:
@@ -361,25 +443,14 @@ class ChessGUI:
                                     continue
                                 if game.board.check_valid_move(selected_pos, screen_pos_to_chess_pos(event.pos),
                                                                pawn_promotion=pawn_promotion):
-                                    if game.board.activeColour == WHITE:
-                                        game.moves += str(game.board.moveClock) + ". "
-                                    game.moves += lan_to_san(game.board.export_fen(), selected_pos,
-                                                             screen_pos_to_chess_pos(event.pos),
-                                                             pawn_promotion=pawn_promotion) + " "
-                                    game.board.make_move(selected_pos, screen_pos_to_chess_pos(event.pos),
-                                                         pawn_promotion=pawn_promotion)
-                                    game.previousBoardStates.append(game.board.export_fen())
-                                    game.movesRaw.append(
-                                        (selected_pos, screen_pos_to_chess_pos(event.pos)))
+                                    game.play_move(selected_pos, screen_pos_to_chess_pos(event.pos),
+                                                   pawn_promotion=pawn_promotion)
                                     if game.board.activeColour == WHITE:
                                         self.text[-1][0] = "White to move"
                                     else:
                                         self.text[-1][0] = "Black to move"
-                                    game.board.result = game.board.check_game_outcome()
-                                    if game.board.result != IN_PROGRESS:
-                                        game.moves += " " + game.board.result
-                                        game_running = False
-
+                                    outcome_task = BackgroundTask(self.computer.check_outcome,
+                                                                  (game.board.copy(), game.players))
                                     selected_pos = None
                                 else:
                                     if game.board.is_empty(screen_pos_to_chess_pos(event.pos)):
@@ -399,6 +470,10 @@ class ChessGUI:
                             else:
                                 selected_pos = None
                 elif event.type == pygame.QUIT:
+                    if search_task is not None:
+                        search_task.cancel()
+                    if outcome_task is not None:
+                        outcome_task.cancel()
                     pygame.quit()
                     sys.exit()
         win_message = ""
@@ -410,13 +485,14 @@ class ChessGUI:
         elif game.board.result == DRAW:
             win_message = "Game is a draw"
         self.text[-1][0] = win_message
-        self.draw(game.board.export_fen(), move_text=game.moves)
+        self.draw(game.board.export_fen(), move_lines=game.move_lines())
         self.delete_button("resign")
         self.delete_button("draw")
         self.new_button(chess_pos_to_screen_pos("b1")[0] + 40, chess_pos_to_screen_pos("b1")[1] + GUI_SQUARE_SIZE + 20,
                         0, 0, text="Replay game", name="view")
-        self.draw(game.board.export_fen(), move_text=game.moves)
+        self.draw(game.board.export_fen(), move_lines=game.move_lines())
         while True:
+            self.clock.tick(GUI_FPS)
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     pygame.quit()
@@ -426,20 +502,20 @@ class ChessGUI:
                         pygame.quit()
                         sys.exit()
                     if self.is_click_on_button("new", event.pos):
-                        self.draw(game.board.export_fen(), pressed_buttons=["open"], move_text=game.moves)
+                        self.draw(game.board.export_fen(), pressed_buttons=["open"], move_lines=game.move_lines())
                         time.sleep(0.1)
-                        self.draw(game.board.export_fen(), move_text=game.moves)
+                        self.draw(game.board.export_fen(), move_lines=game.move_lines())
                         setup = NewGameInfoGUI()
                         data = setup.get_game_setup_params()
                         if data[2]:
                             continue
-                        game.new_game(white=data[0], black=data[1])
+                        game.new_game(white=data[0], black=data[1], white_player=data[3], black_player=data[4])
                         self.run_game(game)
                         return
                     if self.is_click_on_button("open", event.pos):
-                        self.draw(game.board.export_fen(), pressed_buttons=["open"], move_text=game.moves)
+                        self.draw(game.board.export_fen(), pressed_buttons=["open"], move_lines=game.move_lines())
                         time.sleep(0.1)
-                        self.draw(game.board.export_fen(), move_text=game.moves)
+                        self.draw(game.board.export_fen(), move_lines=game.move_lines())
                         root = Tk()
                         root.withdraw()
                         root.overrideredirect(True)
@@ -458,14 +534,14 @@ class ChessGUI:
                             except ValueError:
                                 continue
                     if self.is_click_on_button("view", event.pos):
-                        self.draw(game.board.export_fen(), pressed_buttons=["view"], move_text=game.moves)
+                        self.draw(game.board.export_fen(), pressed_buttons=["view"], move_lines=game.move_lines())
                         time.sleep(0.1)
-                        self.draw(game.board.export_fen(), move_text=game.moves)
+                        self.draw(game.board.export_fen(), move_lines=game.move_lines())
                         self.view_moves(game)
                     if self.is_click_on_button("save", event.pos):
-                        self.draw(game.board.export_fen(), pressed_buttons=["save"], move_text=game.moves)
+                        self.draw(game.board.export_fen(), pressed_buttons=["save"], move_lines=game.move_lines())
                         time.sleep(0.1)
-                        self.draw(game.board.export_fen(), move_text=game.moves)
+                        self.draw(game.board.export_fen(), move_lines=game.move_lines())
                         root = Tk()
                         root.withdraw()
                         root.overrideredirect(True)
@@ -487,6 +563,7 @@ class ChessGUI:
         info_text_width = self.labelFont.size(game_info_text)[0]
         self.text = []
         self.text.append((game_info_text, [GUI_SQUARE_SIZE * 10 + (GUI_SQUARE_SIZE * 5 - info_text_width) // 2, GUI_SQUARE_SIZE // 2]))
+        self.text.append(["", [GUI_SQUARE_SIZE * 6, GUI_SQUARE_SIZE * 9.75]])  # Book moves for the position shown
         pygame.key.set_repeat(500, 50)
         self.delete_all_buttons()
         self.add_menu_buttons()
@@ -502,12 +579,12 @@ class ChessGUI:
             last_move_start = None
             last_move_end = None
             if move_counter > 0:
-                last_move_start = game.movesRaw[move_counter - 1][0]
-                last_move_end = game.movesRaw[move_counter - 1][1]
+                last_move_start = game.moveRecords[move_counter - 1].start
+                last_move_end = game.moveRecords[move_counter - 1].end
             if last_move_start in (
                     PGN_CASTLE_KINGSIDE, PGN_CASTLE_QUEENSIDE, SAN_CASTLE_KINGSIDE, SAN_CASTLE_QUEENSIDE):
                 king_start_file = 5
-                if FEN_COLOUR_ALIASES[game.previousBoardStates[move_counter - 1].split(" ")[1].upper()] == WHITE:
+                if game.moveRecords[move_counter - 1].colour == WHITE:
                     home_rank = 1
                 else:
                     home_rank = 8
@@ -519,18 +596,9 @@ class ChessGUI:
                 last_move_end = xy_to_algebraic(king_end_file, home_rank)
 
             highlight = [last_move_start, last_move_end] if last_move_start is not None else []
-            moves_copy = game.moves.split()
-            if move_counter == len(game.movesRaw):
-                move_text_up_to_here = game.moves
-            else:
-                for part in moves_copy:
-                    if part[-1] == "." and part[0:-1] == game.previousBoardStates[move_counter].split()[5]:
-                        whose_turn = 1 if game.previousBoardStates[move_counter].split()[1] == "w" else 2
-                        move_text_up_to_here = " ".join(moves_copy[:moves_copy.index(part) + whose_turn])
-                        if move_text_up_to_here.split()[-1][-1] == "." and move_text_up_to_here.split()[-1][
-                                                                           0:-1].isdigit():
-                            move_text_up_to_here = " ".join(move_text_up_to_here.split()[:-1])
-            self.draw(game.previousBoardStates[move_counter], highlight, move_text=move_text_up_to_here)
+            move_lines_up_to_here = game.move_lines(move_counter)
+            self.text[-1][0] = self.book_hint(game.previousBoardStates[move_counter])
+            self.draw(game.previousBoardStates[move_counter], highlight, move_lines=move_lines_up_to_here)
             next_move = False
             while not next_move:
                 for event in pygame.event.get():
@@ -540,7 +608,7 @@ class ChessGUI:
                     if event.type == pygame.KEYDOWN:
                         if event.key == pygame.K_RIGHT:
                             next_move = True
-                            if move_counter < len(game.previousBoardStates) - 1:
+                            if move_counter < len(game.moveRecords):
                                 move_counter += 1
                         if event.key == pygame.K_LEFT:
                             next_move = True
@@ -550,37 +618,37 @@ class ChessGUI:
                         if event.button == 1:
                             if self.is_click_on_button("next_move", event.pos):
                                 self.draw(game.previousBoardStates[move_counter], highlighted_squares=highlight,
-                                          pressed_buttons=["next_move"], move_text=move_text_up_to_here)
+                                          pressed_buttons=["next_move"], move_lines=move_lines_up_to_here)
                                 time.sleep(0.1)
                                 next_move = True
-                                if move_counter < len(game.previousBoardStates) - 1:
+                                if move_counter < len(game.moveRecords):
                                     move_counter += 1
                             if self.is_click_on_button("prev_move", event.pos):
                                 self.draw(game.previousBoardStates[move_counter], highlighted_squares=highlight,
-                                          pressed_buttons=["prev_move"], move_text=move_text_up_to_here)
+                                          pressed_buttons=["prev_move"], move_lines=move_lines_up_to_here)
                                 time.sleep(0.1)
                                 next_move = True
                                 if move_counter > 0:
                                     move_counter -= 1
                             if self.is_click_on_button("new", event.pos):
                                 self.draw(game.previousBoardStates[move_counter], highlighted_squares=highlight,
-                                          pressed_buttons=["new"], move_text=move_text_up_to_here)
+                                          pressed_buttons=["new"], move_lines=move_lines_up_to_here)
                                 time.sleep(0.1)
                                 self.draw(game.previousBoardStates[move_counter], highlighted_squares=highlight,
-                                          move_text=move_text_up_to_here)
+                                          move_lines=move_lines_up_to_here)
                                 setup = NewGameInfoGUI()
                                 data = setup.get_game_setup_params()
                                 if data[2]:
                                     continue
-                                game.new_game(white=data[0], black=data[1])
+                                game.new_game(white=data[0], black=data[1], white_player=data[3], black_player=data[4])
                                 self.run_game(game)
                                 return
                             if self.is_click_on_button("open", event.pos):
                                 self.draw(game.previousBoardStates[move_counter], highlighted_squares=highlight,
-                                          pressed_buttons=["open"], move_text=move_text_up_to_here)
+                                          pressed_buttons=["open"], move_lines=move_lines_up_to_here)
                                 time.sleep(0.1)
                                 self.draw(game.previousBoardStates[move_counter], highlighted_squares=highlight,
-                                          move_text=move_text_up_to_here)
+                                          move_lines=move_lines_up_to_here)
                                 root = Tk()
                                 root.withdraw()
                                 root.overrideredirect(True)
@@ -599,24 +667,25 @@ class ChessGUI:
                                         continue
                             if self.is_click_on_button("quit", event.pos):
                                 self.draw(game.previousBoardStates[move_counter], highlighted_squares=highlight,
-                                          pressed_buttons=["quit"], move_text=move_text_up_to_here)
+                                          pressed_buttons=["quit"], move_lines=move_lines_up_to_here)
                                 time.sleep(0.1)
                                 self.draw(game.previousBoardStates[move_counter], highlighted_squares=highlight,
-                                          move_text=move_text_up_to_here)
+                                          move_lines=move_lines_up_to_here)
                                 pygame.quit()
                                 sys.exit()
                             if self.is_click_on_button("continue_game", event.pos):
                                 self.draw(game.previousBoardStates[move_counter], highlighted_squares=highlight,
-                                          pressed_buttons=["continue_game"], move_text=move_text_up_to_here)
+                                          pressed_buttons=["continue_game"], move_lines=move_lines_up_to_here)
                                 time.sleep(0.1)
                                 self.draw(game.previousBoardStates[move_counter], highlighted_squares=highlight,
-                                          move_text=move_text_up_to_here)
+                                          move_lines=move_lines_up_to_here)
                                 self.run_game(game)
                             if self.is_click_on_button("save", event.pos):
                                 self.draw(game.board.export_fen(), highlighted_squares=highlight,
-                                          pressed_buttons=["save"], move_text=game.moves)
+                                          pressed_buttons=["save"], move_lines=game.move_lines())
                                 time.sleep(0.1)
-                                self.draw(game.board.export_fen(), highlighted_squares=highlight, move_text=game.moves)
+                                self.draw(game.board.export_fen(), highlighted_squares=highlight,
+                                          move_lines=game.move_lines())
                                 root = Tk()
                                 root.withdraw()
                                 root.overrideredirect(True)
@@ -642,6 +711,8 @@ class NewGameInfoGUI:
         self.cancel = False
         self.player1Name = "white"
         self.player2Name = "black"
+        self.player1Type = HUMAN
+        self.player2Type = HUMAN
         self.instructionMessage = StringVar()
         self.root.protocol("WM_DELETE_WINDOW", self.close_window)
         Label(self.frame, textvariable=self.instructionMessage).grid(row=0)
@@ -655,6 +726,11 @@ class NewGameInfoGUI:
         self.entry_player2Name = Entry(self.frame)
         self.entry_player2Name.grid(row=3, column=1)
         self.entry_player2Name.insert(ANCHOR, "Black")
+        Label(self.frame, text="Computer").grid(row=1, column=2)
+        self.player1Computer = IntVar()
+        Checkbutton(self.frame, variable=self.player1Computer).grid(row=2, column=2)
+        self.player2Computer = IntVar()
+        Checkbutton(self.frame, variable=self.player2Computer).grid(row=3, column=2)
 
         b = Button(self.frame, text="Start", command=self.ok)
         b.grid(row=4, column=1)
@@ -663,7 +739,7 @@ class NewGameInfoGUI:
         self.cancel = True
         self.frame.destroy()
 
-    def center_window(self, width=300, height=150):
+    def center_window(self, width=380, height=150):
         screen_width = self.root.winfo_screenwidth()
         screen_height = self.root.winfo_screenheight()
         x = (screen_width / 2) - (width / 2)
@@ -673,6 +749,8 @@ class NewGameInfoGUI:
     def ok(self):
         self.player1Name = self.entry_player1Name.get()
         self.player2Name = self.entry_player2Name.get()
+        self.player1Type = COMPUTER if self.player1Computer.get() else HUMAN
+        self.player2Type = COMPUTER if self.player2Computer.get() else HUMAN
 
         if self.player1Name != "" and self.player2Name != "":
             self.frame.destroy()
@@ -685,7 +763,7 @@ class NewGameInfoGUI:
     def get_game_setup_params(self):
         self.root.wait_window(self.frame)  # waits for frame to be destroyed
         self.root.destroy()  # noticed that with "text" gui mode, the tk window stayed...this gets rid of it.
-        return self.player1Name, self.player2Name, self.cancel
+        return self.player1Name, self.player2Name, self.cancel, self.player1Type, self.player2Type
 
 
 class DrawOfferGUI:
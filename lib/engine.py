@@ -0,0 +1,531 @@
+"""A chess engine for the COMPUTER player: iterative deepening negamax alpha-beta search with a quiescence search of
+captures, a transposition table of positions already searched, and moves ordered by the principal variation, the
+transposition table, MVV-LVA (most valuable victim, least valuable attacker), killer moves and the history heuristic.
+With Syzygy tablebases, positions they cover are scored from them instead of searched.
+ParallelEngine runs several such searches at once in worker processes that share one transposition table ("Lazy SMP"),
+to make use of more than one core.
+
+Run from the project folder, e.g.
+    python -m lib.engine --depth 5
+    python -m lib.engine --depth 6 --hash 64
+    python -m lib.engine --time 30 --workers 16 --hash 256
+    python -m lib.engine --depth 6 --workers 4 --compare
+    python -m lib.engine --syzygy syzygy_dir --fen "8/8/8/4k3/8/8/8/R3K3 w - - 0 1"
+    python -m lib.engine --time 10 --fen "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3"
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import time
+from lib.evaluation import *
+from lib.transposition import *
+from lib.tablebase import *
+
+
+class SearchResult:
+    """The outcome of a search (or of one iteration of it): the best move, its score in centipawns from the point of
+    view of the side to move, the depth searched, the principal variation and how many nodes it took. fromBook and
+    fromTablebase are True for a move taken from an opening book or the tablebases instead of searched for. exact is
+    False when the search was stopped before it finished its first depth, when the score is only a rough guess"""
+    def __init__(self, best_move=None, score=0, depth=0, pv=None, nodes=0, elapsed=0.0, from_book=False,
+                 from_tablebase=False, exact=True):
+        self.bestMove = best_move
+        self.score = score
+        self.depth = depth
+        self.pv = pv if pv is not None else []
+        self.nodes = nodes
+        self.elapsed = elapsed
+        self.fromBook = from_book
+        self.fromTablebase = from_tablebase
+        self.exact = exact
+
+    def nodes_per_second(self):
+        return int(self.nodes / self.elapsed) if self.elapsed > 0 else 0
+
+    def is_mate_score(self):
+        return abs(self.score) >= ENGINE_MATE_SCORE - ENGINE_MAX_PLY
+
+    def score_text(self):
+        """The score as e.g. +0.35, M3 / -M2 for a forced mate in that many moves, or TB win / TB loss for a result
+        from the tablebases. A score that isn't exact starts with ~"""
+        prefix = "" if self.exact else "~"
+        if self.is_mate_score():
+            moves_to_mate = (ENGINE_MATE_SCORE - abs(self.score) + 1) // 2
+            return prefix + ("" if self.score > 0 else "-") + "M" + str(moves_to_mate)
+        if abs(self.score) >= ENGINE_TABLEBASE_WIN - ENGINE_MAX_PLY:
+            return prefix + ("TB win" if self.score > 0 else "TB loss")
+        return prefix + "%+.2f" % (self.score / 100)
+
+
+class Engine:
+    """Searches Board positions for the best move. The transposition, killer and history tables carry over between
+    searches. hash_mb is the size of the transposition table in megabytes, or a TranspositionTable can be given.
+    tablebase is a Tablebase to score the positions it covers with"""
+    def __init__(self, hash_mb=ENGINE_DEFAULT_HASH_MB, table=None, tablebase=None):
+        self.table = table if table is not None else TranspositionTable(hash_mb)
+        self.tablebase = tablebase
+        self.killers = [[None, None] for ply in range(ENGINE_MAX_PLY)]
+        self.history = {}
+        self.pvTable = [[] for ply in range(ENGINE_MAX_PLY + 1)]
+        self.previousPv = []
+        self.rootKeys = []
+        self.nodes = 0
+        self.deadline = None
+        self.stopped = False
+
+    def stop(self):
+        """Makes a running search return as soon as it can, with the result of the last depth it finished. Safe to
+        call from another thread"""
+        self.stopped = True
+
+    def search(self, board, depth=None, time_limit=None, callback=None, start_depth=1, history_keys=None):
+        """Searches a board to a fixed depth, for a fixed time in seconds, or both (whichever runs out first), and
+        returns a SearchResult. With neither it searches to ENGINE_DEFAULT_DEPTH. The board isn't changed; a copy is
+        searched, and the moves that led to the board are used to spot repetitions, or history_keys if given (the
+        board.repetition_keys() of a board it is a copy of). callback is called with a
+        SearchResult after each depth is finished. Iterative deepening begins at start_depth. If the search is stopped
+        during a depth, the result of the depth before is kept; if that was the first depth, the best of the root moves
+        it finished searching is returned, with a score that isn't exact"""
+        if depth is None and time_limit is None:
+            depth = ENGINE_DEFAULT_DEPTH
+        start_time = time.perf_counter()
+        self.deadline = start_time + time_limit if time_limit is not None else None
+        self.stopped = False
+        self.nodes = 0
+        self.table.new_search()
+        self.table.reset_stats()
+        # Keys of the positions since the last capture or pawn move, for repetition detection
+        self.rootKeys = history_keys if history_keys is not None else board.repetition_keys()
+        search_board = board.copy()
+        legal_moves = search_board.legal_moves()
+        result = SearchResult()
+        if not legal_moves:
+            result.score = -ENGINE_MATE_SCORE if search_board.inCheck else 0
+            return result
+        if self.tablebase is not None:
+            root = self.tablebase.probe_root(search_board)
+            if root is not None:
+                move, wdl, dtz = root
+                return SearchResult(move, self.tablebase_score(wdl, 0), 0, [move], self.nodes,
+                                    time.perf_counter() - start_time, from_tablebase=True)
+        # Until the first depth finishes, the move that would be searched first is the best guess
+        entry = self.table.probe(search_board.zobristKey)
+        result.bestMove = self.order_moves(search_board, legal_moves, 0, entry[0] if entry is not None else None)[0]
+        result.pv = [result.bestMove]
+        for current_depth in range(start_depth, min(depth or ENGINE_MAX_PLY, ENGINE_MAX_PLY) + 1):
+            self.previousPv = result.pv
+            score = self.negamax(search_board, current_depth, -ENGINE_INFINITY, ENGINE_INFINITY, 0)
+            if self.stopped:
+                if current_depth == start_depth:
+                    result.exact = False
+                    if self.pvTable[0]:
+                        result.bestMove = self.pvTable[0][0]
+                        result.pv = list(self.pvTable[0])
+                        result.score = score
+                    else:
+                        result.score = evaluate(search_board)
+                break
+            result = SearchResult(self.pvTable[0][0], score, current_depth, list(self.pvTable[0]), self.nodes,
+                                  time.perf_counter() - start_time)
+            if callback is not None:
+                callback(result)
+            if self.stopped or len(legal_moves) == 1 or result.is_mate_score() and \
+                    ENGINE_MATE_SCORE - abs(score) <= current_depth:
+                break
+        result.nodes = self.nodes
+        result.elapsed = time.perf_counter() - start_time
+        return result
+
+    def check_time(self):
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            self.stopped = True
+
+    def is_repetition(self, board):
+        """Returns True if the position on the board has been seen before, since the last capture or pawn move"""
+        key = board.zobristKey
+        stack = board.moveStack
+        for distance in range(2, board.halfMoveClock + 1, 2):
+            if distance <= len(stack):
+                if stack[-distance][-1] == key:
+                    return True
+            elif distance - len(stack) <= len(self.rootKeys):
+                if self.rootKeys[len(stack) - distance] == key:
+                    return True
+            else:
+                break
+        return False
+
+    def negamax(self, board, depth, alpha, beta, ply, on_pv=True):
+        """Returns the score of the board from the side to move's point of view, searched to depth plies, and fills in
+        pvTable[ply] with the best line found. on_pv is True while the moves so far follow the last iteration's
+        principal variation, whose next move is then searched first"""
+        self.pvTable[ply] = []
+        if ply > 0 and (board.halfMoveClock >= 100 or self.is_repetition(board)):
+            return 0
+        # Just after a capture or pawn move, the tablebases' result holds however the fifty-move rule plays out
+        if self.tablebase is not None and ply > 0 and board.halfMoveClock == 0 and \
+                len(board.activePieces) <= self.tablebase.maxPieces:
+            wdl = self.tablebase.probe_wdl(board)
+            if wdl is not None:
+                return self.tablebase_score(wdl, ply)
+        if depth <= 0 or ply >= ENGINE_MAX_PLY - 1:
+            return self.quiescence(board, alpha, beta, ply)
+        self.nodes += 1
+        if self.nodes % ENGINE_TIME_CHECK_NODES == 0:
+            self.check_time()
+        if self.stopped and ply > 0:
+            return 0
+        legal_moves = board.legal_moves()
+        if not legal_moves:
+            return -(ENGINE_MATE_SCORE - ply) if board.inCheck else 0
+        key = board.zobristKey
+        entry = self.table.probe(key)
+        hash_move = None
+        if entry is not None:
+            hash_move, entry_depth, entry_score, bound = entry
+            # Lines off the principal variation can be cut short by what's already known; the principal variation
+            # itself is always searched so that it comes out whole
+            if not on_pv and entry_depth >= depth:
+                entry_score = self.score_from_table(entry_score, ply)
+                if bound == TT_EXACT or bound == TT_LOWER and entry_score >= beta or \
+                        bound == TT_UPPER and entry_score <= alpha:
+                    if hash_move is not None:
+                        self.pvTable[ply] = [hash_move]
+                    return entry_score
+        pv_move = self.previousPv[ply] if on_pv and ply < len(self.previousPv) else None
+        if pv_move is None or pv_move not in legal_moves:
+            pv_move = hash_move
+        alpha_original = alpha
+        best_score = -ENGINE_INFINITY
+        best_move = None
+        for move in self.order_moves(board, legal_moves, ply, pv_move):
+            capture = self.is_capture(board, move)
+            board.push(*move)
+            # Search one ply deeper when in check, so that checks at the horizon don't hide mates
+            score = -self.negamax(board, depth - 1 + (1 if board.inCheck else 0), -beta, -alpha, ply + 1,
+                                  on_pv and move == pv_move)
+            board.pop()
+            if self.stopped:
+                if ply > 0:
+                    return 0
+                break  # The root move was cut short, so its score means nothing
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    best_move = move
+                    self.pvTable[ply] = [move] + self.pvTable[ply + 1]
+                    if score >= beta:
+                        if not capture:
+                            self.record_cutoff(board, move, depth, ply)
+                        break
+        if self.stopped:
+            return best_score
+        if best_score >= beta:
+            bound = TT_LOWER
+        elif best_score > alpha_original:
+            bound = TT_EXACT
+        else:
+            bound = TT_UPPER
+        self.table.store(key, depth, self.score_to_table(best_score, ply), bound, best_move)
+        return best_score
+
+    def tablebase_score(self, wdl, ply):
+        """Converts a WDL score to a search score: wins and losses sooner than later, and wins or losses the
+        fifty-move rule stops as draws"""
+        if wdl == WDL_WIN:
+            return ENGINE_TABLEBASE_WIN - ply
+        if wdl == WDL_LOSS:
+            return -(ENGINE_TABLEBASE_WIN - ply)
+        return 0
+
+    def score_to_table(self, score, ply):
+        """Mate scores count plies from the root; the table holds them counted from the position itself, so that they
+        still hold when the position is reached by a different number of moves"""
+        if score >= ENGINE_MATE_SCORE - ENGINE_MAX_PLY:
+            return score + ply
+        if score <= -(ENGINE_MATE_SCORE - ENGINE_MAX_PLY):
+            return score - ply
+        return score
+
+    def score_from_table(self, score, ply):
+        if score >= ENGINE_MATE_SCORE - ENGINE_MAX_PLY:
+            return score - ply
+        if score <= -(ENGINE_MATE_SCORE - ENGINE_MAX_PLY):
+            return score + ply
+        return score
+
+    def quiescence(self, board, alpha, beta, ply, quiescence_ply=0):
+        """Searches only captures and promotions until the position is quiet, so that the static evaluation is never
+        taken in the middle of an exchange. In check, every evasion is searched for the first
+        ENGINE_QUIESCENCE_CHECK_PLIES plies of quiescence, and after that the side to move stands pat like anywhere
+        else. Captures that couldn't raise the score to alpha even with ENGINE_DELTA_MARGIN to spare are skipped (delta
+        pruning). quiescence_ply counts the plies since the main search's horizon"""
+        self.nodes += 1
+        if self.nodes % ENGINE_TIME_CHECK_NODES == 0:
+            self.check_time()
+        if self.stopped:
+            return 0
+        # Only check evasions can repeat a position, since every other quiescence move is a capture or pawn move
+        if quiescence_ply > 0 and (board.halfMoveClock >= 100 or self.is_repetition(board)):
+            return 0
+        legal_moves = board.legal_moves()
+        if not legal_moves:
+            return -(ENGINE_MATE_SCORE - ply) if board.inCheck else 0
+        key = board.zobristKey
+        entry = self.table.probe(key)
+        if entry is not None:
+            hash_move, entry_depth, entry_score, bound = entry
+            entry_score = self.score_from_table(entry_score, ply)
+            if bound == TT_EXACT or bound == TT_LOWER and entry_score >= beta or \
+                    bound == TT_UPPER and entry_score <= alpha:
+                return entry_score
+        alpha_original = alpha
+        if board.inCheck and quiescence_ply < ENGINE_QUIESCENCE_CHECK_PLIES and ply < ENGINE_MAX_PLY - 1:
+            moves = legal_moves
+            best_score = -ENGINE_INFINITY
+        else:
+            best_score = evaluate(board)
+            if best_score >= beta or ply >= ENGINE_MAX_PLY - 1:
+                return best_score
+            alpha = max(alpha, best_score)
+            moves = []
+            for move in legal_moves:
+                if move[2] is not None:
+                    moves.append(move)
+                else:
+                    gain = self.capture_gain(board, move)
+                    if gain and best_score + gain + ENGINE_DELTA_MARGIN > alpha:
+                        moves.append(move)
+        best_move = None
+        for move in self.order_moves(board, moves, ply):
+            board.push(*move)
+            score = -self.quiescence(board, -beta, -alpha, ply + 1, quiescence_ply + 1)
+            board.pop()
+            if self.stopped:
+                return 0
+            if score > best_score:
+                best_score = score
+                if score > alpha:
+                    alpha = score
+                    best_move = move
+                    if score >= beta:
+                        break
+        # Quiescence results go in as depth 0, and don't replace what a real search found for the position
+        if entry is None or entry[1] == 0:
+            if best_score >= beta:
+                bound = TT_LOWER
+            elif best_score > alpha_original:
+                bound = TT_EXACT
+            else:
+                bound = TT_UPPER
+            self.table.store(key, 0, self.score_to_table(best_score, ply), bound, best_move)
+        return best_score
+
+    def is_capture(self, board, move):
+        return self.capture_gain(board, move) > 0
+
+    def capture_gain(self, board, move):
+        """The value of the piece a move captures, or 0 if it isn't a capture"""
+        start, end, promotion = move
+        if end is None:
+            return 0
+        victim = board.squares[SQUARE_INDICES[end]]
+        if victim is not None:
+            return PIECE_VALUES[victim.type]
+        if end == board.enPassantTarget and board.squares[SQUARE_INDICES[start]].type == PAWN:
+            return PIECE_VALUES[PAWN]
+        return 0
+
+    def move_order_score(self, board, move, ply, pv_move):
+        if move == pv_move:
+            return ENGINE_INFINITY
+        start, end, promotion = move
+        score = 0
+        if promotion is not None:
+            score += ENGINE_CAPTURE_ORDER + PIECE_VALUES[promotion]
+        if end is not None:
+            victim = board.squares[SQUARE_INDICES[end]]
+            if victim is not None:
+                attacker = board.squares[SQUARE_INDICES[start]]
+                return score + ENGINE_CAPTURE_ORDER + PIECE_VALUES[victim.type] * 10 - PIECE_VALUES[attacker.type] // 10
+            if end == board.enPassantTarget and board.squares[SQUARE_INDICES[start]].type == PAWN:
+                return score + ENGINE_CAPTURE_ORDER + PIECE_VALUES[PAWN] * 10 - PIECE_VALUES[PAWN] // 10
+        if score:
+            return score
+        killers = self.killers[ply]
+        if move == killers[0]:
+            return ENGINE_KILLER_ORDER
+        if move == killers[1]:
+            return ENGINE_KILLER_ORDER - 1
+        return self.history.get((board.activeColour, move), 0)
+
+    def order_moves(self, board, moves, ply, pv_move=None):
+        """Returns the moves sorted best first: the principal variation move, then captures and promotions by MVV-LVA,
+        then killer moves, then the rest by the history heuristic"""
+        return sorted(moves, key=lambda move: self.move_order_score(board, move, ply, pv_move), reverse=True)
+
+    def record_cutoff(self, board, move, depth, ply):
+        """Remembers a quiet move that caused a beta cutoff, as a killer for this ply and in the history table"""
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+        key = (board.activeColour, move)
+        self.history[key] = min(self.history.get(key, 0) + depth * depth, ENGINE_KILLER_ORDER - 2)
+
+
+class WorkerEngine(Engine):
+    """An Engine run by one of a ParallelEngine's worker processes, which also stops when stop_event is set"""
+    def __init__(self, table, stop_event, tablebase=None):
+        super().__init__(table=table, tablebase=tablebase)
+        self.stopEvent = stop_event
+
+    def check_time(self):
+        super().check_time()
+        if self.stopEvent.is_set():
+            self.stopped = True
+
+
+def search_worker(index, board, shared_table, hash_mb, generation, depth, time_limit, stop_event, results,
+                  tablebase_location=None):
+    """Searches a board in a worker process, using a transposition table held in shared_table and the tablebases in
+    tablebase_location, if given. Puts (index, result, finished) on the results queue: the main worker (index 0) sends
+    each finished depth, and every worker sends its final result. The helpers search in a slightly different order from
+    the main worker, and half of them search one ply deeper, so that between them they fill the shared table with
+    different parts of the tree"""
+    table = TranspositionTable(hash_mb, buffer=shared_table)
+    table.generation = (generation - 1) & 63  # Engine.search moves the table on to the next generation
+    engine = WorkerEngine(table, stop_event, open_tablebase(tablebase_location) if tablebase_location else None)
+    start_depth = 1
+    if index > 0:
+        generator = random.Random(index)
+        for move in board.legal_moves():
+            engine.history[(board.activeColour, move)] = generator.randrange(ENGINE_KILLER_ORDER // 100)
+        if index % 2:
+            start_depth = 2
+            depth = depth + 1 if depth is not None else None
+
+    def report_iteration(result):
+        results.put((index, result, False))
+
+    result = engine.search(board, depth=depth, time_limit=time_limit, start_depth=start_depth,
+                           callback=report_iteration if index == 0 else None)
+    table.release()
+    results.put((index, result, True))
+
+
+class ParallelEngine:
+    """Searches with several worker processes at once, which share their results through a transposition table in
+    shared memory. The first to finish stops the rest, and the deepest search finished gives the best move, preferring
+    the main worker's on a tie. The table carries over between searches. Each worker opens the tablebase's
+    directory itself"""
+    def __init__(self, workers=None, hash_mb=ENGINE_DEFAULT_HASH_MB, tablebase=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.tablebase = tablebase
+        self.hashMb = hash_mb
+        self.sharedTable = multiprocessing.RawArray("B", table_buckets(hash_mb) * TT_BUCKET_BYTES)
+        self.table = TranspositionTable(hash_mb, buffer=self.sharedTable)
+        self.stopEvent = multiprocessing.Event()
+
+    def stop(self):
+        """Makes a running search return as soon as it can. Safe to call from another thread"""
+        self.stopEvent.set()
+
+    def search(self, board, depth=None, time_limit=None, callback=None):
+        """Searches a board in the same way as Engine.search. callback is called with the main worker's result after
+        each depth it finishes. The SearchResult returned counts the nodes of every worker"""
+        if depth is None and time_limit is None:
+            depth = ENGINE_DEFAULT_DEPTH
+        start_time = time.perf_counter()
+        self.stopEvent.clear()
+        self.table.new_search()
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=search_worker, daemon=True, args=(
+            index, board, self.sharedTable, self.hashMb, self.table.generation, depth, time_limit, self.stopEvent,
+            results, self.tablebase.directory if self.tablebase is not None else None))
+            for index in range(self.workers)]
+        for process in processes:
+            process.start()
+        finished = {}
+        while len(finished) < self.workers:
+            try:
+                index, result, final = results.get(timeout=0.1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes) and results.empty():
+                    break  # A worker died without reporting
+                continue
+            if final:
+                finished[index] = result
+                self.stopEvent.set()
+            elif callback is not None:
+                callback(result)
+        for process in processes:
+            process.join()
+        best = SearchResult()
+        for index in sorted(finished):
+            result = finished[index]
+            if result.bestMove is not None and (best.bestMove is None or result.depth > best.depth):
+                best = result
+        best.nodes = sum(result.nodes for result in finished.values())
+        best.elapsed = time.perf_counter() - start_time
+        return best
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Searches a position for the best move.")
+    parser.add_argument("--fen", default=START_BOARD, help="position to search (default: the starting board)")
+    parser.add_argument("--depth", type=int, default=None, help="number of plies to search to")
+    parser.add_argument("--time", type=float, default=None, help="number of seconds to search for")
+    parser.add_argument("--hash", type=int, default=ENGINE_DEFAULT_HASH_MB,
+                        help="transposition table size in megabytes (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes to search with, sharing the transposition table (default: 1)")
+    parser.add_argument("--compare", action="store_true",
+                        help="with more than one worker, also search with one first and compare the two")
+    parser.add_argument("--syzygy", default=None, help="directory of Syzygy tablebases to use")
+    parser.add_argument("--generator", default=DEFAULT_MOVE_GENERATOR,
+                        choices=(MOVE_GENERATOR_MAILBOX, MOVE_GENERATOR_BITBOARD), help="move generator to use")
+    args = parser.parse_args(args)
+    board = Board(args.generator)
+    board.load_fen(args.fen)
+
+    tablebase = Tablebase(args.syzygy) if args.syzygy else None
+    single = None
+    if args.compare and args.workers > 1:
+        single = Engine(args.hash, tablebase=tablebase).search(board, depth=args.depth, time_limit=args.time)
+    if args.workers > 1:
+        engine = ParallelEngine(args.workers, args.hash, tablebase=tablebase)
+    else:
+        engine = Engine(args.hash, tablebase=tablebase)
+
+    def print_iteration(result):
+        # The table's hit counts are kept by whichever process probes it, so are only known for a single process
+        hits = " hits %.1f%%" % (engine.table.hit_rate() * 100) if args.workers <= 1 else ""
+        print("depth %d score %s nodes %d nps %d time %.3fs hashfull %d%s pv %s" % (
+            result.depth, result.score_text(), result.nodes, result.nodes_per_second(), result.elapsed,
+            engine.table.fill() * 1000, hits, " ".join(move_to_text(move) for move in result.pv)))
+
+    result = engine.search(board, depth=args.depth, time_limit=args.time, callback=print_iteration)
+    if result.bestMove is None:
+        print("No legal moves")
+        return 1
+    if result.fromTablebase:
+        print("Tablebase: " + result.score_text())
+    print("Best move: %s (depth %d, %d nodes, %d nodes/s)" % (move_to_text(result.bestMove), result.depth, result.nodes,
+                                                             result.nodes_per_second()))
+    if single is not None:
+        for workers, compared in ((1, single), (args.workers, result)):
+            print("%d worker%s: depth %d, %d nodes in %.3fs, %d nodes/s" % (
+                workers, "s" if workers > 1 else "", compared.depth, compared.nodes, compared.elapsed,
+                compared.nodes_per_second()))
+        print("Nodes/s with %d workers: %.2f times one worker's" % (
+            args.workers, result.nodes_per_second() / max(single.nodes_per_second(), 1)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Static evaluation of a position: material plus piece-square tables, in centipawns, with an optional mobility term.
+lib.batch_evaluation computes the same scores for many positions at once with NumPy."""
+from lib.board import *
+
+PIECE_VALUES = {KING: 0, QUEEN: 900, ROOK: 500, BISHOP: 330, KNIGHT: 320, PAWN: 100}
+
+# Piece-square tables from White's point of view, laid out as the board looks from White's side (a8 first, h1 last)
+PIECE_SQUARE_TABLES = {
+    PAWN: (0, 0, 0, 0, 0, 0, 0, 0,
+           50, 50, 50, 50, 50, 50, 50, 50,
+           10, 10, 20, 30, 30, 20, 10, 10,
+           5, 5, 10, 25, 25, 10, 5, 5,
+           0, 0, 0, 20, 20, 0, 0, 0,
+           5, -5, -10, 0, 0, -10, -5, 5,
+           5, 10, 10, -20, -20, 10, 10, 5,
+           0, 0, 0, 0, 0, 0, 0, 0),
+    KNIGHT: (-50, -40, -30, -30, -30, -30, -40, -50,
+             -40, -20, 0, 0, 0, 0, -20, -40,
+             -30, 0, 10, 15, 15, 10, 0, -30,
+             -30, 5, 15, 20, 20, 15, 5, -30,
+             -30, 0, 15, 20, 20, 15, 0, -30,
+             -30, 5, 10, 15, 15, 10, 5, -30,
+             -40, -20, 0, 5, 5, 0, -20, -40,
+             -50, -40, -30, -30, -30, -30, -40, -50),
+    BISHOP: (-20, -10, -10, -10, -10, -10, -10, -20,
+             -10, 0, 0, 0, 0, 0, 0, -10,
+             -10, 0, 5, 10, 10, 5, 0, -10,
+             -10, 5, 5, 10, 10, 5, 5, -10,
+             -10, 0, 10, 10, 10, 10, 0, -10,
+             -10, 10, 10, 10, 10, 10, 10, -10,
+             -10, 5, 0, 0, 0, 0, 5, -10,
+             -20, -10, -10, -10, -10, -10, -10, -20),
+    ROOK: (0, 0, 0, 0, 0, 0, 0, 0,
+           5, 10, 10, 10, 10, 10, 10, 5,
+           -5, 0, 0, 0, 0, 0, 0, -5,
+           -5, 0, 0, 0, 0, 0, 0, -5,
+           -5, 0, 0, 0, 0, 0, 0, -5,
+           -5, 0, 0, 0, 0, 0, 0, -5,
+           -5, 0, 0, 0, 0, 0, 0, -5,
+           0, 0, 0, 5, 5, 0, 0, 0),
+    QUEEN: (-20, -10, -10, -5, -5, -10, -10, -20,
+            -10, 0, 0, 0, 0, 0, 0, -10,
+            -10, 0, 5, 5, 5, 5, 0, -10,
+            -5, 0, 5, 5, 5, 5, 0, -5,
+            0, 0, 5, 5, 5, 5, 0, -5,
+            -10, 5, 5, 5, 5, 5, 0, -10,
+            -10, 0, 5, 0, 0, 0, 0, -10,
+            -20, -10, -10, -5, -5, -10, -10, -20),
+    KING: (-30, -40, -40, -50, -50, -40, -40, -30,
+           -30, -40, -40, -50, -50, -40, -40, -30,
+           -30, -40, -40, -50, -50, -40, -40, -30,
+           -30, -40, -40, -50, -50, -40, -40, -30,
+           -20, -30, -30, -40, -40, -30, -30, -20,
+           -10, -20, -20, -20, -20, -20, -20, -10,
+           20, 20, 0, 0, 0, 0, 20, 20,
+           20, 30, 10, 0, 0, 10, 30, 20),
+}
+
+# Centipawns per square a piece attacks that isn't held by a piece of its own colour, the mobility proxy. Pawns and
+# kings aren't counted.
+MOBILITY_WEIGHTS = {KING: 0, QUEEN: 1, ROOK: 2, BISHOP: 4, KNIGHT: 4, PAWN: 0}
+
+# (file step, rank step) directions each counted piece type moves in, and whether it can go more than one step
+ORTHOGONAL_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+DIAGONAL_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+MOBILITY_DIRECTIONS = {
+    QUEEN: (ORTHOGONAL_DIRECTIONS + DIAGONAL_DIRECTIONS, True),
+    ROOK: (ORTHOGONAL_DIRECTIONS, True),
+    BISHOP: (DIAGONAL_DIRECTIONS, True),
+    KNIGHT: (((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)), False),
+}
+
+# Material plus piece-square value of each piece type on each square (a1 = 0), for each colour
+PIECE_SQUARE_VALUES = {
+    WHITE: dict((piece_type, [PIECE_VALUES[piece_type] + table[(7 - index // 8) * 8 + index % 8]
+                              for index in range(64)]) for piece_type, table in PIECE_SQUARE_TABLES.items()),
+    BLACK: dict((piece_type, [PIECE_VALUES[piece_type] + table[(index // 8) * 8 + index % 8]
+                              for index in range(64)]) for piece_type, table in PIECE_SQUARE_TABLES.items()),
+}
+
+
+def evaluate(board):
+    """Returns the static score of a board in centipawns, from the point of view of the side to move"""
+    score = 0
+    for colour, sign in ((WHITE, 1), (BLACK, -1)):
+        values = PIECE_SQUARE_VALUES[colour]
+        for piece_type, pieces in board.pieceLists[colour].items():
+            table = values[piece_type]
+            for piece in pieces:
+                score += sign * table[SQUARE_INDICES[piece.pos]]
+    return score if board.activeColour == WHITE else -score
+
+
+def material_score(board):
+    """Returns the material balance of a board in centipawns, from White's point of view"""
+    return sum(sign * PIECE_VALUES[piece_type] * len(pieces) for colour, sign in ((WHITE, 1), (BLACK, -1))
+               for piece_type, pieces in board.pieceLists[colour].items())
+
+
+def mobility_score(board):
+    """Returns the weighted difference in the number of squares White's and Black's pieces attack that aren't held by
+    their own pieces, ignoring pins and checks. Found by walking each piece's rays square by square"""
+    score = 0
+    squares = board.squares
+    for colour, sign in ((WHITE, 1), (BLACK, -1)):
+        for piece_type, (directions, slides) in MOBILITY_DIRECTIONS.items():
+            weight = MOBILITY_WEIGHTS[piece_type]
+            for piece in board.pieceLists[colour][piece_type]:
+                index = SQUARE_INDICES[piece.pos]
+                for file_step, rank_step in directions:
+                    file, rank = index % 8 + file_step, index // 8 + rank_step
+                    while 0 <= file < 8 and 0 <= rank < 8:
+                        target = squares[rank * 8 + file]
+                        if target is None or target.colour != colour:
+                            score += sign * weight
+                        if target is not None or not slides:
+                            break
+                        file, rank = file + file_step, rank + rank_step
+    return score
+
+
+def evaluate_with_mobility(board):
+    """Returns the static score of a board including the mobility term, from the point of view of the side to move.
+    Slower than evaluate; this is the reference that lib.batch_evaluation matches"""
+    score = mobility_score(board)
+    return evaluate(board) + (score if board.activeColour == WHITE else -score)
@@ -8,3 +8,7 @@ class InvalidMoveError(Exception):
 
 class AmbiguousSAN(Exception):
     pass
+
+
+class MissingTablebaseTable(Exception):
+    pass
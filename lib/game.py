@@ -1,4 +1,36 @@
+import re
+import time
+from collections import OrderedDict
+from functools import lru_cache
 from lib.board import *
+from lib.pgn import *
+from lib.history import *
+
+
+@lru_cache(maxsize=None)
+def get_current_location():
+    """Looks up the city the program is being run from for the Site tag of a new game. Only done the first time a game
+    is started without a site, and gives the PGN unknown value if the lookup fails or requests isn't installed"""
+    try:
+        from requests import get
+        geo_json = get(GEOLOCATION_URL, timeout=GEOLOCATION_TIMEOUT).json()
+        return geo_json["city"] + ", " + geo_json["region_name"] + " " + geo_json["country_code"]
+    except (ImportError, OSError, ValueError, KeyError, TypeError):
+        return PGN_UNKNOWN
+
+
+def get_current_date():
+    return time.strftime(PGN_DATE_FORMAT)
+
+
+SAN_MOVE_REGEX = re.compile(r"^([KQRBN])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([QRBN]))?$")
+# Bounded LRU cache of (position key, SAN) -> move, shared by every board. See san_to_move.
+SAN_CACHE = OrderedDict()
+
+# Game attributes that are filled in by replaying the movetext of a game read from PGN
+GAME_REPLAYED_ATTRIBUTES = ("moveRecords", "terminationMarker", "previousBoardStates", "board", "skippedAnnotations")
+# MoveRecord attributes that are worked out from the position, for a move played without them (see PendingSan)
+MOVE_RECORD_SAN_ATTRIBUTES = ("san", "capture", "check", "checkmate", "castle")
 
 
 class Game:
@@ -10,248 +42,406 @@ class Game:
                         PGN_WHITE: None,
                         PGN_BLACK: None,
                         PGN_RESULT: None}
-        self.moves = ""
-        self.movesRaw = []
-        self.previousBoardStates = []
+        self.pendingMovetext = None
+        self.moveRecords = []  # A MoveRecord for each move played
+        self.terminationMarker = None  # The result written at the end of the movetext, once the game is over
+        self.skippedAnnotations = 0  # Variations, and NAGs and comments before the first move, not kept from PGN
+        self.previousBoardStates = PositionHistory(START_BOARD, self.moveRecords)
         self.board = Board()
+        self.players = {WHITE: HUMAN, BLACK: HUMAN}
+
+    def __getattr__(self, name):
+        """Only called for attributes that aren't set, which for a game read from PGN are the ones that need its
+        movetext replaying first"""
+        if name in GAME_REPLAYED_ATTRIBUTES and self.__dict__.get("pendingMovetext") is not None:
+            self.replay_movetext()
+            return getattr(self, name)
+        raise AttributeError("'" + type(self).__name__ + "' object has no attribute '" + name + "'")
 
-    def new_game(self, event=PGN_DEFAULT_EVENT, site=CURRENT_LOCATION, date=CURRENT_DATE, white="White", black="Black",
-                 start_fen=START_BOARD):
-        """Resets a Game class based on the PGN parameters passed to it"""
+    def new_game(self, event=PGN_DEFAULT_EVENT, site=None, date=None, white="White", black="Black",
+                 start_fen=START_BOARD, white_player=HUMAN, black_player=HUMAN):
+        """Resets a Game class based on the PGN parameters passed to it. The site and date default to where and when the
+        game is being played. white_player and black_player say whether each side is played by a HUMAN or the
+        COMPUTER"""
+        self.players = {WHITE: white_player, BLACK: black_player}
         self.pgnTags[PGN_EVENT] = event
-        self.pgnTags[PGN_SITE] = site
-        self.pgnTags[PGN_DATE] = date
+        self.pgnTags[PGN_SITE] = site if site is not None else get_current_location()
+        self.pgnTags[PGN_DATE] = date if date is not None else get_current_date()
         self.pgnTags[PGN_WHITE] = white
         self.pgnTags[PGN_BLACK] = black
         self.pgnTags[PGN_RESULT] = IN_PROGRESS
         if start_fen != START_BOARD:
             self.pgnTags[PGN_FEN] = start_fen
-        self.moves = ""
-        self.movesRaw = []
-        self.previousBoardStates = [start_fen]
+        self.pendingMovetext = None
+        self.moveRecords = []
+        self.terminationMarker = None
+        self.previousBoardStates = PositionHistory(start_fen, self.moveRecords)
         self.board = Board()
         self.board.load_fen(start_fen)
 
-    def load_pgn(self, location):
-        """Loads a game from a PGN file (i.e. tags are updated and board is moved)"""
-        self.moves = ""
-        self.movesRaw = []
-        self.previousBoardStates = [START_BOARD]
-        pgn = open(location, "rt")
+    @property
+    def moves(self):
+        """The movetext of the game, e.g. "1. e4 e5 2. Nf3 Nc6 1-0", made from the move records"""
+        return self.movetext()
+
+    @property
+    def movesRaw(self):
+        """A (start, end, pawn_promotion) tuple for each move played"""
+        return [(record.start, record.end, record.promotion) for record in self.moveRecords]
+
+    def movetext(self, end_ply=None):
+        """Returns the movetext of the first end_ply moves (or of all of them, followed by the termination marker)"""
+        return " ".join(movetext_parts(self.moveRecords[:end_ply], self.termination_marker_at(end_ply)))
+
+    def move_lines(self, end_ply=None):
+        """Returns the movetext of the first end_ply moves (or all of them) as a list of lines, one per full move, like
+        ["1. e4 e5", "2. Nf3"]"""
         lines = []
-        for line in pgn:
-            if line[0] == PGN_OPEN_TAG:
-                line = line[1:-2]
-                tag = line.split()[0]
-                value = " ".join(line.split()[1:])[1:-1]
-                self.pgnTags[tag] = value
-                continue
-            lines.append(line.split())
+        for part in movetext_parts(self.moveRecords[:end_ply], self.termination_marker_at(end_ply)):
+            if part[0].isdigit() and part[-1] == "." or not lines:
+                lines.append(part)
+            else:
+                lines[-1] += " " + part
+        return lines
+
+    def termination_marker_at(self, end_ply):
+        if end_ply is None or end_ply >= len(self.moveRecords):
+            return self.terminationMarker
+        return None
+
+    def is_computer_turn(self):
+        """Returns True if the game is still going and the side to move is played by the computer"""
+        return self.players[self.board.activeColour] == COMPUTER and self.board.result == IN_PROGRESS
+
+    def play_move(self, start, end, pawn_promotion=None):
+        """Plays a legal move on the game's board and records it. Returns its MoveRecord"""
+        record = make_move_record(self.board, start, end, pawn_promotion=pawn_promotion)
+        self.moveRecords.append(record)
+        return record
+
+    def load_pgn(self, location):
+        """Loads the first game from a PGN file (i.e. tags are updated and board is moved)"""
+        with open(location, "rt") as pgn:
+            for tags, movetext in read_pgn_records(pgn):
+                self.load_pgn_record(tags, movetext)
+                return
+        self.load_pgn_record({}, "")
+
+    def load_pgn_record(self, tags, movetext):
+        """Sets the game up from a game's tag pairs and raw movetext. The movetext is only replayed when the moves,
+        positions or board of the game are first used. Instead of PGN text it can be a list of (start, end,
+        pawn_promotion) moves, each optionally followed by NAGs and a comment as movetext_tokens gives them, and the
+        list by a termination marker such as WHITE_WIN. Moves given like this are trusted to be legal: they are made
+        without checking, and their SAN is only worked out when it is first used"""
+        self.pgnTags = {PGN_EVENT: None,
+                        PGN_SITE: None,
+                        PGN_DATE: None,
+                        PGN_ROUND: None,
+                        PGN_WHITE: None,
+                        PGN_BLACK: None,
+                        PGN_RESULT: None}
+        self.pgnTags.update(tags)
+        for name in GAME_REPLAYED_ATTRIBUTES:
+            self.__dict__.pop(name, None)
+        self.pendingMovetext = movetext
+
+    def replay_movetext(self):
+        """Plays the pending movetext through a Board, filling in the moves, positions and board of the game. The NAGs
+        and comments of the main line are kept on the MoveRecords; variations, and anything before the first move, are
+        counted in skippedAnnotations. If a move can't be played the error is raised and the movetext is left pending"""
+        movetext = self.pendingMovetext
+        self.pendingMovetext = None
+        start_fen = self.pgnTags.get(PGN_FEN) or START_BOARD
+        self.moveRecords = []
+        self.terminationMarker = None
+        self.skippedAnnotations = 0
+        self.previousBoardStates = PositionHistory(start_fen, self.moveRecords)
         self.board = Board()
+        pending_san = PendingSan(start_fen)
         try:
-            if self.pgnTags[PGN_FEN] != START_BOARD:
-                self.board.load_fen(self.pgnTags[PGN_FEN])
-            else:
-                self.board.load_fen(START_BOARD)
-        except KeyError:
-            self.board.load_fen(START_BOARD)
-        moves = []
-        comment = False
-        for line in lines:
-            for part in line:
-                if not comment:
-                    if part[0] == PGN_OPEN_COMMENT:
-                        comment = True
-                        if part[-1] == PGN_CLOSE_COMMENT:
-                            comment = False
-                        continue
-                    moves.append(part)
+            self.board.load_fen(start_fen)
+            for token in movetext_tokens(movetext, annotations=True) if isinstance(movetext, str) else movetext:
+                if isinstance(token, tuple):
+                    self.moveRecords.append(make_unchecked_move_record(self.board, token, pending_san))
+                elif token in PGN_TERMINATION_MARKERS:
+                    self.board.result = token
+                    self.terminationMarker = token
+                    break
+                elif token[0] in (PGN_NAG, PGN_OPEN_COMMENT, PGN_OPEN_VARIATION):
+                    if token[0] == PGN_OPEN_VARIATION or not self.moveRecords:
+                        self.skippedAnnotations += 1
+                    elif token[0] == PGN_NAG:
+                        self.moveRecords[-1].nags.append(int(token[1:]))
+                    else:
+                        comment = token[1:-1]
+                        if self.moveRecords[-1].comment:
+                            comment = self.moveRecords[-1].comment + " " + comment
+                        self.moveRecords[-1].comment = comment
                 else:
-                    if part[-1] == PGN_CLOSE_COMMENT:
-                        comment = False
-        for move in moves:
-            if move in (WHITE_WIN, BLACK_WIN, DRAW):
-                self.board.result = move
-                self.moves += move
-                break
-            if move == str(self.board.moveClock) + ".":
-                continue
-            if move[:len(str(self.board.moveClock)) + 1] == str(self.board.moveClock) + ".":
-                move = move[len(str(self.board.moveClock)) + 1:]
-            start, end, promotion = san_to_lan(self.board.export_fen(), move)
-            prev_fen = self.board.export_fen()
-            if self.board.activeColour == WHITE:
-                self.moves += str(self.board.moveClock) + ". "
-            self.movesRaw.append((start, end))
-            self.board.make_move(start, end, pawn_promotion=promotion)
-            self.previousBoardStates.append(self.board.export_fen())
-            if self.board.check_check(self.board.activeColour):
-                check_checkmate = True
-            else:
-                check_checkmate = False
-            self.moves += lan_to_san(prev_fen, start, end, pawn_promotion=promotion,
-                                     check_checkmate=check_checkmate) + " "
+                    san = token.rstrip("".join(SAN_ANNOTATION_CHARACTERS))
+                    start, end, promotion = san_to_move(self.board, san)
+                    record = self.play_move(start, end, pawn_promotion=promotion)
+                    if token[len(san):] in PGN_SUFFIX_NAGS:
+                        record.nags.append(PGN_SUFFIX_NAGS[token[len(san):]])
+        except Exception:
+            for name in GAME_REPLAYED_ATTRIBUTES:
+                self.__dict__.pop(name, None)
+            self.pendingMovetext = movetext
+            raise
 
     def export_pgn(self, location):
-        output_text = ""
+        with open(location, "wt") as output_file:
+            self.write_pgn(output_file)
+
+    def write_pgn(self, stream):
+        """Writes the game as PGN to a text stream"""
         for key in self.pgnTags:
             value = self.pgnTags[key] if self.pgnTags[key] is not None else "-"
-            output_text += PGN_OPEN_TAG + key + ' "' + value + '"' + PGN_CLOSE_TAG + "\n"
-        output_text += "\n"
-        line_length = 0
-        for move_pointer in range(len(self.moves.split())):
-            part = self.moves.split()[move_pointer]
-            if part[0].isdigit() and part[-1] == ".":
-                if line_length + len(part) + len(self.moves.split()[move_pointer + 1]) > PGN_MAX_LINE_LENGTH:
-                    output_text += "\n" + part + " "
-                    line_length = len(part) + 1
-                else:
-                    output_text += part + " "
-                    line_length += len(part) + 1
-            else:
-                if line_length + len(part) > PGN_MAX_LINE_LENGTH:
-                    output_text += "\n" + part + " "
-                    line_length = len(part) + 1
-                else:
-                    output_text += part + " "
-                    line_length += len(part) + 1
-        if self.moves == "" or self.moves.split()[-1] not in (IN_PROGRESS, WHITE_WIN, BLACK_WIN, DRAW):
-            output_text += self.pgnTags[PGN_RESULT]
-        output_file = open(location, "wt")
-        output_file.write(output_text)
-        output_file.close()
+            stream.write(format_tag(key, value) + "\n")
+        stream.write("\n")
+        write_movetext(stream, movetext_parts(self.moveRecords, self.pgnTags[PGN_RESULT] or self.board.result,
+                                              annotations=True))
+
 
+def read_games(stream):
+    """Yields a Game for each game in a text stream of PGN, one at a time. Only the tags are read up front; the moves
+    of each game are replayed when they are first used"""
+    for tags, movetext in read_pgn_records(stream):
+        game = Game()
+        game.load_pgn_record(tags, movetext)
+        yield game
+
+
+def write_games(games, stream):
+    """Writes games as PGN to a text stream, separated by blank lines. Each game is written as soon as it is reached,
+    so games can be any iterable, such as read_games or a GameArchive, and memory use doesn't grow with their number"""
+    for number, game in enumerate(games):
+        if number:
+            stream.write("\n")
+        game.write_pgn(stream)
+
+
+def read_pgn_file(location):
+    """Yields a Game for each game in a PGN file, closing the file once they have all been read"""
+    with open(location, "rt") as pgn:
+        yield from read_games(pgn)
 
 
 def san_to_lan(fen, san):
     """Converts a move in Standard Algebraic Notation (SAN) to a start and end position (and a pawn promotion,
     if applicable)"""
-    promotion = None
-    if san in (SAN_CASTLE_QUEENSIDE, SAN_CASTLE_KINGSIDE, PGN_CASTLE_QUEENSIDE, PGN_CASTLE_KINGSIDE):
-        return san, None, promotion
     board = Board()
     board.load_fen(fen)
-    for annotation in SAN_ANNOTATIONS:
-        if san[-len(annotation):] == annotation:
-            san = san[:-len(annotation)]
-    if san[-1] == SAN_CHECKMATE:
-        san = san[:-1]
-    if san[-1] == SAN_CHECK:
-        san = san[:-1]
-    if san[-len(SAN_EN_PASSANT):] == SAN_EN_PASSANT:
-        san = san[:len(SAN_EN_PASSANT)]
-    if san[-2] == SAN_PROMOTION:
-        promotion = rev_dict(SAN_PIECE_ALIASES)[san[-1]]
-        san = san[:-2]
-    end_pos = san[-2:]
-    san = san[:-2]
-    if len(san) >= 1:
-        if san[-1] == SAN_CAPTURE:
-            san = san[:-1]
-    piece_type = PAWN
-    if len(san) >= 1:
-        if san[0].isupper():
-            piece_type = rev_dict(SAN_PIECE_ALIASES)[san[0]]
-            san = san[1:]
-    start_file = start_rank = None
-    for char in san:
-        if char.isalpha():
-            start_file = char
-        elif char.isdigit():
-            start_rank = int(char)
-    possible_start_pieces = []
-    for piece in board.activePieces:
-        if piece.type == piece_type:
-            if board.check_valid_move(piece.pos, end_pos, pawn_promotion=promotion):
-                if piece.colour == board.activeColour:
-                    possible_start_pieces.append(piece)
-    if len(possible_start_pieces) == 1:
-        return possible_start_pieces[0].pos, end_pos, promotion
-    elif len(possible_start_pieces) > 1:
-        new_possible_start_pieces = possible_start_pieces
-        if start_file is not None:
-            for piece in possible_start_pieces:
-                if piece.pos[0] != start_file:
-                    new_possible_start_pieces.remove(piece)
-        if len(new_possible_start_pieces) == 1:
-            return new_possible_start_pieces[0].pos, end_pos, promotion
-        else:
-            new_new_possible_start_pieces = new_possible_start_pieces
-            if start_rank is not None:
-                for piece in new_possible_start_pieces:
-                    if algebraic_to_xy(piece.pos)[1] != start_rank:
-                        new_new_possible_start_pieces.remove(piece)
-        if len(new_new_possible_start_pieces) == 1:
-            return possible_start_pieces[0].pos, end_pos, promotion
-        else:
-            raise AmbiguousSAN
-    else:
-        raise ValueError
+    return san_to_move(board, san)
+
+
+def san_to_move(board, san):
+    """Converts a move in SAN to the (start, end, pawn_promotion) tuple for it in board.legal_moves(), which can be
+    passed straight to make_move. Results are cached by position and SAN (see SAN_CACHE), so a move that has been seen
+    before in the same position doesn't need any moves generating"""
+    key = (board.zobristKey, san)
+    try:
+        move = SAN_CACHE[key]
+        SAN_CACHE.move_to_end(key)
+        return move
+    except KeyError:
+        pass
+    move = resolve_san(board, san)
+    SAN_CACHE[key] = move
+    if len(SAN_CACHE) > SAN_CACHE_SIZE:
+        SAN_CACHE.popitem(last=False)
+    return move
+
+
+def resolve_san(board, san):
+    """Matches a move in SAN against the legal moves of the board. Raises InvalidMoveError if no legal move matches and
+    AmbiguousSAN if more than one does"""
+    san = san.rstrip("".join(SAN_ANNOTATION_CHARACTERS))
+    san = san.rstrip(SAN_CHECK + SAN_CHECKMATE)
+    if san.endswith(SAN_EN_PASSANT):
+        san = san[:-len(SAN_EN_PASSANT)].rstrip(SAN_CHECK + SAN_CHECKMATE)
+    for castle_san, castle in ((SAN_CASTLE_KINGSIDE, SAN_CASTLE_KINGSIDE), (PGN_CASTLE_KINGSIDE, SAN_CASTLE_KINGSIDE),
+                               (SAN_CASTLE_QUEENSIDE, SAN_CASTLE_QUEENSIDE),
+                               (PGN_CASTLE_QUEENSIDE, SAN_CASTLE_QUEENSIDE)):
+        if san == castle_san:
+            move = (castle, None, None)
+            if move not in board.legal_moves():
+                raise InvalidMoveError
+            return move
+    match = SAN_MOVE_REGEX.match(san)
+    if match is None:
+        raise InvalidMoveError
+    piece_alias, start_file, start_rank, end_pos, promotion_alias = match.groups()
+    piece_type = FEN_PIECE_ALIASES[piece_alias] if piece_alias else PAWN
+    promotion = FEN_PIECE_ALIASES[promotion_alias] if promotion_alias else None
+    candidates = []
+    for move in board.legal_moves():
+        start, end, move_promotion = move
+        if end == end_pos and move_promotion == promotion and board.squares[SQUARE_INDICES[start]].type == piece_type \
+                and start_file in (None, start[0]) and start_rank in (None, start[1]):
+            candidates.append(move)
+    if not candidates:
+        raise InvalidMoveError
+    if len(candidates) > 1:
+        raise AmbiguousSAN
+    return candidates[0]
 
 
 def lan_to_san(fen, start_pos, end_pos, pawn_promotion=None, check_checkmate=True):
     """Converts a start position and end position to standard algebraic notation"""
     board = Board()
     board.load_fen(fen)
+    return make_move_san(board, start_pos, end_pos, pawn_promotion=pawn_promotion, check_checkmate=check_checkmate)
+
+
+class MoveRecord:
+    """One move of a game: the start, end and pawn promotion to pass to make_move, its SAN, the ply it was played on
+    (counting from 1 for White's first move, so a game from a FEN starts part way), the move number and colour that
+    played it, and what kind of move it was. nags (numeric annotation glyphs, e.g. 2 for "?") and comment annotate the
+    move when the game is written as PGN. With pending_san, the SAN and kind of move are left to be worked out by it
+    when first used"""
+    def __init__(self, start, end, promotion, san, ply, move_number, colour, capture=False, check=False,
+                 checkmate=False, castle=False, pending_san=None):
+        self.start = start
+        self.end = end
+        self.promotion = promotion
+        self.ply = ply
+        self.moveNumber = move_number
+        self.colour = colour
+        self.nags = []
+        self.comment = None
+        self.pendingSan = pending_san
+        if pending_san is None:
+            self.san = san
+            self.capture = capture
+            self.check = check
+            self.checkmate = checkmate
+            self.castle = castle
+        else:
+            pending_san.records.append(self)
+
+    def __getattr__(self, name):
+        """Only called for attributes that aren't set, which are the ones pendingSan works out"""
+        if name in MOVE_RECORD_SAN_ATTRIBUTES and self.__dict__.get("pendingSan") is not None:
+            self.pendingSan.fill()
+            return getattr(self, name)
+        raise AttributeError("'" + type(self).__name__ + "' object has no attribute '" + name + "'")
+
+
+class PendingSan:
+    """The moves of a game that were made without working out their SAN (see make_unchecked_move_record). The first
+    time any of them needs it, they are all played through a Board from start_fen in one pass to fill it in"""
+    def __init__(self, start_fen):
+        self.startFen = start_fen
+        self.records = []
+
+    def fill(self):
+        board = Board()
+        board.load_fen(self.startFen)
+        for record in self.records:
+            full_record = make_move_record(board, record.start, record.end, pawn_promotion=record.promotion)
+            for name in MOVE_RECORD_SAN_ATTRIBUTES:
+                setattr(record, name, getattr(full_record, name))
+            record.pendingSan = None
+        self.records = []
+
+
+def moves_to_san(board, moves):
+    """Converts a sequence of (start, end, pawn_promotion) moves to SAN in one pass, playing each of them on the board
+    in turn. The board is left after the last move"""
+    return [make_move_san(board, start, end, pawn_promotion=promotion) for start, end, promotion in moves]
+
+
+def movetext_parts(records, termination_marker=None, annotations=False):
+    """Yields the move numbers and SAN moves of a sequence of MoveRecords, like "1.", "e4", "e5", "2.", "Nf3", followed
+    by the termination marker if there is one. With annotations, each move is followed by its NAGs and comment, like
+    "$2", "{Nf3 was best}", and a Black move after a comment gets its move number again"""
+    annotated = False
+    for number, record in enumerate(records):
+        if record.colour == WHITE:
+            yield str(record.moveNumber) + "."
+        elif number == 0 or annotated:
+            yield str(record.moveNumber) + "..."
+        yield record.san
+        annotated = False
+        if annotations:
+            for nag in record.nags:
+                yield PGN_NAG + str(nag)
+            if record.comment:
+                yield PGN_OPEN_COMMENT + record.comment.replace(PGN_CLOSE_COMMENT, "") + PGN_CLOSE_COMMENT
+                annotated = True
+    if termination_marker is not None:
+        yield termination_marker
+
+
+def make_unchecked_move_record(board, move, pending_san):
+    """Makes a (start, end, pawn_promotion) move on the board without checking it is legal, and returns a MoveRecord
+    for it whose SAN is left to pending_san. Much quicker than make_move_record for moves already known to be legal"""
+    move_number = board.moveClock
+    colour = board.activeColour
+    ply = (move_number - 1) * 2 + (1 if colour == WHITE else 2)
+    board.make_move(move[0], move[1], check_valid=False, pawn_promotion=move[2])
+    return MoveRecord(move[0], move[1], move[2], None, ply, move_number, colour, pending_san=pending_san)
+
+
+def make_move_san(board, start_pos, end_pos, pawn_promotion=None, check_checkmate=True):
+    """Makes a legal move on the board and returns it in SAN (see make_move_record)"""
+    return make_move_record(board, start_pos, end_pos, pawn_promotion=pawn_promotion,
+                            check_checkmate=check_checkmate).san
+
+
+def make_move_record(board, start_pos, end_pos, pawn_promotion=None, check_checkmate=True):
+    """Makes a legal move on the board and returns a MoveRecord for it. Disambiguation uses the board's legal move
+    list, and mate is only looked for after a check, by seeing if the reply has any legal moves. Both lists are cached
+    on the board, so playing through a game like this generates each position's moves once. Raises InvalidMoveError if
+    the move isn't legal"""
+    castle = start_pos in (SAN_CASTLE_KINGSIDE, PGN_CASTLE_KINGSIDE, SAN_CASTLE_QUEENSIDE, PGN_CASTLE_QUEENSIDE)
     if start_pos in (SAN_CASTLE_KINGSIDE, PGN_CASTLE_KINGSIDE):
-        return SAN_CASTLE_KINGSIDE
-    if start_pos in (SAN_CASTLE_QUEENSIDE, PGN_CASTLE_QUEENSIDE):
-        return SAN_CASTLE_QUEENSIDE
-    start_piece = board.get_piece(start_pos)
-    start_type = start_piece.type
-    en_passant = False
-    try:
-        board.get_piece(end_pos)
-    except PieceNotFound:
-        capture = False
-        if start_type == PAWN and algebraic_to_xy(end_pos)[0] != algebraic_to_xy(start_pos)[0]:
-            capture = True
-            en_passant = True
-    else:
-        capture = True
-    promotion = False
-    if start_type == PAWN:
-        y_pos = algebraic_to_xy(end_pos)[1]
-        if y_pos == 8 and start_piece.colour == WHITE or y_pos == 1 and start_piece.colour == BLACK:
-            promotion = True
-    test_board = copy.deepcopy(board)
-    test_board.make_move(start_pos, end_pos, check_valid=False, pawn_promotion=pawn_promotion)
-    checkmate = False
-    if check_checkmate:
-        outcome = test_board.check_game_outcome()
-        checkmate = outcome in (WHITE_WIN, BLACK_WIN)
-    other_colour = WHITE if start_piece.colour == BLACK else BLACK
-    if not checkmate and test_board.check_check(other_colour):
-        check = True
+        move = (SAN_CASTLE_KINGSIDE, None, None)
+    elif start_pos in (SAN_CASTLE_QUEENSIDE, PGN_CASTLE_QUEENSIDE):
+        move = (SAN_CASTLE_QUEENSIDE, None, None)
     else:
-        check = False
-    ambiguous = []
-    for piece in board.activePieces:
-        if piece.colour == start_piece.colour and piece.type == start_type and piece.pos != start_pos:
-            if board.check_valid_move(piece.pos, end_pos):
-                ambiguous.append(piece.pos)
-    if ambiguous:
-        output = SAN_PIECE_ALIASES[start_type]
-        if start_piece.x not in [algebraic_to_xy(i)[0] for i in ambiguous]:
-            output += start_pos[0]
-        elif start_piece.y not in [algebraic_to_xy(i)[1] for i in ambiguous]:
-            output += start_pos[1]
-        else:
-            output += start_pos
+        move = (start_pos, end_pos, pawn_promotion)
+    legal_moves = board.legal_moves()
+    if move not in legal_moves:
+        raise InvalidMoveError
+    capture = False
+    if castle:
+        output = move[0]
     else:
-        output = SAN_PIECE_ALIASES[start_type]
-    if capture:
+        start_type = board.squares[SQUARE_INDICES[start_pos]].type
+        capture = board.squares[SQUARE_INDICES[end_pos]] is not None
+        en_passant = start_type == PAWN and not capture and start_pos[0] != end_pos[0]
+        capture = capture or en_passant
         if start_type == PAWN:
-            output = start_pos[0] + SAN_CAPTURE
+            output = start_pos[0] + SAN_CAPTURE if capture else ""
         else:
-            output += SAN_CAPTURE
-    output += end_pos
-    if promotion:
-        output += SAN_PROMOTION + SAN_PIECE_ALIASES[pawn_promotion]
-    if en_passant:
-        output += SAN_EN_PASSANT
-    if check:
-        output += SAN_CHECK
+            ambiguous = [start for start, end, promotion in legal_moves
+                         if end == end_pos and start != start_pos and board.squares[SQUARE_INDICES[start]].type ==
+                         start_type]
+            output = SAN_PIECE_ALIASES[start_type]
+            if ambiguous:
+                if start_pos[0] not in [pos[0] for pos in ambiguous]:
+                    output += start_pos[0]
+                elif start_pos[1] not in [pos[1] for pos in ambiguous]:
+                    output += start_pos[1]
+                else:
+                    output += start_pos
+            if capture:
+                output += SAN_CAPTURE
+        output += end_pos
+        if pawn_promotion is not None:
+            output += SAN_PROMOTION + SAN_PIECE_ALIASES[pawn_promotion]
+        if en_passant:
+            output += SAN_EN_PASSANT
+    move_number = board.moveClock
+    colour = board.activeColour
+    ply = (move_number - 1) * 2 + (1 if colour == WHITE else 2)
+    board.make_move(move[0], move[1], check_valid=False, pawn_promotion=move[2])
+    checkmate = board.inCheck and check_checkmate and not board.legal_moves()
     if checkmate:
         output += SAN_CHECKMATE
-    return output
+    elif board.inCheck:
+        output += SAN_CHECK
+    return MoveRecord(move[0], move[1], move[2], output, ply, move_number, colour, capture=capture,
+                      check=board.inCheck, checkmate=checkmate, castle=castle)
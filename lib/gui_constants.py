@@ -0,0 +1,30 @@
+import pygame
+from lib.constants import *
+
+# GUI constants and colours
+pygame.init()
+GUI_CAPTION = "Chess"
+GUI_FONT_NAME = "lib/font/libel-suit-rg.ttf"
+GUI_SCREEN_INFO = pygame.display.Info()
+GUI_WIDTH = GUI_SCREEN_INFO.current_w
+GUI_HEIGHT = GUI_SCREEN_INFO.current_h
+GUI_SQUARE_SIZE = 100 * GUI_HEIGHT // 1080
+GUI_BOARD_START_POS = (GUI_SQUARE_SIZE, GUI_SQUARE_SIZE)
+GUI_FPS = 60
+GUI_BOOK_HINT_MOVES = 3  # Number of book moves listed when viewing a game
+GUI_BG_COLOUR = (49, 46, 43)
+GUI_MOVE_TEXT_BOX_COLOUR = (40, 40, 40)
+GUI_LIGHT_COLOUR = (238, 238, 210)
+GUI_DARK_COLOUR = (118, 150, 86)
+GUI_TEXT_COLOUR = (255, 255, 255)
+GUI_HIGHLIGHT_COLOUR_1 = (186, 203, 68)
+GUI_HIGHLIGHT_COLOUR_2 = (247, 247, 131)
+GUI_BUTTON_COLOUR = GUI_DARK_COLOUR
+GUI_BUTTON_CLICKED_COLOUR = (123, 183, 55)
+# Info for finding the piece images in the filesystem.
+FILENAME_COLOUR = {WHITE: "white", BLACK: "black"}
+FILENAME_PIECETYPES = {KING: "king", QUEEN: "queen", ROOK: "rook", BISHOP: "bishop", KNIGHT: "knight", PAWN: "pawn"}
+
+# Display modes
+GUI = 1
+TEXT = 2
@@ -0,0 +1,58 @@
+from lib.board import *
+
+
+class PositionHistory:
+    """The positions of a game, one per ply starting with the start position, indexed like a list of FEN strings.
+    Only the start position and the moves are kept; a FEN is worked out when it's asked for by replaying the moves from
+    the nearest earlier checkpoint. Checkpoints are saved every POSITION_HISTORY_CHECKPOINT_INTERVAL plies as they are
+    passed, and the board of the last position looked up is kept, so stepping forwards or backwards through a game only
+    plays or undoes one move.
+
+    moves is the game's list of MoveRecords, which is shared rather than copied and is only ever appended to, so the
+    history grows as moves are played."""
+    def __init__(self, start_fen, moves):
+        self.moves = moves
+        self.checkpoints = [start_fen]
+        self.cursorBase = None
+        self.cursorIndex = None
+        self.cursorBoard = None
+        self.cursorFen = None
+
+    def __len__(self):
+        return len(self.moves) + 1
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("position history index out of range")
+        if index != self.cursorIndex:
+            self.move_cursor(index)
+        return self.cursorFen
+
+    def move_cursor(self, index):
+        """Sets up cursorBoard at the position after index moves. The cursor board is moved forwards or undone back to
+        the index if it was loaded at or before it, and otherwise reloaded from the nearest checkpoint"""
+        if self.cursorIndex is None or index < self.cursorBase or \
+                index // POSITION_HISTORY_CHECKPOINT_INTERVAL > self.cursorBase // POSITION_HISTORY_CHECKPOINT_INTERVAL:
+            checkpoint = min(index // POSITION_HISTORY_CHECKPOINT_INTERVAL, len(self.checkpoints) - 1)
+            self.cursorBoard = Board()
+            self.cursorBoard.load_fen(self.checkpoints[checkpoint])
+            self.cursorBase = self.cursorIndex = checkpoint * POSITION_HISTORY_CHECKPOINT_INTERVAL
+        board = self.cursorBoard
+        while self.cursorIndex > index:
+            board.pop()
+            self.cursorIndex -= 1
+        while self.cursorIndex < index:
+            record = self.moves[self.cursorIndex]
+            board.make_move(record.start, record.end, check_valid=False, pawn_promotion=record.promotion)
+            self.cursorIndex += 1
+            if self.cursorIndex == len(self.checkpoints) * POSITION_HISTORY_CHECKPOINT_INTERVAL:
+                self.checkpoints.append(board.export_fen())
+        self.cursorFen = board.export_fen()
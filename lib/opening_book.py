@@ -0,0 +1,202 @@
+"""Polyglot opening books: reading them to find book moves for a position, and building them from PGN games.
+
+A Polyglot book is a file of 16 byte big-endian entries (position key, move, weight, learn) sorted by key, where the
+key is the position's Polyglot Zobrist hash (Board.zobristKey). The book is memory-mapped and binary-searched, so
+opening it costs nothing however big it is, and a lookup only reads the few entries it needs.
+
+Run from the project folder, e.g.
+    python -m lib.opening_book build book.bin games.pgn more_games.pgn
+    python -m lib.opening_book probe book.bin
+    python -m lib.opening_book probe book.bin --fen "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+from collections import defaultdict
+from lib.game import *
+
+POLYGLOT_ENTRY = struct.Struct(">QHHI")
+POLYGLOT_PROMOTIONS = (None, KNIGHT, BISHOP, ROOK, QUEEN)
+POLYGLOT_MAX_WEIGHT = 0xFFFF
+# Polyglot writes castling as the king taking its own rook
+POLYGLOT_CASTLES = {("e1", "h1"): SAN_CASTLE_KINGSIDE, ("e1", "a1"): SAN_CASTLE_QUEENSIDE,
+                    ("e8", "h8"): SAN_CASTLE_KINGSIDE, ("e8", "a8"): SAN_CASTLE_QUEENSIDE}
+POLYGLOT_CASTLE_SQUARES = {(WHITE, SAN_CASTLE_KINGSIDE): ("e1", "h1"), (WHITE, SAN_CASTLE_QUEENSIDE): ("e1", "a1"),
+                           (BLACK, SAN_CASTLE_KINGSIDE): ("e8", "h8"), (BLACK, SAN_CASTLE_QUEENSIDE): ("e8", "a8")}
+
+
+def decode_polyglot_move(board, code):
+    """Converts a Polyglot move to a (start, end, pawn_promotion) move on the board"""
+    start = SQUARE_NAMES[code >> 6 & 63]
+    end = SQUARE_NAMES[code & 63]
+    promotion = POLYGLOT_PROMOTIONS[code >> 12 & 7] if code >> 12 & 7 < len(POLYGLOT_PROMOTIONS) else None
+    if (start, end) in POLYGLOT_CASTLES:
+        piece = board.squares[SQUARE_INDICES[start]]
+        if piece is not None and piece.type == KING:
+            return POLYGLOT_CASTLES[(start, end)], None, None
+    return start, end, promotion
+
+
+def encode_polyglot_move(board, move):
+    """Converts a (start, end, pawn_promotion) move on the board to a Polyglot move"""
+    start, end, promotion = move
+    if end is None:
+        start, end = POLYGLOT_CASTLE_SQUARES[(board.activeColour, start)]
+    return SQUARE_INDICES[end] | SQUARE_INDICES[start] << 6 | POLYGLOT_PROMOTIONS.index(promotion) << 12
+
+
+class BookEntry:
+    """A book move for a position: the (start, end, pawn_promotion) move, its weight and the book's learn value"""
+    def __init__(self, move, weight, learn=0):
+        self.move = move
+        self.weight = weight
+        self.learn = learn
+
+
+class OpeningBook:
+    """Read access to a Polyglot book file through a memory map"""
+    def __init__(self, location):
+        self.file = open(location, "rb")
+        self.count = os.fstat(self.file.fileno()).st_size // POLYGLOT_ENTRY.size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.count else b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self.count:
+            self.map.close()
+        self.file.close()
+
+    def entry(self, number):
+        """Returns the (key, move, weight, learn) of the book's entry with that number"""
+        return POLYGLOT_ENTRY.unpack_from(self.map, number * POLYGLOT_ENTRY.size)
+
+    def find_entries(self, board):
+        """Returns a BookEntry for each legal move the book has for the position on a board, highest weight first"""
+        key = board.zobristKey
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        legal_moves = board.legal_moves()
+        entries = []
+        while low < self.count:
+            entry_key, code, weight, learn = self.entry(low)
+            if entry_key != key:
+                break
+            move = decode_polyglot_move(board, code)
+            if move in legal_moves:
+                entries.append(BookEntry(move, weight, learn))
+            low += 1
+        entries.sort(key=lambda entry: entry.weight, reverse=True)
+        return entries
+
+    def choose_move(self, board, weighted=True, generator=random):
+        """Returns a book move for a board, or None if the position isn't in the book. With weighted, moves are picked
+        at random in proportion to their weights; otherwise the highest weighted move is"""
+        entries = self.find_entries(board)
+        if not entries:
+            return None
+        if not weighted:
+            return entries[0].move
+        total = sum(entry.weight for entry in entries)
+        if total == 0:
+            return generator.choice(entries).move
+        choice = generator.randrange(total)
+        for entry in entries:
+            choice -= entry.weight
+            if choice < 0:
+                return entry.move
+
+
+def open_book(location=OPENING_BOOK_LOCATION):
+    """Returns the OpeningBook at a location, or None if there isn't one"""
+    try:
+        return OpeningBook(location)
+    except OSError:
+        return None
+
+
+def build_book(pgn_locations, location, max_ply=OPENING_BOOK_MAX_PLY):
+    """Writes a Polyglot book of the moves played in the first max_ply plies of every game in some PGN files. A move
+    scores 2 for each game the side playing it won and 1 for each draw; moves that never scored are left out, and
+    weights are scaled down to fit if they need to be. Games that can't be read are skipped. Returns the number of
+    games used"""
+    scores = defaultdict(int)
+    games_used = 0
+    for pgn_location in pgn_locations:
+        for game in read_pgn_file(pgn_location):
+            result = game.pgnTags.get(PGN_RESULT)
+            try:
+                records = game.moveRecords
+            except (InvalidMoveError, AmbiguousSAN):
+                continue
+            games_used += 1
+            board = Board()
+            board.load_fen(game.pgnTags.get(PGN_FEN) or START_BOARD)
+            for record in records[:max_ply]:
+                move = (record.start, record.end, record.promotion)
+                if result == DRAW:
+                    score = 1
+                elif result == (WHITE_WIN if board.activeColour == WHITE else BLACK_WIN):
+                    score = 2
+                else:
+                    score = 0
+                scores[(board.zobristKey, encode_polyglot_move(board, move))] += score
+                board.make_move(record.start, record.end, check_valid=False, pawn_promotion=record.promotion)
+    largest = max(scores.values(), default=0)
+    scale = POLYGLOT_MAX_WEIGHT / largest if largest > POLYGLOT_MAX_WEIGHT else 1
+    entries = [(key, -max(int(score * scale), 1), code) for (key, code), score in scores.items() if score > 0]
+    entries.sort()
+    with open(location, "wb") as book:
+        for key, weight, code in entries:
+            book.write(POLYGLOT_ENTRY.pack(key, code, -weight, 0))
+    return games_used
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Builds and looks up Polyglot opening books.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="build a book from PGN files")
+    build_parser.add_argument("book", help="book file to write")
+    build_parser.add_argument("pgn", nargs="+", help="PGN files to read")
+    build_parser.add_argument("--plies", type=int, default=OPENING_BOOK_MAX_PLY,
+                              help="how many plies of each game to use (default: %(default)s)")
+    probe_parser = subparsers.add_parser("probe", help="list the book moves for a position")
+    probe_parser.add_argument("book", help="book file to read")
+    probe_parser.add_argument("--fen", default=START_BOARD, help="position to look up (default: the starting board)")
+    args = parser.parse_args(args)
+    if args.command == "build":
+        games = build_book(args.pgn, args.book, args.plies)
+        print("Built " + args.book + " from " + str(games) + " games")
+        return 0
+    board = Board()
+    board.load_fen(args.fen)
+    with OpeningBook(args.book) as book:
+        entries = book.find_entries(board)
+    if not entries:
+        print("Position not in book")
+        return 1
+    total = sum(entry.weight for entry in entries) or 1
+    for entry in entries:
+        start, end, promotion = entry.move
+        print("%-8s weight %5d (%.1f%%)" % (lan_to_san(args.fen, start, end, promotion), entry.weight,
+                                           100 * entry.weight / total))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
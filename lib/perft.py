@@ -0,0 +1,134 @@
+"""Perft (performance test) for the move generators: counts the leaf nodes of the legal move tree to a fixed depth,
+which can be checked against well known reference counts, and times how fast the tree was walked.
+
+Run from the project folder, e.g.
+    python -m lib.perft 4
+    python -m lib.perft 5 --fen "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1" --workers 8 --generator bitboard
+    python -m lib.perft 3 --suite
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from lib.board import *
+from lib.bitboard import *
+
+# Standard perft reference positions and their known node counts, indexed by depth - 1.
+PERFT_POSITIONS = [
+    ("Initial position", START_BOARD, [20, 400, 8902, 197281, 4865609]),
+    ("Kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862, 4085603]),
+    ("En passant and pins", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+    ("Promotions and castling", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("Promotion with check", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+    ("Middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+
+def perft(board, depth):
+    """Counts the leaf nodes of the legal move tree of a Board to the given depth, trying each move in place with
+    push/pop"""
+    moves = board.legal_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        board.push(*move)
+        nodes += perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def perft_bitboard(position, depth):
+    """The same as perft, but for a BitboardPosition"""
+    moves = position.legal_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        nodes += perft_bitboard(position.make_move(move), depth - 1)
+    return nodes
+
+
+def root_moves(fen, move_generator):
+    if move_generator == MOVE_GENERATOR_BITBOARD:
+        return BitboardPosition.from_fen(fen).legal_moves()
+    board = Board(move_generator)
+    board.load_fen(fen)
+    return list(board.legal_moves())
+
+
+def count_after_move(fen, move, depth, move_generator):
+    """Plays one root move on the position and counts the nodes below it. Module level so it can run in a worker
+    process"""
+    if move_generator == MOVE_GENERATOR_BITBOARD:
+        return perft_bitboard(BitboardPosition.from_fen(fen).make_move(move), depth - 1)
+    board = Board(move_generator)
+    board.load_fen(fen)
+    board.push(*move)
+    return perft(board, depth - 1)
+
+
+def divide(fen=START_BOARD, depth=1, move_generator=DEFAULT_MOVE_GENERATOR, workers=1):
+    """Returns a list of (move text, node count) pairs, one per legal root move. With more than one worker the root
+    moves are shared out between that many processes"""
+    moves = root_moves(fen, move_generator)
+    if depth < 1:
+        return []
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            counts = list(executor.map(count_after_move, [fen] * len(moves), moves, [depth] * len(moves),
+                                       [move_generator] * len(moves)))
+    else:
+        counts = [count_after_move(fen, move, depth, move_generator) for move in moves]
+    return [(move_to_text(move), count) for move, count in zip(moves, counts)]
+
+
+def run_perft(fen, depth, move_generator, workers, show_divide=True):
+    """Runs a divide, prints the breakdown and totals, and returns the total node count"""
+    start_time = time.perf_counter()
+    results = divide(fen, depth, move_generator, workers)
+    elapsed = time.perf_counter() - start_time
+    nodes = sum(count for move, count in results)
+    if show_divide:
+        for move, count in sorted(results):
+            print(move + ": " + str(count))
+        print()
+    print("Nodes searched: " + str(nodes))
+    print("Time: %.3fs (%d nodes/s)" % (elapsed, nodes / elapsed if elapsed > 0 else 0))
+    return nodes
+
+
+def run_suite(max_depth, move_generator, workers):
+    """Checks every reference position up to max_depth (or as deep as its known counts go). Returns True if all the
+    counts match"""
+    all_passed = True
+    for name, fen, counts in PERFT_POSITIONS:
+        for depth in range(1, min(max_depth, len(counts)) + 1):
+            print(name + ", depth " + str(depth) + ":")
+            nodes = run_perft(fen, depth, move_generator, workers, show_divide=False)
+            passed = nodes == counts[depth - 1]
+            all_passed = all_passed and passed
+            print(("PASS" if passed else "FAIL, expected " + str(counts[depth - 1])) + "\n")
+    return all_passed
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Counts legal move tree nodes to check and time move generation.")
+    parser.add_argument("depth", type=int, help="number of plies to search")
+    parser.add_argument("--fen", default=START_BOARD, help="position to search from (default: the starting board)")
+    parser.add_argument("--generator", default=DEFAULT_MOVE_GENERATOR,
+                        choices=(MOVE_GENERATOR_MAILBOX, MOVE_GENERATOR_BITBOARD), help="move generator to use")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes to split the root moves between")
+    parser.add_argument("--suite", action="store_true",
+                        help="check the reference positions up to the given depth instead of searching --fen")
+    args = parser.parse_args(args)
+    if args.suite:
+        return 0 if run_suite(args.depth, args.generator, args.workers) else 1
+    run_perft(args.fen, args.depth, args.generator, args.workers)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""Reading and writing PGN text one game at a time. Nothing here touches a Board: a game is read as its tag pairs plus
+its movetext left as raw text, so a file of any size can be streamed through in constant memory and jobs that only look
+at the tags never pay for replaying the moves."""
+import re
+from lib.constants import *
+
+PGN_TAG_REGEX = re.compile(r'\[\s*(\w+)\s*"((?:[^"\\]|\\.)*)"\s*\]')
+# Comments, variation brackets, NAGs and move numbers are matched so they can be skipped; anything else is a move or
+# a termination marker.
+PGN_MOVETEXT_REGEX = re.compile(r'\{[^}]*\}?|;[^\n]*|[()]|\$\d+|\d+\.+|[^\s{}();$]+')
+
+
+def parse_tag_line(line):
+    """Returns the (name, value) of a tag pair line such as [White "Kasparov, Garry"], or None if it isn't one"""
+    match = PGN_TAG_REGEX.match(line.strip())
+    if match is None:
+        return None
+    return match.group(1), re.sub(r'\\(.)', r'\1', match.group(2))
+
+
+def update_comment_state(line, in_comment):
+    """Returns whether a movetext line leaves the reader inside a {...} comment, given whether it started in one"""
+    for char in line:
+        if in_comment:
+            if char == PGN_CLOSE_COMMENT:
+                in_comment = False
+        elif char == PGN_OPEN_COMMENT:
+            in_comment = True
+        elif char == PGN_LINE_COMMENT:
+            break
+    return in_comment
+
+
+def read_pgn_records(stream):
+    """Yields a (tags, movetext) pair for each game in a text stream of PGN, where tags is a dict of the tag pairs in
+    the order they were given and movetext is the rest of the game as raw text. Only one game is held at a time"""
+    tags = {}
+    movetext_lines = []
+    in_comment = False
+    for line in stream:
+        if not in_comment:
+            if line[:1] == PGN_ESCAPE:
+                continue
+            if line.lstrip()[:1] == PGN_OPEN_TAG:
+                tag = parse_tag_line(line)
+                if tag is not None:
+                    # A tag pair after some movetext is the start of the next game
+                    if any(movetext_line.strip() for movetext_line in movetext_lines):
+                        yield tags, "".join(movetext_lines)
+                        tags = {}
+                        movetext_lines = []
+                    tags[tag[0]] = tag[1]
+                    continue
+        movetext_lines.append(line)
+        in_comment = update_comment_state(line, in_comment)
+    if tags or any(movetext_line.strip() for movetext_line in movetext_lines):
+        yield tags, "".join(movetext_lines)
+
+
+def read_pgn_file_records(location):
+    """Yields the (tags, movetext) of each game in a PGN file as read_pgn_records does, closing the file once they have
+    all been read"""
+    with open(location, "rt") as pgn:
+        yield from read_pgn_records(pgn)
+
+
+def movetext_tokens(movetext, annotations=False):
+    """Yields the moves of some PGN movetext as SAN, followed by the termination marker if there is one. Comments,
+    variations, move numbers and numeric annotation glyphs are skipped. With annotations, the NAGs ("$2") and comments
+    of the main line are yielded as well, each after the move it follows and with any comment written as {...}, and
+    PGN_OPEN_VARIATION is yielded once for each variation that is skipped"""
+    variation_depth = 0
+    for match in PGN_MOVETEXT_REGEX.finditer(movetext):
+        token = match.group()
+        if token == PGN_OPEN_VARIATION:
+            if annotations and variation_depth == 0:
+                yield token
+            variation_depth += 1
+        elif token == PGN_CLOSE_VARIATION:
+            variation_depth = max(variation_depth - 1, 0)
+        elif variation_depth > 0 or (token[0].isdigit() and token[-1] == ".") or token == SAN_EN_PASSANT:
+            continue
+        elif token[0] in (PGN_OPEN_COMMENT, PGN_LINE_COMMENT):
+            if annotations:
+                yield PGN_OPEN_COMMENT + token[1:].rstrip(PGN_CLOSE_COMMENT).strip() + PGN_CLOSE_COMMENT
+        elif token[0] == PGN_NAG:
+            if annotations:
+                yield token
+        else:
+            yield token
+
+
+def format_tag(name, value):
+    """Formats a tag pair line such as [White "Kasparov, Garry"], escaping any quotes and backslashes in the value"""
+    return PGN_OPEN_TAG + name + ' "' + value.replace("\\", "\\\\").replace('"', '\\"') + '"' + PGN_CLOSE_TAG
+
+
+def write_movetext(stream, parts, max_line_length=PGN_MAX_LINE_LENGTH):
+    """Writes movetext to a text stream from its parts (move numbers, moves and the termination marker), separated by
+    spaces and wrapped to lines of at most max_line_length. A move number is kept on the same line as the move after
+    it. Each line is written as soon as it is full, so this takes time and memory linear in the length of a line"""
+    line = []
+    line_length = 0
+    move_number = None
+    for part in parts:
+        if part[0].isdigit() and part[-1] == ".":
+            move_number = part
+            continue
+        if move_number is not None:
+            part = move_number + " " + part
+            move_number = None
+        if line and line_length + 1 + len(part) > max_line_length:
+            stream.write(" ".join(line) + "\n")
+            line = []
+            line_length = 0
+        line_length += len(part) + (1 if line else 0)
+        line.append(part)
+    if move_number is not None:
+        line.append(move_number)
+    if line:
+        stream.write(" ".join(line) + "\n")
@@ -0,0 +1,126 @@
+"""Bulk import of PGN files. The file is split into chunks of whole games by byte offset, the chunks are replayed in a
+pool of processes, and the games (or the error that stopped each one being replayed) are streamed back.
+
+Run from the project folder, e.g.
+    python -m lib.pgn_import games.pgn
+    python -m lib.pgn_import games.pgn --workers 8 --chunk-size 200 --unordered
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from lib.game import *
+
+
+def iter_pgn_chunks(location, chunk_size=PGN_IMPORT_CHUNK_SIZE):
+    """Yields a (first game number, start offset, end offset) for each run of chunk_size games in a PGN file. Game
+    boundaries are found the same way as read_pgn_records, but without decoding anything but the tag lines"""
+    chunk_start = 0
+    chunk_first_game = 1
+    games_in_chunk = 0
+    seen_movetext = False
+    in_comment = False
+    offset = 0
+    with open(location, "rb") as pgn:
+        for raw_line in pgn:
+            line = raw_line.decode("latin-1")
+            if not in_comment and line[:1] != PGN_ESCAPE and line.lstrip()[:1] == PGN_OPEN_TAG and \
+                    parse_tag_line(line) is not None:
+                if seen_movetext or games_in_chunk == 0:
+                    if games_in_chunk == chunk_size:
+                        yield chunk_first_game, chunk_start, offset
+                        chunk_first_game += games_in_chunk
+                        chunk_start = offset
+                        games_in_chunk = 0
+                    games_in_chunk += 1
+                    seen_movetext = False
+            elif line[:1] != PGN_ESCAPE or in_comment:
+                if line.strip():
+                    seen_movetext = True
+                    games_in_chunk = max(games_in_chunk, 1)
+                in_comment = update_comment_state(line, in_comment)
+            offset += len(raw_line)
+    if games_in_chunk:
+        yield chunk_first_game, chunk_start, offset
+
+
+def import_chunk(location, chunk, encoding=None):
+    """Reads and replays the games in one chunk of a PGN file. Returns a list of (game number, game, error) with the
+    error None for games that replayed and the game None for ones that didn't. Module level so it can run in a worker
+    process"""
+    first_game, start, end = chunk
+    with open(location, "rb") as pgn:
+        pgn.seek(start)
+        text = pgn.read(end - start).decode(encoding or "utf-8", errors="replace")
+    results = []
+    for game_number, game in enumerate(read_games(text.splitlines(True)), first_game):
+        try:
+            game.replay_movetext()
+        except Exception as error:
+            results.append((game_number, None, error))
+        else:
+            results.append((game_number, game, None))
+    return results
+
+
+def import_pgn(location, workers=None, chunk_size=PGN_IMPORT_CHUNK_SIZE, ordered=True, encoding=None):
+    """Yields (game number, game, error) for every game in a PGN file, replaying the games in a pool of worker
+    processes. Games are numbered from 1 in file order. If ordered is False the games of each chunk are yielded as soon
+    as that chunk is done, so they can come out of order. Only a few chunks per worker are in flight at once, so
+    memory use doesn't grow with the size of the file"""
+    workers = workers or os.cpu_count() or 1
+    chunks = iter_pgn_chunks(location, chunk_size)
+    if workers == 1:
+        for chunk in chunks:
+            yield from import_chunk(location, chunk, encoding)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(import_chunk, location, chunk, encoding))
+            while len(pending) >= workers * PGN_IMPORT_CHUNKS_IN_FLIGHT:
+                if ordered:
+                    yield from pending.popleft().result()
+                else:
+                    done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+                    pending = deque(future for future in pending if future in not_done)
+        if ordered:
+            while pending:
+                yield from pending.popleft().result()
+        else:
+            while pending:
+                done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+                pending = deque(future for future in pending if future in not_done)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Replays every game in a PGN file and reports any that fail.")
+    parser.add_argument("location", help="PGN file to import")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=PGN_IMPORT_CHUNK_SIZE,
+                        help="number of games handed to a process at a time")
+    parser.add_argument("--unordered", action="store_true", help="report games as they finish rather than in order")
+    parser.add_argument("--encoding", default=None, help="text encoding of the file (default: utf-8)")
+    args = parser.parse_args(args)
+    start_time = time.perf_counter()
+    games = errors = 0
+    for game_number, game, error in import_pgn(args.location, args.workers, args.chunk_size, not args.unordered,
+                                               args.encoding):
+        games += 1
+        if error is not None:
+            errors += 1
+            print("Game " + str(game_number) + ": " + type(error).__name__ + " " + str(error), file=sys.stderr)
+    elapsed = time.perf_counter() - start_time
+    print("Games: " + str(games) + " (" + str(errors) + " failed)")
+    print("Time: %.3fs (%d games/s)" % (elapsed, games / elapsed if elapsed > 0 else 0))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
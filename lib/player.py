@@ -0,0 +1,56 @@
+"""The COMPUTER player. Kept apart from lib.game so that the rules and PGN code can be used without loading the
+engine, the opening book or the tablebases."""
+from lib.game import *
+from lib.engine import Engine, SearchResult
+from lib.tablebase import WDL_WIN
+
+
+class ComputerPlayer:
+    """Chooses moves for the side to move: from the opening book while the game is in it, otherwise by searching with
+    the engine, which also scores endgames from the tablebases. Either can be None. The engine is only made when it's
+    first needed, and keeps its tables from one move to the next"""
+    def __init__(self, book=None, tablebase=None):
+        self.book = book
+        self.tablebase = tablebase
+        self.engine = None
+
+    def find_move(self, board, history_keys=None, time_limit=ENGINE_DEFAULT_TIME, depth=None):
+        """Searches for the best move on a board without playing it, and returns the SearchResult. The board is used
+        in place, so to run this in another thread pass it a board.copy(), with the original's repetition_keys() as
+        history_keys so that repetitions are still seen"""
+        if self.book is not None:
+            move = self.book.choose_move(board)
+            if move is not None:
+                return SearchResult(move, pv=[move], from_book=True)
+        if self.engine is None:
+            self.engine = Engine(tablebase=self.tablebase)
+        return self.engine.search(board, depth=depth, time_limit=time_limit, history_keys=history_keys)
+
+    def stop(self):
+        """Makes a running find_move return early with the best move found so far"""
+        if self.engine is not None:
+            self.engine.stop()
+
+    def play_move(self, game, time_limit=ENGINE_DEFAULT_TIME, depth=None):
+        """Finds the best move for the side to move in a Game and plays it. Returns the SearchResult, whose bestMove
+        is None if there was no move to play"""
+        result = self.find_move(game.board, time_limit=time_limit, depth=depth)
+        if result.bestMove is not None:
+            start, end, promotion = result.bestMove
+            game.play_move(start, end, pawn_promotion=promotion)
+        return result
+
+    def check_outcome(self, board, players):
+        """Returns the result of a position: board.check_game_outcome, or if that is still IN_PROGRESS, the result the
+        tablebases adjudicate. players is the Game's players; games with a HUMAN player are never adjudicated, so they
+        can be played on. A position the tablebases show to be drawn, or only won past the fifty-move rule, is
+        adjudicated a draw. Probes the board in place, so can be run on a copy in another thread"""
+        result = board.check_game_outcome()
+        if result != IN_PROGRESS or self.tablebase is None or HUMAN in players.values():
+            return result
+        wdl = self.tablebase.probe_wdl(board)
+        if wdl is None:
+            return IN_PROGRESS
+        if abs(wdl) < WDL_WIN:
+            return DRAW
+        return WHITE_WIN if (wdl > 0) == (board.activeColour == WHITE) else BLACK_WIN
@@ -0,0 +1,240 @@
+"""An on-disk index of the positions reached in a collection of PGN games, for finding every game that passes through a
+position.
+
+Positions are identified by their Zobrist key (Board.zobristKey). The index is a directory of segment files, each a
+sorted array of (position key, game id, ply) postings that is searched by binary search through a memory map, plus a
+manifest recording which PGN file and game numbers each segment came from. Adding games writes new segments instead
+of rewriting old ones, and compact merges them back into one. Segments are written under a temporary name and renamed
+into place, and the manifest is saved after each one, so an interrupted run leaves an index of the games added so far.
+
+Run from the project folder, e.g.
+    python -m lib.position_index add index_dir games.pgn
+    python -m lib.position_index find index_dir "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2"
+    python -m lib.position_index compact index_dir
+"""
+import argparse
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+from lib.game import *
+
+POSITION_INDEX_MAGIC = b"PYCHIDX\x01"
+POSITION_INDEX_HEADER = struct.Struct("<8sQ")
+POSITION_INDEX_POSTING = struct.Struct("<QII")
+POSITION_INDEX_MANIFEST = "manifest.json"
+
+
+def pgn_position_keys(tags, movetext):
+    """Plays a game's movetext (as given by read_pgn_records) and returns the position key before the first move and
+    after each move"""
+    board = Board()
+    board.load_fen(tags.get(PGN_FEN) or START_BOARD)
+    keys = [board.zobristKey]
+    for move in movetext_tokens(movetext):
+        if move in PGN_TERMINATION_MARKERS:
+            break
+        start, end, promotion = san_to_move(board, move)
+        board.make_move(start, end, check_valid=False, pawn_promotion=promotion)
+        keys.append(board.zobristKey)
+    return keys
+
+
+def write_segment(location, postings):
+    """Sorts a list of (position key, game id, ply) postings and writes them to a segment file"""
+    postings.sort()
+    with open(location + ".tmp", "wb") as segment:
+        segment.write(POSITION_INDEX_HEADER.pack(POSITION_INDEX_MAGIC, len(postings)))
+        for posting in postings:
+            segment.write(POSITION_INDEX_POSTING.pack(*posting))
+    os.replace(location + ".tmp", location)
+
+
+class IndexSegment:
+    """Read access to one segment file through a memory map"""
+    def __init__(self, location):
+        self.file = open(location, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = POSITION_INDEX_HEADER.unpack_from(self.map, 0)
+        if magic != POSITION_INDEX_MAGIC:
+            self.close()
+            raise ValueError(location + " is not a position index segment")
+
+    def __iter__(self):
+        for number in range(self.count):
+            yield self.posting(number)
+
+    def posting(self, number):
+        return POSITION_INDEX_POSTING.unpack_from(self.map, POSITION_INDEX_HEADER.size +
+                                                  number * POSITION_INDEX_POSTING.size)
+
+    def lookup(self, key):
+        """Returns the (game id, ply) of every posting for a position key"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.posting(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        results = []
+        while low < self.count:
+            posting_key, game_id, ply = self.posting(low)
+            if posting_key != key:
+                break
+            results.append((game_id, ply))
+            low += 1
+        return results
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class PositionIndex:
+    """A position index directory, created if it doesn't exist. Games are numbered from 0 in the order they were
+    added, across every PGN file added"""
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        manifest_location = os.path.join(directory, POSITION_INDEX_MANIFEST)
+        if os.path.exists(manifest_location):
+            with open(manifest_location, "rt") as manifest:
+                self.manifest = json.load(manifest)
+        else:
+            self.manifest = {"games": 0, "segments": [], "sources": []}
+        self.segments = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        for segment in self.segments.values():
+            segment.close()
+        self.segments = {}
+
+    def save_manifest(self):
+        manifest_location = os.path.join(self.directory, POSITION_INDEX_MANIFEST)
+        with open(manifest_location + ".tmp", "wt") as manifest:
+            json.dump(self.manifest, manifest)
+        os.replace(manifest_location + ".tmp", manifest_location)
+
+    def new_segment_name(self):
+        number = max([int(name.split("-")[1].split(".")[0]) for name in self.manifest["segments"]] + [0]) + 1
+        return "segment-%06d.idx" % number
+
+    def get_segment(self, name):
+        if name not in self.segments:
+            self.segments[name] = IndexSegment(os.path.join(self.directory, name))
+        return self.segments[name]
+
+    def flush_postings(self, postings, source, next_game):
+        """Writes the postings of a source's games up to next_game to a new segment and saves the manifest with it"""
+        if postings:
+            name = self.new_segment_name()
+            write_segment(os.path.join(self.directory, name), postings)
+            self.manifest["segments"].append(name)
+        source["games"] = next_game - source["firstGame"]
+        self.manifest["games"] = next_game
+        self.save_manifest()
+
+    def add_pgn(self, location, segment_postings=POSITION_INDEX_SEGMENT_POSTINGS):
+        """Indexes every game in a PGN file, streaming it one game at a time and writing a new segment whenever
+        segment_postings positions have been collected. Games that can't be replayed still take a game id but have no
+        positions. Returns a list of (game id, error) for them. If this is interrupted, the manifest records the games
+        up to the last segment written as coming from the file"""
+        game_id = self.manifest["games"]
+        source = {"location": os.path.abspath(location), "firstGame": game_id, "games": 0}
+        self.manifest["sources"].append(source)
+        postings = []
+        errors = []
+        for tags, movetext in read_pgn_file_records(location):
+            try:
+                keys = pgn_position_keys(tags, movetext)
+            except Exception as error:
+                errors.append((game_id, error))
+            else:
+                postings.extend((key, game_id, ply) for ply, key in enumerate(keys))
+            game_id += 1
+            if len(postings) >= segment_postings:
+                self.flush_postings(postings, source, game_id)
+                postings = []
+        self.flush_postings(postings, source, game_id)
+        return errors
+
+    def lookup(self, position):
+        """Returns a sorted list of (game id, ply) for every time a position (a FEN or a Board) was reached"""
+        if isinstance(position, str):
+            board = Board()
+            board.load_fen(position)
+            position = board
+        results = []
+        for name in self.manifest["segments"]:
+            results.extend(self.get_segment(name).lookup(position.zobristKey))
+        return sorted(results)
+
+    def game_source(self, game_id):
+        """Returns the PGN file a game id came from and its number in that file, counting from 1"""
+        for source in self.manifest["sources"]:
+            if source["firstGame"] <= game_id < source["firstGame"] + source["games"]:
+                return source["location"], game_id - source["firstGame"] + 1
+        raise IndexError("no game with id " + str(game_id))
+
+    def compact(self):
+        """Merges all the segments into one, so lookups only need one binary search"""
+        if len(self.manifest["segments"]) <= 1:
+            return
+        old_names = self.manifest["segments"]
+        name = self.new_segment_name()
+        location = os.path.join(self.directory, name)
+        merged = heapq.merge(*[self.get_segment(old_name) for old_name in old_names])
+        count = 0
+        with open(location + ".tmp", "wb") as segment:
+            segment.write(POSITION_INDEX_HEADER.pack(POSITION_INDEX_MAGIC, 0))
+            for posting in merged:
+                segment.write(POSITION_INDEX_POSTING.pack(*posting))
+                count += 1
+            segment.seek(0)
+            segment.write(POSITION_INDEX_HEADER.pack(POSITION_INDEX_MAGIC, count))
+        os.replace(location + ".tmp", location)
+        self.manifest["segments"] = [name]
+        self.save_manifest()
+        self.close()
+        for old_name in old_names:
+            os.remove(os.path.join(self.directory, old_name))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Builds and searches an index of the positions in PGN games.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add = subparsers.add_parser("add", help="add the games in a PGN file to the index")
+    add.add_argument("index")
+    add.add_argument("pgn")
+    find = subparsers.add_parser("find", help="list the games that reach a position")
+    find.add_argument("index")
+    find.add_argument("fen")
+    compact = subparsers.add_parser("compact", help="merge the index's segments into one")
+    compact.add_argument("index")
+    args = parser.parse_args(args)
+    with PositionIndex(args.index) as index:
+        if args.command == "add":
+            for game_id, error in index.add_pgn(args.pgn):
+                location, game_number = index.game_source(game_id)
+                print("Game " + str(game_number) + " not indexed: " + type(error).__name__ + " " + str(error),
+                      file=sys.stderr)
+        elif args.command == "find":
+            for game_id, ply in index.lookup(args.fen):
+                location, game_number = index.game_source(game_id)
+                print(location + " game " + str(game_number) + ", ply " + str(ply))
+        else:
+            index.compact()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
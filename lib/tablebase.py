@@ -0,0 +1,710 @@
+"""Probing Syzygy endgame tablebases: win/draw/loss (WDL, .rtbw files) and distance to zeroing (DTZ, .rtbz files) for
+positions with few pieces.
+
+Each table file is memory-mapped the first time a position needs it, and only the block holding the position is
+decompressed. Within a table, positions are numbered by where their pieces stand (after using the board's symmetries
+to cut down the number of positions), and the results are stored in blocks compressed by recursive pairing followed by
+a canonical Huffman code.
+
+WDL scores are from the side to move's point of view: 2 for a win, 1 for a win that the fifty-move rule turns into a
+draw (a "cursed" win), 0 for a draw, -1 for a loss saved by the fifty-move rule and -2 for a loss. DTZ is the number of
+plies until the next capture or pawn move (with checkmate counting as one) when the winning side plays to reach it as
+fast as possible and the losing side as slowly, positive when winning and negative when losing.
+
+Run from the project folder, e.g.
+    python -m lib.tablebase syzygy_dir "8/8/8/8/8/8/2Rk4/1K6 b - - 0 1"
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+from math import comb
+from lib.board import *
+
+TABLEBASE_WDL_SUFFIX = ".rtbw"
+TABLEBASE_DTZ_SUFFIX = ".rtbz"
+TABLEBASE_WDL_MAGIC = b"\x71\xe8\x23\x5d"
+TABLEBASE_DTZ_MAGIC = b"\xd7\x66\x0c\xa5"
+TABLEBASE_MATE_RANK = 4000  # How probe_root ranks a mating move, above any other
+
+WDL_LOSS = -2
+WDL_BLESSED_LOSS = -1
+WDL_DRAW = 0
+WDL_CURSED_WIN = 1
+WDL_WIN = 2
+
+# Piece letters in the order they appear in table names, and the piece codes the tables use (Black's have 8 added)
+TABLEBASE_PIECE_ORDER = (KING, QUEEN, ROOK, BISHOP, KNIGHT, PAWN)
+TABLEBASE_PIECE_CODES = {PAWN: 1, KNIGHT: 2, BISHOP: 3, ROOK: 4, QUEEN: 5, KING: 6}
+TABLEBASE_BLACK = 8
+
+# Flags in the header of each table
+TABLE_SPLIT = 1  # WDL tables with different material on each side store both sides to move
+TABLE_HAS_PAWNS = 2
+# Flags of each compressed block of results
+PAIRS_STM = 1  # Which side to move a DTZ table is for
+PAIRS_MAPPED = 2  # DTZ values are looked up in a map
+PAIRS_WIN_PLIES = 4  # DTZ values of wins are in plies instead of moves
+PAIRS_LOSS_PLIES = 8
+PAIRS_WIDE = 16  # The DTZ map has 16 bit entries
+PAIRS_SINGLE_VALUE = 128  # Every position has the same value
+
+# The DTZ map for each file holds four lists, for wins, losses, cursed wins and blessed losses
+DTZ_MAP_LISTS = {WDL_LOSS: 1, WDL_BLESSED_LOSS: 3, WDL_DRAW: 0, WDL_CURSED_WIN: 2, WDL_WIN: 0}
+
+
+def square_offset_a1h8(square):
+    """How far a square is above the a1-h8 diagonal: positive above it, negative below and 0 on it"""
+    return (square >> 3) - (square & 7)
+
+
+def build_index_tables():
+    """Works out the tables used to number the positions in a tablebase"""
+    # Squares below the a1-h8 diagonal, numbered 0-27
+    map_b1h1h7 = [0] * 64
+    code = 0
+    for square in range(64):
+        if square_offset_a1h8(square) < 0:
+            map_b1h1h7[square] = code
+            code += 1
+    # Squares of the a1-d1-d4 triangle numbered 0-9, with the ones on the diagonal last
+    map_a1d1d4 = [0] * 64
+    diagonal = []
+    code = 0
+    for square in range(28):
+        if square_offset_a1h8(square) < 0 and square & 7 <= 3:
+            map_a1d1d4[square] = code
+            code += 1
+        elif not square_offset_a1h8(square) and square & 7 <= 3:
+            diagonal.append(square)
+    for square in diagonal:
+        map_a1d1d4[square] = code
+        code += 1
+    # The 462 ways to place two kings with the first in the a1-d1-d4 triangle and, if it's on the diagonal, the
+    # second not above it. Positions with both kings on the diagonal come last
+    map_kk = [[0] * 64 for index in range(10)]
+    both_on_diagonal = []
+    code = 0
+    for index in range(10):
+        for first in range(28):
+            if map_a1d1d4[first] != index or (not index and first != 1):
+                continue  # b1 is the only square mapped to 0
+            for second in range(64):
+                if abs((first >> 3) - (second >> 3)) <= 1 and abs((first & 7) - (second & 7)) <= 1:
+                    continue  # The kings would be next to each other
+                if not square_offset_a1h8(first) and square_offset_a1h8(second) > 0:
+                    continue
+                if not square_offset_a1h8(first) and not square_offset_a1h8(second):
+                    both_on_diagonal.append((index, second))
+                else:
+                    map_kk[index][second] = code
+                    code += 1
+    for index, second in both_on_diagonal:
+        map_kk[index][second] = code
+        code += 1
+    # Pawn squares a2-h7 numbered 47 down to 0, edge files and low ranks first, so the leading pawn of a group is the
+    # one with the highest number. lead_pawn_index numbers the positions of a group of leading pawns for each file
+    map_pawns = [0] * 64
+    lead_pawn_index = [[0] * 64 for count in range(6)]
+    lead_pawns_size = [[0] * 4 for count in range(6)]
+    available = 47
+    for count in range(1, 6):
+        for file in range(4):
+            index = 0
+            for rank in range(1, 7):
+                square = rank * 8 + file
+                if count == 1:
+                    map_pawns[square] = available
+                    map_pawns[square ^ 7] = available - 1
+                    available -= 2
+                lead_pawn_index[count][square] = index
+                index += comb(map_pawns[square], count - 1)
+            lead_pawns_size[count][file] = index
+    return map_b1h1h7, map_a1d1d4, map_kk, map_pawns, lead_pawn_index, lead_pawns_size
+
+
+MAP_B1H1H7, MAP_A1D1D4, MAP_KK, MAP_PAWNS, LEAD_PAWN_INDEX, LEAD_PAWNS_SIZE = build_index_tables()
+
+
+def material_name(board, colour):
+    """Returns the pieces of one side as they are written in table names, e.g. KRP"""
+    return "".join(SAN_PIECE_ALIASES[piece_type] or "P" for piece_type in TABLEBASE_PIECE_ORDER
+                   for piece in board.pieceLists[colour][piece_type])
+
+
+def is_zeroing(board, move):
+    """Returns True if a move resets the fifty-move counter, i.e. is a capture or a pawn move"""
+    start, end, promotion = move
+    if end is None:
+        return False
+    return board.squares[SQUARE_INDICES[end]] is not None or board.squares[SQUARE_INDICES[start]].type == PAWN
+
+
+class PairsData:
+    """One compressed set of results in a table (there is one for each side to move stored, and with pawns, one for
+    each file of the leading pawn), with the description of how positions are numbered in it"""
+    def __init__(self):
+        self.flags = 0
+        self.pieces = []
+        self.groupLen = []
+        self.groupIdx = []
+        self.mapIdx = [0, 0, 0, 0]
+
+
+class TablebaseTable:
+    """A WDL or DTZ table file, opened and read the first time it is probed. name is its material, such as KRvK, with
+    White's pieces first"""
+    def __init__(self, location, name, dtz):
+        self.location = location
+        self.dtz = dtz
+        self.file = None
+        self.map = None
+        white, black = name.split("v")
+        self.symmetric = white == black
+        self.pieceCount = len(white) + len(black)
+        self.hasPawns = "P" in name
+        self.hasUniquePieces = any(side.count(letter) == 1 for side in (white, black) for letter in "QRBNP")
+        # With pawns on both sides, the side with fewer pawns leads, as that compresses better
+        white_first = not black.count("P") or white.count("P") and black.count("P") >= white.count("P")
+        self.pawnCount = (white.count("P"), black.count("P")) if white_first else (black.count("P"), white.count("P"))
+        self.sides = 2 if not dtz and not self.symmetric else 1
+        self.files = 4 if self.hasPawns else 1
+        self.pairs = None
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+            self.map = None
+
+    def get(self, stm, file):
+        return self.pairs[stm % self.sides][file if self.hasPawns else 0]
+
+    def load(self):
+        """Maps the file and reads its header"""
+        self.file = open(self.location, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:4] != (TABLEBASE_DTZ_MAGIC if self.dtz else TABLEBASE_WDL_MAGIC):
+            self.close()
+            raise ValueError(self.location + " is not a Syzygy table")
+        data = self.map
+        offset = 5  # After the magic number and the flags byte
+        self.pairs = [[PairsData() for file in range(self.files)] for side in range(self.sides)]
+        both_pawns = self.hasPawns and self.pawnCount[1] > 0
+        for file in range(self.files):
+            order = [[data[offset] & 0xF, data[offset + 1] & 0xF if both_pawns else 0xF],
+                     [data[offset] >> 4, data[offset + 1] >> 4 if both_pawns else 0xF]]
+            offset += 1 + both_pawns
+            for index in range(self.pieceCount):
+                for side in range(self.sides):
+                    self.get(side, file).pieces.append(data[offset] >> 4 if side else data[offset] & 0xF)
+                offset += 1
+            for side in range(self.sides):
+                self.set_groups(self.get(side, file), order[side], file)
+        offset += offset & 1
+        for file in range(self.files):
+            for side in range(self.sides):
+                offset = self.set_sizes(self.get(side, file), offset)
+        if self.dtz:
+            offset = self.set_dtz_map(offset)
+        for file in range(self.files):
+            for side in range(self.sides):
+                pairs = self.get(side, file)
+                pairs.sparseIndex = offset
+                offset += pairs.sparseIndexSize * 6
+        for file in range(self.files):
+            for side in range(self.sides):
+                pairs = self.get(side, file)
+                pairs.blockLength = offset
+                offset += pairs.blockLengthSize * 2
+        for file in range(self.files):
+            for side in range(self.sides):
+                pairs = self.get(side, file)
+                offset = (offset + 0x3F) & ~0x3F
+                pairs.data = offset
+                offset += pairs.numBlocks * pairs.sizeofBlock
+
+    def set_groups(self, pairs, order, file):
+        """Splits the pieces into the groups whose positions are numbered together: the leading group (the leading
+        pawns, or with no pawns, three unique pieces or else the kings), then each set of the same piece. Works out
+        what each group's number is multiplied by in the position's index"""
+        first_length = 0 if self.hasPawns else 3 if self.hasUniquePieces else 2
+        pairs.groupLen = [1]
+        for index in range(1, self.pieceCount):
+            first_length -= 1
+            if first_length > 0 or pairs.pieces[index] == pairs.pieces[index - 1]:
+                pairs.groupLen[-1] += 1
+            else:
+                pairs.groupLen.append(1)
+        groups = len(pairs.groupLen)
+        pairs.groupIdx = [0] * (groups + 1)
+        both_pawns = self.hasPawns and self.pawnCount[1] > 0
+        next_group = 2 if both_pawns else 1
+        free_squares = 64 - pairs.groupLen[0] - (pairs.groupLen[1] if both_pawns else 0)
+        index = 1
+        position = 0
+        while next_group < groups or position == order[0] or position == order[1]:
+            if position == order[0]:
+                pairs.groupIdx[0] = index
+                if self.hasPawns:
+                    index *= LEAD_PAWNS_SIZE[pairs.groupLen[0]][file]
+                else:
+                    index *= 31332 if self.hasUniquePieces else 462
+            elif position == order[1]:
+                pairs.groupIdx[1] = index
+                index *= comb(48 - pairs.groupLen[0], pairs.groupLen[1])
+            else:
+                pairs.groupIdx[next_group] = index
+                index *= comb(free_squares, pairs.groupLen[next_group])
+                free_squares -= pairs.groupLen[next_group]
+                next_group += 1
+            position += 1
+        pairs.groupIdx[groups] = index
+
+    def set_sizes(self, pairs, offset):
+        """Reads the description of a set of compressed blocks, and works out the length of each symbol and the
+        canonical Huffman code's bases. Returns the offset after it"""
+        data = self.map
+        pairs.flags = data[offset]
+        offset += 1
+        if pairs.flags & PAIRS_SINGLE_VALUE:
+            pairs.numBlocks = pairs.sparseIndexSize = pairs.blockLengthSize = pairs.sizeofBlock = 0
+            pairs.minSymLen = data[offset]  # The value every position has
+            return offset + 1
+        table_size = pairs.groupIdx[len(pairs.groupLen)]
+        pairs.sizeofBlock = 1 << data[offset]
+        pairs.span = 1 << data[offset + 1]
+        pairs.sparseIndexSize = (table_size + pairs.span - 1) // pairs.span
+        padding = data[offset + 2]
+        pairs.numBlocks = struct.unpack_from("<I", data, offset + 3)[0]
+        pairs.blockLengthSize = pairs.numBlocks + padding
+        pairs.maxSymLen = data[offset + 7]
+        pairs.minSymLen = data[offset + 8]
+        offset += 9
+        lengths = pairs.maxSymLen - pairs.minSymLen + 1
+        pairs.lowestSym = struct.unpack_from("<%dH" % lengths, data, offset)
+        # Symbols with longer codes have lower values; base64[i] is the lowest code of length minSymLen + i,
+        # left-aligned in 64 bits
+        base64 = [0] * lengths
+        for index in range(lengths - 2, -1, -1):
+            base64[index] = (base64[index + 1] + pairs.lowestSym[index] - pairs.lowestSym[index + 1]) // 2
+        pairs.base64 = [(base << (64 - index - pairs.minSymLen)) & 0xFFFFFFFFFFFFFFFF
+                        for index, base in enumerate(base64)]
+        offset += lengths * 2
+        symbols = struct.unpack_from("<H", data, offset)[0]
+        offset += 2
+        pairs.btree = offset
+        # Each symbol stands for a pair of symbols, or is a leaf holding a value; symlen is how many values less one
+        pairs.symlen = [0] * symbols
+        visited = [False] * symbols
+        for symbol in range(symbols):
+            if visited[symbol]:
+                continue
+            stack = [symbol]
+            while stack:
+                current = stack[-1]
+                visited[current] = True
+                left, right = self.btree_pair(pairs, current)
+                if right == 0xFFF:
+                    pairs.symlen[current] = 0
+                    stack.pop()
+                    continue
+                pending = [child for child in (left, right) if not visited[child]]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                pairs.symlen[current] = pairs.symlen[left] + pairs.symlen[right] + 1
+                stack.pop()
+        return offset + symbols * 3 + (symbols & 1)
+
+    def set_dtz_map(self, offset):
+        """Reads the maps DTZ values are looked up in, if any. Returns the offset after them"""
+        data = self.map
+        self.dtzMap = offset
+        for file in range(self.files):
+            pairs = self.get(0, file)
+            if pairs.flags & PAIRS_MAPPED:
+                if pairs.flags & PAIRS_WIDE:
+                    offset += offset & 1
+                    for index in range(4):
+                        pairs.mapIdx[index] = (offset - self.dtzMap) // 2 + 1
+                        offset += 2 * struct.unpack_from("<H", data, offset)[0] + 2
+                else:
+                    for index in range(4):
+                        pairs.mapIdx[index] = offset - self.dtzMap + 1
+                        offset += data[offset] + 1
+        return offset + (offset & 1)
+
+    def btree_pair(self, pairs, symbol):
+        """Returns the left and right symbols a symbol stands for (for a leaf, its value and 0xFFF)"""
+        offset = pairs.btree + 3 * symbol
+        first, second, third = self.map[offset], self.map[offset + 1], self.map[offset + 2]
+        return ((second & 0xF) << 8) | first, (third << 4) | (second >> 4)
+
+    def decompress(self, pairs, index):
+        """Returns the value stored for the position with an index"""
+        if pairs.flags & PAIRS_SINGLE_VALUE:
+            return pairs.minSymLen
+        data = self.map
+        # The sparse index gives the block and offset within it of every span'th position, from which the block holding
+        # this one is found by stepping through the block lengths
+        entry = index // pairs.span
+        block, offset = struct.unpack_from("<IH", data, pairs.sparseIndex + 6 * entry)
+        offset += index % pairs.span - pairs.span // 2
+        while offset < 0:
+            block -= 1
+            offset += struct.unpack_from("<H", data, pairs.blockLength + 2 * block)[0] + 1
+        while offset > struct.unpack_from("<H", data, pairs.blockLength + 2 * block)[0]:
+            offset -= struct.unpack_from("<H", data, pairs.blockLength + 2 * block)[0] + 1
+            block += 1
+        # Read symbols from the start of the block until reaching the one that covers the offset
+        pointer = pairs.data + block * pairs.sizeofBlock
+        buffer = struct.unpack_from(">Q", data, pointer)[0]
+        pointer += 8
+        buffer_size = 64
+        base64 = pairs.base64
+        symlen = pairs.symlen
+        while True:
+            length = 0
+            while buffer < base64[length]:
+                length += 1
+            symbol = ((buffer - base64[length]) >> (64 - length - pairs.minSymLen)) + pairs.lowestSym[length]
+            if offset < symlen[symbol] + 1:
+                break
+            offset -= symlen[symbol] + 1
+            length += pairs.minSymLen
+            buffer = (buffer << length) & 0xFFFFFFFFFFFFFFFF
+            buffer_size -= length
+            if buffer_size <= 32:
+                buffer_size += 32
+                buffer |= struct.unpack_from(">I", data, pointer)[0] << (64 - buffer_size)
+                pointer += 4
+        # Expand the symbol's pairs down to the single value at the offset
+        while symlen[symbol]:
+            left, right = self.btree_pair(pairs, symbol)
+            if offset < symlen[left] + 1:
+                symbol = left
+            else:
+                offset -= symlen[left] + 1
+                symbol = right
+        return self.btree_pair(pairs, symbol)[0]
+
+    def probe(self, board, black_stronger, wdl=WDL_DRAW):
+        """Returns the value stored for a board: its WDL score, or for a DTZ table its DTZ in plies (which is for the
+        side to move given by wdl). A DTZ table only holds one side to move, and for the other None is returned"""
+        if self.map is None:
+            self.load()
+        symmetric_black_to_move = self.symmetric and board.activeColour == BLACK
+        flip = symmetric_black_to_move or black_stronger
+        flip_colour = TABLEBASE_BLACK if flip else 0
+        flip_squares = 56 if flip else 0
+        stm = int(flip) ^ (board.activeColour == BLACK)
+        squares = []
+        pieces = []
+        lead_pawns = []
+        table_file = 0
+        if self.hasPawns:
+            # The pawns of the colour the table's first piece belongs to lead
+            lead_code = self.get(0, 0).pieces[0] ^ flip_colour
+            lead_colour = BLACK if lead_code & TABLEBASE_BLACK else WHITE
+            lead_pawns = board.pieceLists[lead_colour][PAWN]
+            squares = sorted(SQUARE_INDICES[pawn.pos] ^ flip_squares for pawn in lead_pawns)
+            pieces = [lead_code] * len(squares)
+            leader = max(range(len(squares)), key=lambda number: (MAP_PAWNS[squares[number]], -number))
+            squares[0], squares[leader] = squares[leader], squares[0]
+            table_file = min(squares[0] & 7, 7 - (squares[0] & 7))
+        if self.dtz:
+            flags = self.get(stm, table_file).flags
+            if (flags & PAIRS_STM) != stm and not (self.symmetric and not self.hasPawns):
+                return None
+        lead_count = len(squares)
+        for colour in (WHITE, BLACK):
+            for piece_type, piece_list in board.pieceLists[colour].items():
+                if piece_list is lead_pawns:
+                    continue
+                code = (TABLEBASE_PIECE_CODES[piece_type] + (TABLEBASE_BLACK if colour == BLACK else 0)) ^ flip_colour
+                for piece in piece_list:
+                    squares.append(SQUARE_INDICES[piece.pos] ^ flip_squares)
+                    pieces.append(code)
+        pairs = self.get(stm, table_file)
+        # Put the pieces in the same order as the table's
+        for index in range(lead_count, len(squares) - 1):
+            for other in range(index, len(squares)):
+                if pairs.pieces[index] == pieces[other]:
+                    pieces[index], pieces[other] = pieces[other], pieces[index]
+                    squares[index], squares[other] = squares[other], squares[index]
+                    break
+        if squares[0] & 7 > 3:
+            squares = [square ^ 7 for square in squares]
+        if self.hasPawns:
+            index = LEAD_PAWN_INDEX[lead_count][squares[0]]
+            squares[1:lead_count] = sorted(squares[1:lead_count], key=lambda square: MAP_PAWNS[square])
+            for number in range(1, lead_count):
+                index += comb(MAP_PAWNS[squares[number]], number)
+        else:
+            if squares[0] >> 3 > 3:
+                squares = [square ^ 56 for square in squares]
+            for number in range(pairs.groupLen[0]):
+                if not square_offset_a1h8(squares[number]):
+                    continue
+                if square_offset_a1h8(squares[number]) > 0:
+                    squares[number:] = [((square >> 3) | (square << 3)) & 63 for square in squares[number:]]
+                break
+            if self.hasUniquePieces:
+                adjust1 = int(squares[1] > squares[0])
+                adjust2 = int(squares[2] > squares[0]) + int(squares[2] > squares[1])
+                if square_offset_a1h8(squares[0]):
+                    index = (MAP_A1D1D4[squares[0]] * 63 + (squares[1] - adjust1)) * 62 + squares[2] - adjust2
+                elif square_offset_a1h8(squares[1]):
+                    index = (6 * 63 + (squares[0] >> 3) * 28 + MAP_B1H1H7[squares[1]]) * 62 + squares[2] - adjust2
+                elif square_offset_a1h8(squares[2]):
+                    index = 6 * 63 * 62 + 4 * 28 * 62 + (squares[0] >> 3) * 7 * 28 + \
+                        ((squares[1] >> 3) - adjust1) * 28 + MAP_B1H1H7[squares[2]]
+                else:
+                    index = 6 * 63 * 62 + 4 * 28 * 62 + 4 * 7 * 28 + (squares[0] >> 3) * 7 * 6 + \
+                        ((squares[1] >> 3) - adjust1) * 6 + (squares[2] >> 3) - adjust2
+            else:
+                index = MAP_KK[MAP_A1D1D4[squares[0]]][squares[1]]
+        # Number the remaining groups, each by the squares not taken by earlier groups
+        index *= pairs.groupIdx[0]
+        start = pairs.groupLen[0]
+        remaining_pawns = self.hasPawns and self.pawnCount[1] > 0
+        for group in range(1, len(pairs.groupLen)):
+            length = pairs.groupLen[group]
+            group_squares = sorted(squares[start:start + length])
+            squares[start:start + length] = group_squares
+            group_index = 0
+            for number, square in enumerate(group_squares):
+                adjust = sum(1 for earlier in squares[:start] if square > earlier)
+                group_index += comb(square - adjust - 8 * remaining_pawns, number + 1)
+            remaining_pawns = False
+            index += group_index * pairs.groupIdx[group]
+            start += length
+        value = self.decompress(pairs, index)
+        if not self.dtz:
+            return value - 2
+        flags = pairs.flags
+        if flags & PAIRS_MAPPED:
+            map_index = pairs.mapIdx[DTZ_MAP_LISTS[wdl]] + value
+            if flags & PAIRS_WIDE:
+                value = struct.unpack_from("<H", self.map, self.dtzMap + 2 * map_index)[0]
+            else:
+                value = self.map[self.dtzMap + map_index]
+        if wdl == WDL_WIN and not flags & PAIRS_WIN_PLIES or wdl == WDL_LOSS and not flags & PAIRS_LOSS_PLIES or \
+                wdl in (WDL_CURSED_WIN, WDL_BLESSED_LOSS):
+            value *= 2
+        return value + 1
+
+
+class Tablebase:
+    """The Syzygy tables in a directory. Tables are only opened when first probed. Probes return None for positions
+    the tables don't cover: too many pieces, a missing table or castling rights"""
+    def __init__(self, directory):
+        self.directory = directory
+        self.wdlTables = {}
+        self.dtzTables = {}
+        self.maxPieces = 0
+        for filename in os.listdir(directory):
+            name, suffix = os.path.splitext(filename)
+            if suffix not in (TABLEBASE_WDL_SUFFIX, TABLEBASE_DTZ_SUFFIX) or name.count("v") != 1:
+                continue
+            tables = self.wdlTables if suffix == TABLEBASE_WDL_SUFFIX else self.dtzTables
+            tables[name] = TablebaseTable(os.path.join(directory, filename), name, suffix == TABLEBASE_DTZ_SUFFIX)
+            if suffix == TABLEBASE_WDL_SUFFIX:
+                self.maxPieces = max(self.maxPieces, len(name) - 1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        for table in list(self.wdlTables.values()) + list(self.dtzTables.values()):
+            table.close()
+
+    def covers(self, board):
+        """Returns True if a board has few enough pieces to be probed and no castling rights"""
+        return len(board.activePieces) <= self.maxPieces and \
+            not any(board.canCastle[colour][side] for colour in (WHITE, BLACK) for side in (KINGSIDE, QUEENSIDE))
+
+    def find_table(self, tables, board):
+        """Returns the table for a board's material, and whether Black has the pieces listed first in its name. Raises
+        MissingTablebaseTable if there isn't one"""
+        white, black = material_name(board, WHITE), material_name(board, BLACK)
+        if white + "v" + black in tables:
+            return tables[white + "v" + black], False
+        if black + "v" + white in tables:
+            return tables[black + "v" + white], True
+        raise MissingTablebaseTable(white + "v" + black)
+
+    def probe_wdl_table(self, board):
+        if len(board.activePieces) == 2:
+            return WDL_DRAW  # Bare kings
+        table, black_stronger = self.find_table(self.wdlTables, board)
+        return table.probe(board, black_stronger)
+
+    def search_wdl(self, board, zeroing_pawn_moves=False):
+        """Returns (WDL score, True if a capture (or with zeroing_pawn_moves, a pawn move) is the best move or
+        the only kind of move, so that a DTZ table can't be used). Captures are tried first, as the tables assume
+        there's no en passant and may hold "don't care" values where a capture wins"""
+        best_score = WDL_LOSS
+        legal_moves = board.legal_moves()
+        searched = 0
+        for move in legal_moves:
+            start, end, promotion = move
+            capture = end is not None and (board.squares[SQUARE_INDICES[end]] is not None or (
+                end == board.enPassantTarget and board.squares[SQUARE_INDICES[start]].type == PAWN))
+            if not capture and not (zeroing_pawn_moves and end is not None and
+                                    board.squares[SQUARE_INDICES[start]].type == PAWN):
+                continue
+            searched += 1
+            board.push(*move)
+            score = -self.search_wdl(board)[0]
+            board.pop()
+            if score > best_score:
+                best_score = score
+                if score >= WDL_WIN:
+                    return score, True
+        no_more_moves = searched and searched == len(legal_moves)
+        score = best_score if no_more_moves else self.probe_wdl_table(board)
+        if best_score >= score:
+            return best_score, best_score > WDL_DRAW or bool(no_more_moves)
+        return score, False
+
+    def probe_wdl(self, board):
+        """Returns the WDL score of a board for the side to move, or None if it can't be probed"""
+        if not self.covers(board):
+            return None
+        stack_size = len(board.moveStack)
+        try:
+            return self.search_wdl(board)[0]
+        except MissingTablebaseTable:
+            undo_to(board, stack_size)
+            return None
+
+    def probe_dtz(self, board):
+        """Returns the DTZ of a board in plies for the side to move (0 for a draw), or None if it can't be probed. A
+        DTZ of 1 or -1 means the next move zeroes the fifty-move counter, or is checkmate. Cursed wins and blessed
+        losses have 100 added to their size"""
+        if not self.covers(board):
+            return None
+        stack_size = len(board.moveStack)
+        try:
+            return self.search_dtz(board)
+        except MissingTablebaseTable:
+            undo_to(board, stack_size)
+            return None
+
+    def search_dtz(self, board):
+        wdl, zeroing_best = self.search_wdl(board, zeroing_pawn_moves=True)
+        if wdl == WDL_DRAW:
+            return 0
+        if zeroing_best:
+            return dtz_before_zeroing(wdl)
+        table, black_stronger = self.find_table(self.dtzTables, board)
+        dtz = table.probe(board, black_stronger, wdl)
+        if dtz is not None:
+            return (dtz + 100 * (wdl in (WDL_BLESSED_LOSS, WDL_CURSED_WIN))) * (1 if wdl > 0 else -1)
+        # The table only holds the other side to move, so look one move ahead for the best DTZ
+        best_dtz = None
+        for move in board.legal_moves():
+            zeroing = is_zeroing(board, move)
+            board.push(*move)
+            if zeroing:
+                dtz = -dtz_before_zeroing(self.search_wdl(board)[0])
+            else:
+                dtz = -self.search_dtz(board)
+            if dtz == 1 and board.inCheck and not board.legal_moves():
+                best_dtz = 1  # The move mates
+            elif not zeroing and dtz:
+                dtz += 1 if dtz > 0 else -1
+            board.pop()
+            if dtz and (dtz > 0) == (wdl > 0) and (best_dtz is None or dtz < best_dtz):
+                best_dtz = dtz
+        return best_dtz if best_dtz is not None else -1
+
+    def probe_root(self, board):
+        """Returns the best move for a board according to the tables, its WDL score for the side to move and the DTZ
+        after it, or None if the board can't be probed or has no legal moves. Winning, the move that zeroes or mates
+        soonest while staying inside the fifty-move rule is chosen; losing, the one that puts that off the longest"""
+        if not self.covers(board) or not board.legal_moves():
+            return None
+        stack_size = len(board.moveStack)
+        try:
+            wdl = self.search_wdl(board)[0]
+            best = None
+            for move in board.legal_moves():
+                zeroing = is_zeroing(board, move)
+                board.push(*move)
+                mate = board.inCheck and not board.legal_moves()
+                if mate:
+                    dtz = 1
+                elif zeroing:
+                    dtz = dtz_before_zeroing(-self.search_wdl(board)[0])
+                else:
+                    dtz = -self.search_dtz(board)
+                    dtz += 1 if dtz > 0 else -1 if dtz < 0 else 0
+                board.pop()
+                rank = TABLEBASE_MATE_RANK if mate else root_move_rank(dtz, board.halfMoveClock, zeroing)
+                if best is None or rank > best[0]:
+                    best = (rank, move, dtz)
+        except MissingTablebaseTable:
+            undo_to(board, stack_size)
+            return None
+        return best[1], wdl, best[2]
+
+
+def undo_to(board, stack_size):
+    """Takes back the moves a probe had tried on a board when it found a table missing"""
+    while len(board.moveStack) > stack_size:
+        board.pop()
+
+
+def open_tablebase(location=TABLEBASE_LOCATION):
+    """Returns a Tablebase for a directory, or None if there isn't one"""
+    if not os.path.isdir(location):
+        return None
+    return Tablebase(location)
+
+
+def dtz_before_zeroing(wdl):
+    """The DTZ of a position whose best move zeroes the fifty-move counter"""
+    return {WDL_WIN: 1, WDL_CURSED_WIN: 101, WDL_BLESSED_LOSS: -101, WDL_LOSS: -1}.get(wdl, 0)
+
+
+def root_move_rank(dtz, half_move_clock, zeroing):
+    """Orders root moves by the DTZ reached after them: wins inside the fifty-move rule first (sooner is better), then
+    wins outside it, draws, losses saved by it and real losses (later is better)"""
+    if dtz == 0:
+        return 0
+    clock = 0 if zeroing else half_move_clock
+    if dtz > 0:
+        return 3000 - dtz if dtz + clock <= 100 else 1000 - dtz
+    return -3000 - dtz if -dtz + clock <= 100 else -1000 - dtz
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Looks up a position in Syzygy tablebases.")
+    parser.add_argument("directory", help="directory holding the .rtbw and .rtbz files")
+    parser.add_argument("fen", help="position to look up")
+    args = parser.parse_args(args)
+    board = Board()
+    board.load_fen(args.fen)
+    with Tablebase(args.directory) as tablebase:
+        wdl = tablebase.probe_wdl(board)
+        if wdl is None:
+            print("Position not in the tablebases")
+            return 1
+        print("WDL: %d" % wdl)
+        print("DTZ: %d" % tablebase.probe_dtz(board))
+        root = tablebase.probe_root(board)
+        if root is not None:
+            move, wdl, dtz = root
+            print("Best move: " + str(move[0]) + ("" if move[1] is None else move[1]))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
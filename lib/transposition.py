@@ -0,0 +1,116 @@
+"""A fixed-size transposition table for the engine, holding what is known about positions already searched.
+
+The table is one preallocated block of 64 bit words, two per entry: the position's Zobrist key XORed with the data
+word, and the data word itself. A lookup recomputes the key from both words, so an entry whose two words were written
+by different writers (as can happen when several processes share the table) just fails to match. The data word packs:
+    bits 0-15   best move (see encode_move), 0 for none
+    bits 16-23  depth searched
+    bits 24-25  bound type
+    bits 26-31  search generation, so entries from old searches can be replaced
+    bits 32-63  score, offset to be unsigned
+Entries are grouped in buckets of two: a depth-preferred slot that is only replaced by a deeper search (or one from a
+newer search), and a slot that is always replaced.
+"""
+from lib.board import *
+
+TT_EXACT = 1  # The score is exact
+TT_LOWER = 2  # The score is a lower bound (the search failed high)
+TT_UPPER = 3  # The score is an upper bound (the search failed low)
+
+TT_WORDS_PER_ENTRY = 2
+TT_ENTRIES_PER_BUCKET = 2
+TT_BUCKET_BYTES = 8 * TT_WORDS_PER_ENTRY * TT_ENTRIES_PER_BUCKET
+TT_SCORE_OFFSET = 1 << 31
+TT_FILL_SAMPLE = 1000  # Entries looked at to estimate how full the table is
+
+
+def table_buckets(size_mb):
+    """Returns the largest power of two number of buckets that fits in size_mb megabytes"""
+    buckets = max(size_mb * 1024 * 1024 // TT_BUCKET_BYTES, 1)
+    return 1 << (int(buckets).bit_length() - 1)
+
+
+class TranspositionTable:
+    """A transposition table taking up size_mb megabytes. buffer can be given to hold the table in memory allocated
+    elsewhere (such as shared memory); it must be table_buckets(size_mb) * TT_BUCKET_BYTES bytes"""
+    def __init__(self, size_mb=ENGINE_DEFAULT_HASH_MB, buffer=None):
+        self.buckets = table_buckets(size_mb)
+        if buffer is None:
+            buffer = bytearray(self.buckets * TT_BUCKET_BYTES)
+        self.memory = memoryview(buffer).cast("B")
+        self.words = self.memory.cast("Q")
+        self.mask = self.buckets - 1
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def clear(self):
+        self.memory[:] = bytes(len(self.memory))
+        self.generation = 0
+        self.reset_stats()
+
+    def release(self):
+        """Lets go of the table's buffer, which a shared memory block needs before it can be closed"""
+        self.words.release()
+        self.memory.release()
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def new_search(self):
+        """Moves on to the next search generation, so that entries from earlier searches are replaced first"""
+        self.generation = (self.generation + 1) & 63
+
+    def probe(self, key):
+        """Returns (best move, depth, score, bound) for a position key, or None if it isn't in the table. The best move
+        is a (start, end, pawn_promotion) tuple or None"""
+        self.probes += 1
+        words = self.words
+        index = (key & self.mask) * TT_WORDS_PER_ENTRY * TT_ENTRIES_PER_BUCKET
+        for slot in range(index, index + TT_WORDS_PER_ENTRY * TT_ENTRIES_PER_BUCKET, TT_WORDS_PER_ENTRY):
+            data = words[slot + 1]
+            if words[slot] ^ data == key and data:
+                self.hits += 1
+                move = data & 0xFFFF
+                return (decode_move(move) if move else None, data >> 16 & 0xFF, (data >> 32) - TT_SCORE_OFFSET,
+                        data >> 24 & 3)
+        return None
+
+    def store(self, key, depth, score, bound, move=None):
+        """Records the result of searching a position. The depth-preferred slot of the bucket is used if the position
+        is already there, if it's empty or from an older search, or if this search went at least as deep; otherwise
+        the always-replace slot is"""
+        self.stores += 1
+        words = self.words
+        index = (key & self.mask) * TT_WORDS_PER_ENTRY * TT_ENTRIES_PER_BUCKET
+        preferred_data = words[index + 1]
+        preferred_key = words[index] ^ preferred_data
+        slot = index + TT_WORDS_PER_ENTRY
+        if preferred_key == key or not preferred_data or preferred_data >> 26 & 63 != self.generation or \
+                depth >= preferred_data >> 16 & 0xFF:
+            slot = index
+        move_code = encode_move(move) if move is not None else 0
+        if not move_code and words[slot] ^ words[slot + 1] == key:
+            move_code = words[slot + 1] & 0xFFFF  # Keep the best move from an earlier search of this position
+        data = move_code | min(max(depth, 0), 255) << 16 | bound << 24 | self.generation << 26 | \
+            (score + TT_SCORE_OFFSET) << 32
+        words[slot] = key ^ data
+        words[slot + 1] = data
+
+    def hit_rate(self):
+        """The fraction of probes that found their position"""
+        return self.hits / self.probes if self.probes else 0.0
+
+    def fill(self):
+        """Roughly the fraction of entries in use by the current search, from a sample of the table"""
+        words = self.words
+        sample = min(TT_FILL_SAMPLE, len(words) // TT_WORDS_PER_ENTRY)
+        used = 0
+        for slot in range(0, sample * TT_WORDS_PER_ENTRY, TT_WORDS_PER_ENTRY):
+            data = words[slot + 1]
+            if data and data >> 26 & 63 == self.generation:
+                used += 1
+        return used / sample if sample else 0.0
@@ -0,0 +1,39 @@
+"""Runs slow work, such as the computer's search for a move, off the GUI thread. The GUI starts a BackgroundTask and
+polls it once a frame, so the window keeps redrawing and taking input while the work is done."""
+import queue
+import threading
+
+
+class BackgroundTask:
+    """Calls function(*args) in a daemon thread. Its return value (or the exception it raised) is put on a queue for
+    poll to pick up. on_cancel is called by cancel to make the function return early, e.g. Engine.stop"""
+    def __init__(self, function, args=(), on_cancel=None):
+        self.results = queue.Queue(maxsize=1)
+        self.onCancel = on_cancel
+        self.thread = threading.Thread(target=self.run, args=(function, args), daemon=True)
+        self.thread.start()
+
+    def run(self, function, args):
+        try:
+            self.results.put((function(*args), None))
+        except Exception as error:
+            self.results.put((None, error))
+
+    def poll(self):
+        """Returns (True, result) once the task has finished, or (False, None) while it's still running. An exception
+        raised by the task is raised again here"""
+        try:
+            result, error = self.results.get_nowait()
+        except queue.Empty:
+            return False, None
+        if error is not None:
+            raise error
+        return True, result
+
+    def cancel(self):
+        """Asks the task to stop and waits for its thread to finish. The request is repeated until it does, in case
+        the task hadn't got far enough to notice the first one"""
+        while self.thread.is_alive():
+            if self.onCancel is not None:
+                self.onCancel()
+            self.thread.join(0.05)
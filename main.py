@@ -9,5 +9,5 @@ if __name__ == '__main__':
     if data[2]:
         pygame.quit()
         sys.exit()
-    game.new_game(white=data[0], black=data[1])
+    game.new_game(white=data[0], black=data[1], white_player=data[3], black_player=data[4])
     display.run_game(game)
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""Checks Syzygy probing against known WDL and DTZ values from the KQvK, KRvK and KPvK tables in tests/data/syzygy.
+
+Run from the project folder, e.g.
+    python -m unittest discover tests
+"""
+import os
+import unittest
+from lib.tablebase import *
+
+TEST_TABLEBASE_LOCATION = os.path.join(os.path.dirname(__file__), "data", "syzygy")
+
+# (FEN, WDL, DTZ) for the side to move, as given by the reference Syzygy probing code
+KNOWN_POSITIONS = [
+    ("8/8/8/4k3/8/8/8/3QK3 w - - 0 1", WDL_WIN, 13),
+    ("8/8/8/4k3/8/8/8/3QK3 b - - 0 1", WDL_LOSS, -16),
+    ("k7/8/1Q6/8/8/8/8/4K3 b - - 0 1", WDL_DRAW, 0),  # Stalemate
+    ("8/8/8/8/8/2k5/1q6/K7 w - - 0 1", WDL_LOSS, -1),
+    ("8/8/8/4k3/8/8/8/R3K3 w - - 0 1", WDL_WIN, 27),
+    ("8/8/8/4k3/8/8/8/R3K3 b - - 0 1", WDL_LOSS, -28),
+    ("8/8/8/8/8/8/r7/1K4k1 w - - 0 1", WDL_DRAW, 0),  # The rook can be taken
+    ("7k/8/8/8/8/8/8/K5R1 b - - 0 1", WDL_LOSS, -18),
+    ("8/8/8/8/4k3/8/4P3/4K3 w - - 0 1", WDL_DRAW, 0),
+    ("8/8/8/8/4k3/8/4P3/4K3 b - - 0 1", WDL_DRAW, 0),
+    ("4k3/8/4K3/4P3/8/8/8/8 w - - 0 1", WDL_WIN, 3),
+    ("4k3/8/4K3/4P3/8/8/8/8 b - - 0 1", WDL_LOSS, -4),
+    ("8/8/8/8/8/8/6p1/k5K1 w - - 0 1", WDL_DRAW, 0),
+    ("8/3p4/8/8/8/8/8/K1k5 b - - 0 1", WDL_WIN, 1),
+    ("8/8/8/8/8/k7/p7/K7 w - - 0 1", WDL_DRAW, 0),
+]
+
+
+def load_board(fen):
+    board = Board()
+    board.load_fen(fen)
+    return board
+
+
+class TablebaseTest(unittest.TestCase):
+    def setUp(self):
+        self.tablebase = Tablebase(TEST_TABLEBASE_LOCATION)
+
+    def tearDown(self):
+        self.tablebase.close()
+
+    def test_wdl(self):
+        for fen, wdl, dtz in KNOWN_POSITIONS:
+            with self.subTest(fen=fen):
+                self.assertEqual(self.tablebase.probe_wdl(load_board(fen)), wdl)
+
+    def test_dtz(self):
+        for fen, wdl, dtz in KNOWN_POSITIONS:
+            with self.subTest(fen=fen):
+                self.assertEqual(self.tablebase.probe_dtz(load_board(fen)), dtz)
+
+    def test_probe_leaves_board_unchanged(self):
+        for fen, wdl, dtz in KNOWN_POSITIONS:
+            board = load_board(fen)
+            self.tablebase.probe_dtz(board)
+            self.tablebase.probe_root(board)
+            self.assertEqual(board.export_fen(), fen)
+            self.assertEqual(board.moveStack, [])
+
+    def test_missing_table(self):
+        board = load_board("8/8/8/4k3/8/8/8/2N1K3 w - - 0 1")  # KNvK isn't in the test tables
+        with self.assertRaises(MissingTablebaseTable):
+            self.tablebase.find_table(self.tablebase.wdlTables, board)
+        self.assertIsNone(self.tablebase.probe_wdl(board))
+        self.assertIsNone(self.tablebase.probe_dtz(board))
+        self.assertIsNone(self.tablebase.probe_root(board))
+
+    def test_missing_table_after_promotion(self):
+        # The DTZ probe tries each promotion, and KNvK and KBvK aren't in the test tables. The moves it tried are
+        # taken back
+        fen = "8/4P3/8/8/8/8/k7/4K3 w - - 0 1"
+        board = load_board(fen)
+        self.assertIsNone(self.tablebase.probe_dtz(board))
+        self.assertIsNone(self.tablebase.probe_root(board))
+        self.assertEqual(board.export_fen(), fen)
+        self.assertEqual(board.moveStack, [])
+
+    def test_not_covered(self):
+        self.assertIsNone(self.tablebase.probe_wdl(load_board("4k3/8/8/8/8/8/8/R3K3 w Q - 0 1")))  # Castling rights
+        self.assertIsNone(self.tablebase.probe_wdl(load_board("4k3/8/8/8/8/8/8/RR2K3 w - - 0 1")))  # Four pieces
+
+    def test_root_moves_win(self):
+        # KPvK isn't played out, as promoting would need the minor piece tables too
+        for fen in ("8/8/8/4k3/8/8/8/3QK3 w - - 0 1", "8/8/8/4k3/8/8/8/R3K3 w - - 0 1"):
+            with self.subTest(fen=fen):
+                board = load_board(fen)
+                plies = 0
+                while board.check_game_outcome() == IN_PROGRESS and plies < 100:
+                    move, wdl, dtz = self.tablebase.probe_root(board)
+                    board.push(*move)
+                    plies += 1
+                self.assertEqual(board.check_game_outcome(), WHITE_WIN)
+
+
+if __name__ == '__main__':
+    unittest.main()